@@ -48,10 +48,16 @@ import pandas as pd
 # In[2]:
 
 
-try:
-    data = pd.read_csv('/datasets/real_estate_data.csv', sep='\t')
-except:
-    data = pd.read_csv('https://code.s3.yandex.net/datasets/real_estate_data.csv', sep='\t')
+# Датасет загружается через бинарный кэш: при первом запуске файл разбирается и сохраняется
+# в колоночном формате, при следующих запусках кэш отображается в память.
+# Если локального файла нет, он скачивается с S3. С offline=True сеть не используется.
+# Трассировщик (включается переменной окружения REAL_ESTATE_TRACE=1) записывает время,
+# память и число строк на входе и выходе каждого этапа предобработки; сводка и JSON-трасса
+# выводятся в конце анализа.
+from real_estate.dataset import CACHE_DIR, DATA_PATH, DATA_URL, load_listings
+from real_estate.instrument import TRACER as tracer
+
+data = load_listings(DATA_PATH, DATA_URL, offline=False)
 
 
 # In[3]:
@@ -127,113 +133,26 @@ data = data.dropna(subset=['locality_name'])
 # In[13]:
 
 
-# Для того чтобы заполнить пропуски по ближайшему аэропорту, 
-# берем медианное значение расстояния до ближайшего аэропорта для каждого населенного пункта. 
-data['airports_nearest'] = data['airports_nearest'].fillna(data
-                                                           .groupby('locality_name')['airports_nearest']
-                                                           .transform('median'))
-# Как выясняется, во многих населенных пунктов нет ни одного значения до ближайшего аэропорта.
-
-
-# In[14]:
-
-
-# Воспользуемся медианным значением медиан расстояний до аэропортов, 
-# чтобы заполнить пропуски для населенных пунктов, где отсутствует какая либо информация.
-airports_nearest_median = data.groupby('locality_name')['airports_nearest'].median()
-medians_of_airports_nearest_median = airports_nearest_median.median()
-data['airports_nearest'] = data['airports_nearest'].fillna(medians_of_airports_nearest_median)
-
-
-# In[15]:
-
-
-# Для того чтобы заполнить пропуски до центра Санкт-Петербурга, 
-# берем медианное значение расстояния для каждого населенного пункта. 
-data['cityCenters_nearest'] = data['cityCenters_nearest'].fillna(data
-                                                                 .groupby('locality_name')['cityCenters_nearest']
-                                                                 .transform('median'))
-# Как выясняется, во многих населенных пунктов нет ни одного значения.
-
-
-# In[16]:
-
-
-# Воспользуемся медианным значением медиан расстояний до центра Санкт-Петербурга, 
-# чтобы заполнить пропуски для населенных пунктов, где отсутствует какая либо информация.
-cityCenters_nearest_median = data.groupby('locality_name')['cityCenters_nearest'].median()
-medians_of_cityCenters_nearest_median = cityCenters_nearest_median.median()
-data['cityCenters_nearest'] = data['cityCenters_nearest'].fillna(medians_of_cityCenters_nearest_median)
-
-
-# In[17]:
-
-
-# Для того чтобы заполнить пропуски есть ли парк на расстоянии до 3км или нет, 
-# берем медианное значение расстояния для каждого населенного пункта. 
-data['parks_around3000'] = data['parks_around3000'].fillna(data
-                                                    .groupby('locality_name')['parks_around3000']
-                                                    .transform('median'))
-# В датафрейме много сёл. Далеко не в каждом селе есть парки, 
-# да и не только в таких населенных пунктах, как сёла могут они отсутствовать, 
-# а уже тем более на расстоянии до 3км. 
-# По этому можем предположить, что пропущенные значения обозначают отсутствие парков поблизости. 
-# Заменим оставшиеся пропущенные значения на ноль
-
-
-# In[18]:
-
-
-data['parks_around3000'] = data['parks_around3000'].fillna(0)
-
-
-# In[19]:
-
-
-for t in data['locality_name'].unique():
-    data.loc[(data['locality_name'] == t) & 
-             (data['parks_nearest'].isna()) & 
-             (data['parks_around3000'] >= 1), 'parks_nearest'] = \
-    data.loc[(data['locality_name'] == t), 'parks_nearest'].median()
-
-
-# In[20]:
-
-
-# Для того чтобы заполнить пропуски есть ли пруд на расстоянии до 3км или нет, 
-# берем медианное значение расстояния для каждого населенного пункта. 
-data['ponds_around3000'] = data['ponds_around3000'].fillna(data
-                                                    .groupby('locality_name')['ponds_around3000']
-                                                    .transform('median'))
-# В датафрейме много сёл. Далеко не в каждом селе есть пруд, 
-# да и не только в таких населенных пунктах, как сёла могут они отсутствовать, 
-# а уже тем более на расстоянии до 3км. 
-# По этому можем предположить, что пропущенные значения обозначают отсутствие прудов поблизости. 
-# Заменим оставшиеся пропущенные значения на ноль
-
-
-# In[21]:
-
+# Пропуски в расстояниях до аэропорта, центра Санкт-Петербурга, парков и водоёмов
+# заполняем медианным значением для каждого населенного пункта.
+# Правила заполнения описаны в real_estate.imputation.LOCALITY_RULES:
+# - airports_nearest, cityCenters_nearest: во многих населенных пунктах нет ни одного значения,
+#   для них берем медианное значение медиан по населенным пунктам;
+# - parks_around3000, ponds_around3000: далеко не в каждом селе есть парки и пруды,
+#   а уже тем более на расстоянии до 3км, поэтому оставшиеся пропуски заменяем нулем;
+# - parks_nearest, ponds_nearest: заполняем только там, где парк или пруд есть в радиусе 3км.
+# Каждый столбец заполняется одним сгруппированным проходом по населенным пунктам.
+from real_estate.imputation import LOCALITY_RULES, fill_group_medians
 
-data['ponds_around3000'] = data['ponds_around3000'].fillna(0)
+data = fill_group_medians(data, LOCALITY_RULES)
 
 
-# In[22]:
+# In[14]:
 
 
 data['is_apartment'] = data['is_apartment'].fillna(False)
 
 
-# In[23]:
-
-
-for t in data['locality_name'].unique():
-    data.loc[(data['locality_name'] == t) & 
-             (data['ponds_nearest'].isna()) & 
-             (data['ponds_around3000'] >= 1), 'ponds_nearest'] = \
-    data.loc[(data['locality_name'] == t), 'ponds_nearest'].median()
-
-
 # Пропуски в данных могут возникать по разным причинам:
 # 
 # 1. Некоторые значения могут не быть доступны из-за ошибок ввода или технических проблем при сборе данных.
@@ -261,12 +180,14 @@ print('Неявные дубликаты до обработки:', data['locali
 # In[26]:
 
 
-locality_name_unique = ['коттеджный посёлок', 'посёлок городского типа', 
-                        'городской поселок', 'поселок городского типа', 
-                        'городской посёлок', 'посёлок при железнодорожной станции', 
-                        'посёлок при железнодорожной станции',  'посёлок']
+# Разные написания типов поселков ('посёлок', 'городской посёлок', 'посёлок городского типа' и т.д.)
+# приводим к слову 'поселок'. Замена выполняется только для уникальных названий,
+# а получившийся словарь сохраняется и используется повторно при оценке новых объявлений.
+from real_estate.locality import LocalityNormalizer
 
-data['locality_name'] = data['locality_name'].replace(locality_name_unique,'поселок',regex=True)
+locality_normalizer = LocalityNormalizer.load_or_create()
+data['locality_name'] = locality_normalizer.fit_transform(data['locality_name'])
+locality_normalizer.save()
 
 
 # In[27]:
@@ -294,50 +215,31 @@ data = data[data['airports_nearest'] != 0]
 # Еще нашел аномалию в расстояние до аэропорта. Удалил строку, содержащую расстояние до аэропорта - 0.
 # 
 
-# ### Посчитайте и добавьте в таблицу новые столбцы
-
-# In[30]:
-
-
-data['price_per_sqm'] = data['last_price'] / data['total_area']
-
-
-# In[31]:
-
-
-data['weekday'] = data['first_day_exposition'].dt.weekday
-
-
-# In[32]:
-
-
-data['month'] = data['first_day_exposition'].dt.month
-
-
-# In[33]:
-
+# In[29]:
 
-data['year'] = data['first_day_exposition'].dt.year
 
+# Повторные объявления: та же квартира (населенный пункт, этаж, этажность, площади),
+# выставленная заново с немного другой ценой или датой. Объявления сравниваются только
+# внутри блоков похожих квартир, поэтому поиск почти линеен по числу строк.
+from real_estate.duplicates import DuplicateDetector
 
-# In[34]:
+duplicate_detector = DuplicateDetector(normalizer=locality_normalizer)
+duplicate_clusters = duplicate_detector.clusters(data)
+print('Объявлений с повторами:', (duplicate_clusters >= 0).sum(),
+      'кластеров:', duplicate_clusters.max() + 1)
 
 
-def get_floor_type(row):
-    if row['floor'] == 1:
-        return 'первый'
-    elif row['floor'] == row['floors_total']:
-        return 'последний'
-    else:
-        return 'другой'
-    
-data['floor_type'] = data.apply(get_floor_type, axis=1)
+# ### Посчитайте и добавьте в таблицу новые столбцы
 
+# In[30]:
 
-# In[35]:
 
+# Добавляем цену квадратного метра, день недели, месяц и год публикации, тип этажа
+# (первый, последний, другой) и расстояние до центра в километрах.
+# Признаки считаются целыми столбцами, тип этажа хранится как категория.
+from real_estate.features import add_features
 
-data['city_centers_km'] = (data['cityCenters_nearest'] / 1000).round()
+data = add_features(data)
 
 
 # ### Проведите исследовательский анализ данных
@@ -345,125 +247,34 @@ data['city_centers_km'] = (data['cityCenters_nearest'] / 1000).round()
 # In[36]:
 
 
-data_filtered = data
-
-
-# In[37]:
-
-
-# Избавляемся от выбросов в total_area.
-print('Количество строк до обработки выбросов:', len(data['total_area']))
-# Сохраним в переменной t количество строк до обработки выбросов.
-t = len(data['total_area'])
-data_filtered = data_filtered[data_filtered['total_area'] < 200]
-print('Количество строк после обработки выбросов:', len(data_filtered['total_area']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['total_area']) / len(data['total_area']))
-data = data[data['total_area'] < 200]
-
-
-# In[38]:
-
-
-# Избавляемся от выбросов в living_area.
-print('Количество строк до обработки выбросов:', len(data['living_area']))
-data_filtered = data_filtered[data_filtered['living_area'] < 150]
-print('Количество строк после обработки выбросов:', len(data_filtered['living_area']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['living_area']) / len(data['living_area']))
-data = data[data['living_area'] < 150]
-
+# Избавляемся от выбросов в total_area, living_area, kitchen_area, last_price, rooms, ceiling_height,
+# floor, floors_total, airports_nearest и parks_nearest.
+# Границы заданы таблицей правил real_estate.filters.OUTLIER_RULES; для отдельного региона
+# их можно загрузить из JSON (load_rules) или переопределить (override_rules).
+# Все правила проверяются за один проход, а отчет показывает, сколько строк отбросило каждое правило.
+# Число строк до и после фильтрации записывает трассировщик.
+from real_estate.filters import OUTLIER_RULES, apply_filters
 
-# In[39]:
+data, outliers_report = apply_filters(data, OUTLIER_RULES)
+print(outliers_report.to_frame())
 
 
-# Избавляемся от выбросов в kitchen_area.
-print('Количество строк до обработки выбросов:', len(data['kitchen_area']))
-data_filtered = data_filtered[data_filtered['kitchen_area'] < 50]
-print('Количество строк после обработки выбросов:', len(data_filtered['kitchen_area']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['kitchen_area']) / len(data['kitchen_area']))
-data = data[data['kitchen_area'] < 50]
-
-
-# In[40]:
-
-
-# Избавляемся от выбросов в last_price.
-print('Количество строк до обработки выбросов:', len(data['last_price']))
-data_filtered = data_filtered[data_filtered['last_price'] < 40000000]
-print('Количество строк после обработки выбросов:', len(data_filtered['last_price']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['last_price']) / len(data['last_price']))
-data = data[data['last_price'] < 40000000]
-
-
-# In[41]:
-
-
-# Избавляемся от выбросов в rooms.
-print('Количество строк до обработки выбросов:', len(data['rooms']))
-data_filtered = data_filtered[data_filtered['rooms'] < 6]
-print('Количество строк после обработки выбросов:', len(data_filtered['rooms']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['rooms']) / len(data['rooms']))
-data = data[data['rooms'] < 6]
-
-
-# In[42]:
-
-
-# Избавляемся от выбросов в ceiling_height.
-print('Количество строк до обработки выбросов:', len(data['ceiling_height']))
-data_filtered = data_filtered[data_filtered['ceiling_height'] < 5]
-print('Количество строк после обработки выбросов:', len(data_filtered['ceiling_height']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['ceiling_height']) / len(data['ceiling_height']))
-data = data[data['ceiling_height'] < 5]
-
-
-# In[43]:
-
-
-# Избавляемся от выбросов в floor.
-print('Количество строк до обработки выбросов:', len(data['floor']))
-data_filtered = data_filtered[data_filtered['floor'] < 25]
-print('Количество строк после обработки выбросов:', len(data_filtered['floor']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['floor']) / len(data['floor']))
-data = data[data['floor'] < 25]
-
-
-# In[44]:
-
-
-# Избавляемся от выбросов в floors_total.
-print('Количество строк до обработки выбросов:', len(data['floors_total']))
-data_filtered = data_filtered[data_filtered['floors_total'] < 30]
-print('Количество строк после обработки выбросов:', len(data_filtered['floors_total']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['floors_total']) / len(data['floors_total']))
-data = data[data['floors_total'] < 30]
-
-
-# In[45]:
-
-
-# Избавляемся от выбросов в airports_nearest.
-print('Количество строк до обработки выбросов:', len(data['airports_nearest']))
-data_filtered = data_filtered[data_filtered['airports_nearest'] < 70000]
-print('Количество строк после обработки выбросов:', len(data_filtered['airports_nearest']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['airports_nearest']) / len(data['airports_nearest']))
-data = data[data['airports_nearest'] < 70000]
-
+# In[47]:
 
-# In[46]:
 
+print('Процент обработанных выбросов составил:', outliers_report.dropped_share)
 
-# Избавляемся от выбросов в parks_nearest.
-print('Количество строк до обработки выбросов:', len(data['parks_nearest']))
-data_filtered = data_filtered[(data_filtered['parks_nearest'] < 1500) | (data_filtered['parks_nearest'].isna())]
-print('Количество строк после обработки выбросов:', len(data_filtered['parks_nearest']))
-print('Процент обработанных выбросов:', 1 - len(data_filtered['parks_nearest']) / len(data['parks_nearest']))
-data = data[(data['parks_nearest'] < 1500) | (data['parks_nearest'].isna())]
 
+# In[48]:
 
-# In[47]:
 
+# Приводим столбцы к наименьшим подходящим типам: целочисленные счетчики -- к int16/int32,
+# площади и расстояния -- к float32, населенные пункты и тип этажа -- к категориям,
+# is_apartment -- к логическому типу. Перед приведением проверяется, что значения помещаются в тип.
+from real_estate.schema import optimize_dtypes
 
-print('Процент обработанных выбросов составил:', 1 - len(data['parks_nearest']) / t)
+data, schema_report = optimize_dtypes(data)
+print(schema_report.summary())
 
 
 # In[48]:
@@ -620,6 +431,16 @@ print('Коэффициент корреляции между количеств
 
 # Видна сильная зависимость цены от количества комнат.
 
+# Корреляции выше посчитаны по средним ценам групп. Посчитаем их по самим объявлениям для всех числовых признаков сразу, с бутстрэп-интервалами.
+
+# In[67]:
+
+
+from real_estate.correlation import bootstrap_intervals
+
+price_correlations = bootstrap_intervals(data, resamples=100, seed=12345, workers=1)
+price_correlations.pivot_table(index='feature', columns=['target', 'method'], values=['r', 'low', 'high']).sort_values(('r', 'last_price', 'spearman'), ascending=False)
+
 # In[68]:
 
 
@@ -687,6 +508,87 @@ spb_data_pivot.plot(x='city_centers_km', y='mean_price_per_km')
 
 # Зависимость цены на квартиру от расстояния до центра Санкт-Петербурга сильно коррелирует в том случае, если до центра 10 км. Стоимость квартиры, находящиеся от центра на расстояние 10 км и далее не так сильно зависит от этого фактора.
 
+# ### Построение модели
+
+# In[74]:
+
+
+# Обучаем гребневую регрессию логарифма цены квадратного метра на очищенных данных:
+# площади, комнаты, этажность и тип этажа, высота потолков, расстояния, парки и водоёмы,
+# населенный пункт, год и месяц публикации. Пятую часть объявлений откладываем для проверки.
+from real_estate.model import PriceModel, split_train_test
+
+data_train, data_test = split_train_test(data)
+price_model = PriceModel().fit(data_train)
+print('Качество на обучающей выборке:', price_model.score(data_train))
+print('Качество на тестовой выборке:', price_model.score(data_test))
+
+
+# In[75]:
+
+
+# Значимость параметров: на сколько растет MAPE на тестовой выборке, если перемешать признак
+# или группу признаков (все расстояния, все площади). Результат кэшируется по хэшу данных.
+from real_estate.importance import permutation_importance
+
+permutation_importance(data, workers=1)
+
+
+# In[75]:
+
+
+# Сохраняем модель, обученную на всех очищенных данных: предсказание для пакета объявлений
+# сводится к нескольким матричным операциям (price_model.predict(frame)).
+price_model = PriceModel().fit(data)
+price_model.save()
+
+
+# In[75]:
+
+
+# Цена квадратного метра в Санкт-Петербурге и в поселках области устроена по-разному, поэтому
+# сравним общую модель с моделями по населенным пунктам (небольшие пункты оцениваются общей).
+from real_estate.sharding import ShardedPriceModel
+
+# Пул процессов нельзя запускать из кода верхнего уровня (в Windows и macOS дочерние процессы
+# заново выполняют скрипт), поэтому шарды обучаются в этом процессе.
+sharded_model = ShardedPriceModel(workers=1).fit(data_train)
+print('Модели по населенным пунктам, тестовая выборка:', sharded_model.score(data_test))
+sharded_model.save()
+
+
+# ### Подозрительные объявления
+
+# In[76]:
+
+
+# Сравниваем цену квадратного метра каждого объявления с медианой похожих квартир
+# (населенный пункт, комнаты, тип этажа) и квартир на том же расстоянии от центра.
+# Робастная z-оценка выше 3.5 по модулю -- повод проверить объявление.
+from real_estate.anomaly import AnomalyDetector
+
+anomaly_detector = AnomalyDetector().fit(data)
+anomaly_detector.save()
+suspicious = anomaly_detector.suspicious(data, top=10)
+print('Подозрительных объявлений:', len(anomaly_detector.suspicious(data)))
+suspicious[['locality_name', 'rooms', 'total_area', 'last_price', 'price_per_sqm',
+            'z_similar', 'z_distance', 'anomaly_score']]
+
+
+# ### Замеры этапов
+
+# In[77]:
+
+
+# Время, CPU, изменение и пик RSS, строки на входе и выходе по каждому этапу предобработки.
+# trace.json сохраняется в каталог кэша и открывается в chrome://tracing или Perfetto.
+import os
+
+if tracer.enabled:
+    tracer.save(os.path.join(CACHE_DIR, 'trace.json'))
+    print(tracer.summary())
+
+
 # ### Общий вывод
 
 # Задача: Поиска интересных особенностей и зависимостей, которые существуют на рынке недвижимости в Санкт-Петербурге и соседних населенных пунктов.
@@ -0,0 +1,75 @@
+"""Сравнение построчного apply(get_floor_type) и add_features на больших данных.
+
+Запуск::
+
+    python benchmarks/bench_features.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from real_estate.features import add_features, get_floor_type  # noqa: E402
+
+
+def make_listings(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    floors_total = rng.integers(1, 30, rows).astype('float64')
+    floors_total[rng.random(rows) < 0.004] = np.nan
+    floor = np.minimum(rng.integers(1, 30, rows), np.nan_to_num(floors_total, nan=30)).astype('int64')
+    total_area = rng.lognormal(4, 0.4, rows).round(1)
+    return pd.DataFrame({
+        'last_price': (total_area * rng.lognormal(11.5, 0.3, rows)).round(-3),
+        'total_area': total_area,
+        'first_day_exposition': (pd.Timestamp('2014-11-27')
+                                 + pd.to_timedelta(rng.integers(0, 1600, rows), unit='D')),
+        'floor': floor,
+        'floors_total': floors_total,
+        'cityCenters_nearest': rng.normal(14000, 8000, rows).clip(200),
+    })
+
+
+def add_features_apply(data):
+    """Признаки так, как их считал исходный анализ."""
+    data = data.copy()
+    data['price_per_sqm'] = data['last_price'] / data['total_area']
+    data['weekday'] = data['first_day_exposition'].dt.weekday
+    data['month'] = data['first_day_exposition'].dt.month
+    data['year'] = data['first_day_exposition'].dt.year
+    data['floor_type'] = data.apply(get_floor_type, axis=1)
+    data['city_centers_km'] = (data['cityCenters_nearest'] / 1000).round()
+    return data
+
+
+def timed(func, data):
+    start = time.perf_counter()
+    result = func(data)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    data = make_listings(args.rows)
+    expected, apply_time = timed(add_features_apply, data)
+    result, vector_time = timed(add_features, data)
+    assert (result['floor_type'].astype(str) == expected['floor_type']).all()
+
+    print(f'Строк: {args.rows}')
+    print(f'apply(get_floor_type): {apply_time:.3f} с')
+    print(f'add_features:          {vector_time:.3f} с')
+    print(f'Ускорение:             {apply_time / vector_time:.0f}x')
+    print(f'Память floor_type: {expected["floor_type"].memory_usage(deep=True) / 1e6:.1f} МБ -> '
+          f'{result["floor_type"].memory_usage(deep=True) / 1e6:.1f} МБ')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Масштабирование параллельной предобработки (real_estate.parallel) по числу процессов.
+
+Датасет повторяется ``--repeat`` раз, чтобы получить объем, на котором
+накладные расходы пула малы по сравнению с работой.
+
+Запуск::
+
+    python benchmarks/bench_parallel.py --data /datasets/real_estate_data.csv --repeat 50
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from real_estate.cleaning import clean  # noqa: E402
+from real_estate.dataset import DATA_PATH, load_listings  # noqa: E402
+from real_estate.parallel import parallel_clean  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1}))
+    parser.add_argument('--tmp-dir', help='каталог для буферов, например /dev/shm')
+    args = parser.parse_args()
+
+    raw = load_listings(args.data, offline=True)
+    raw = pd.concat([raw] * args.repeat, ignore_index=True)
+    print(f'Строк: {len(raw)}, ядер: {os.cpu_count()}')
+
+    start = time.perf_counter()
+    expected = clean(raw)
+    single = time.perf_counter() - start
+    print(f'clean:                 {single:7.2f} с')
+    for workers in args.workers:
+        start = time.perf_counter()
+        data, _ = parallel_clean(raw, workers=workers, tmp_dir=args.tmp_dir)
+        elapsed = time.perf_counter() - start
+        pd.testing.assert_frame_equal(data, expected, check_dtype=False)
+        print(f'parallel_clean x{workers:<3}     {elapsed:7.2f} с  ускорение {single / elapsed:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Нагрузочный тест сервиса оценки (real_estate.service).
+
+Открывает ``--concurrency`` keep-alive соединений, отправляет по ним
+``--requests`` запросов оценки одного объявления и печатает задержки и
+пропускную способность со стороны клиента и статистику сервиса.
+
+Запуск против уже работающего сервиса::
+
+    python benchmarks/load_service.py --port 8080
+
+или с запуском сервиса в отдельном процессе::
+
+    python benchmarks/load_service.py --spawn --data /datasets/real_estate_data.csv
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOCALITIES = ('Санкт-Петербург', 'посёлок Мурино', 'посёлок Шушары', 'Всеволожск',
+              'Пушкин', 'Колпино', 'Гатчина', 'деревня Кудрово', 'Выборг', 'Красное Село')
+
+
+def make_listing(rng):
+    rooms = rng.randint(1, 4)
+    listing = {
+        'locality_name': rng.choice(LOCALITIES),
+        'total_area': round(rng.uniform(25, 40) + 15 * rooms, 1),
+        'rooms': rooms,
+        'floor': rng.randint(1, 9),
+        'floors_total': 9,
+        'last_price': rng.randint(3, 15) * 1000000,
+    }
+    if rng.random() < 0.5:
+        listing['cityCenters_nearest'] = rng.randint(1000, 30000)
+    return listing
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n'
+                 f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+                 .encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def worker(host, port, count, seed, latencies):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(count):
+        started = time.perf_counter()
+        status, _ = await request(reader, writer, 'POST', '/valuate', make_listing(rng))
+        if status != 200:
+            raise RuntimeError(f'Сервис ответил {status}')
+        latencies.append(time.perf_counter() - started)
+    writer.close()
+
+
+async def wait_ready(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(0.2)
+            continue
+        await request(reader, writer, 'GET', '/health')
+        writer.close()
+        return
+    raise TimeoutError('Сервис не запустился')
+
+
+async def run(args):
+    await wait_ready(args.host, args.port, args.startup_timeout)
+    latencies = []
+    per_worker = args.requests // args.concurrency
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(args.host, args.port, per_worker, seed, latencies)
+                           for seed in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    print(f'Запросов: {len(latencies)}, соединений: {args.concurrency}')
+    print(f'Клиент: p50 {np.percentile(latencies, 50):.2f} мс, p99 {np.percentile(latencies, 99):.2f} мс, '
+          f'{len(latencies) / elapsed:.0f} запросов/с')
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, stats = await request(reader, writer, 'GET', '/stats')
+    writer.close()
+    print('Сервис:', json.dumps(stats, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест сервиса оценки')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--spawn', action='store_true', help='запустить сервис в отдельном процессе')
+    parser.add_argument('--data', help='TSV с объявлениями для запускаемого сервиса')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    service = None
+    if args.spawn:
+        command = [sys.executable, '-m', 'real_estate.service', '--port', str(args.port)]
+        if args.data:
+            command += ['--data', args.data]
+        service = subprocess.Popen(command, cwd=ROOT)
+    try:
+        asyncio.run(run(args))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Время и память каждого этапа анализа на синтетических данных разного объема.
+
+Для каждого размера генерируется (или берется из ``--data-dir``) файл
+синтетических объявлений, затем по очереди замеряются этапы: загрузка,
+заполнение пропусков, нормализация названий, исправление аномалий,
+признаки, фильтрация выбросов, сводные таблицы, куб, обучение и
+предсказание модели. Время -- лучшее из ``--repeat`` запусков; память --
+пик выделений (tracemalloc) в отдельном запуске и максимальный RSS
+процесса после этапа.
+
+Результаты пишутся в JSON; ``--compare`` сравнивает их с предыдущим
+файлом и помечает этапы, ставшие медленнее в ``--threshold`` раз.
+
+Запуск::
+
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 --output bench.json
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from real_estate.cleaning import fill_missing, fix_anomalies, global_medians  # noqa: E402
+from real_estate.cube import PriceCube  # noqa: E402
+from real_estate.dataset import parse_listings  # noqa: E402
+from real_estate.features import add_features  # noqa: E402
+from real_estate.filters import apply_filters  # noqa: E402
+from real_estate.imputation import LOCALITY_RULES, GroupMedianImputer  # noqa: E402
+from real_estate.locality import normalize_locality_names  # noqa: E402
+from real_estate.model import PriceModel, split_train_test  # noqa: E402
+from real_estate.stages import package_digest  # noqa: E402
+from real_estate.synthetic import load_profile, write_listings  # noqa: E402
+
+
+def imputation(raw):
+    medians = global_medians(raw)
+    imputer = GroupMedianImputer(LOCALITY_RULES).fit(raw.dropna(subset=['locality_name']))
+    return fill_missing(raw, medians, imputer)
+
+
+def aggregation(data):
+    """Сводные таблицы исследовательского анализа."""
+    tables = [data.pivot_table(index=column, values='last_price', observed=True)
+              for column in ('total_area', 'living_area', 'kitchen_area', 'rooms')]
+    tables.append(data.pivot_table(index='locality_name', values='price_per_sqm',
+                                   aggfunc=['mean', 'count'], observed=True))
+    spb = data[data['locality_name'] == 'Санкт-Петербург']
+    tables.append(spb.pivot_table(index='city_centers_km', values='last_price', aggfunc='mean'))
+    return tables
+
+
+def model_fit(data):
+    train, test = split_train_test(data)
+    return PriceModel().fit(train), test
+
+
+def model_predict(fitted):
+    model, test = fitted
+    return model.predict(test)
+
+
+# Этапы: имя, функция и имя этапа, результат которого она получает.
+STAGES = (
+    ('load', parse_listings, 'path'),
+    ('imputation', imputation, 'load'),
+    ('locality', normalize_locality_names, 'imputation'),
+    ('anomalies', fix_anomalies, 'locality'),
+    ('features', add_features, 'anomalies'),
+    ('filtering', lambda data: apply_filters(data)[0], 'features'),
+    ('aggregation', aggregation, 'filtering'),
+    ('cube', PriceCube.build, 'filtering'),
+    ('model_fit', model_fit, 'filtering'),
+    ('model_predict', model_predict, 'model_fit'),
+)
+
+
+def max_rss():
+    """Максимальный RSS процесса в байтах."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def measure(func, argument, repeat, memory):
+    times, cpu = [], []
+    for _ in range(repeat):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        result = func(argument)
+        times.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - start_cpu)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {'seconds': min(times), 'cpu_seconds': min(cpu), 'peak_bytes': peak,
+                    'max_rss_bytes': max_rss()}
+
+
+def run_size(path, rows, repeat, memory):
+    results = {'path': path}
+    records = []
+    for name, func, source in STAGES:
+        argument = results[source]
+        results[name], record = measure(func, argument, repeat, memory)
+        size = len(argument) if hasattr(argument, '__len__') and not isinstance(argument, str) else rows
+        record.update(rows=rows, stage=name, input_rows=size,
+                      rows_per_second=size / record['seconds'] if record['seconds'] else None)
+        records.append(record)
+        print(f'{rows:>10} {name:<14} {record["seconds"]:9.3f} с'
+              + (f' {record["peak_bytes"] / 2**20:9.1f} МБ' if memory else ''))
+    return records
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current, threshold):
+    """Таблица отношений времени этапов; возвращает число регрессий."""
+    old = {(r['rows'], r['stage']): r for r in previous['results']}
+    regressions = 0
+    print(f'\nСравнение с {previous["meta"].get("revision") or "предыдущим запуском"}:')
+    for record in current['results']:
+        before = old.get((record['rows'], record['stage']))
+        if not before:
+            continue
+        ratio = record['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        slower = ratio > threshold
+        regressions += slower
+        print(f'{record["rows"]:>10} {record["stage"]:<14} {before["seconds"]:9.3f} -> '
+              f'{record["seconds"]:9.3f} с  x{ratio:5.2f}' + ('  РЕГРЕССИЯ' if slower else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--profile', help='JSON профиля или настоящий файл объявлений')
+    parser.add_argument('--data-dir', help='каталог для сгенерированных файлов (переиспользуются)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='не замерять пик памяти')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='JSON предыдущего запуска')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    profile = load_profile(args.profile)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='real_estate-bench-')
+    os.makedirs(data_dir, exist_ok=True)
+    report = {
+        'meta': {'revision': revision(), 'package_digest': package_digest(),
+                 'python': platform.python_version(), 'pandas': pd.__version__,
+                 'numpy': np.__version__, 'cpu_count': os.cpu_count(),
+                 'platform': platform.platform(), 'seed': args.seed, 'repeat': args.repeat,
+                 'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': [],
+    }
+    for rows in args.sizes:
+        path = os.path.join(data_dir, f'synthetic-{rows}-{args.seed}.csv')
+        if not os.path.exists(path):
+            write_listings(path, rows, profile, args.seed)
+        report['results'] += run_size(path, rows, args.repeat, not args.no_memory)
+
+    if not args.data_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    tmp = f'{args.output}.tmp-{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, args.output)
+    print(f'Результаты: {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        if compare(previous, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Время запуска командной строки: импорт пакета и ``--help`` команд.
+
+Каждая команда запускается отдельным процессом ``--repeat`` раз; выводится
+лучшее и медианное время. Если медиана хотя бы одной команды больше
+``--limit`` мс, скрипт завершается с кодом 1. Дополнительно проверяется,
+что после импорта ``real_estate.cli`` не загружены pandas, numpy и
+matplotlib.
+
+Запуск::
+
+    python benchmarks/startup.py --repeat 20 --limit 100
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = (
+    ('import real_estate', ['-c', 'import real_estate']),
+    ('import real_estate.cli', ['-c', 'import real_estate.cli']),
+    ('--help', ['-m', 'real_estate', '--help']),
+    ('clean --help', ['-m', 'real_estate', 'clean', '--help']),
+    ('score --help', ['-m', 'real_estate', 'score', '--help']),
+)
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib')
+CHECK_IMPORTS = ('import sys, real_estate.cli; '
+                 f'print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))')
+
+
+def run(arguments):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + arguments, env=env, cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--limit', type=float, default=100.0, help='предел медианы, мс')
+    args = parser.parse_args()
+
+    baseline = statistics.median(run(['-c', 'pass']) for _ in range(args.repeat))
+    print(f'{"python -c pass":<26}{baseline * 1000:9.1f} мс')
+    failed = False
+    for name, arguments in COMMANDS:
+        times = [run(arguments) for _ in range(args.repeat)]
+        median = statistics.median(times)
+        slow = median * 1000 > args.limit
+        failed |= slow
+        print(f'{name:<26}{min(times) * 1000:9.1f} мс (медиана {median * 1000:.1f})'
+              + ('  МЕДЛЕННО' if slow else ''))
+
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    loaded = subprocess.run([sys.executable, '-c', CHECK_IMPORTS], env=env, cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    if loaded:
+        failed = True
+        print(f'После импорта real_estate.cli загружены: {loaded}')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Анализ и прогнозирование рыночной стоимости недвижимости в Санкт-Петербурге и ЛО."""
@@ -0,0 +1,4 @@
+from real_estate.cli import main
+
+
+main()
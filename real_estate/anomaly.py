@@ -0,0 +1,215 @@
+"""Поиск аномальных и подозрительных объявлений.
+
+Для каждой группы объявлений заранее считаются медиана и MAD логарифма
+цены квадратного метра:
+
+- группа «населенный пункт × комнаты × тип этажа» -- цена относительно
+  похожих квартир;
+- группа «населенный пункт × city_centers_km» -- цена относительно
+  квартир на том же расстоянии от центра.
+
+Если в группе меньше ``min_rows`` объявлений, используются статистики
+населенного пункта, а если и их нет -- общие. Статистики небольших групп
+дополнительно сдвигаются к статистикам населенного пункта. Ключи групп
+кодируются целыми числами и хранятся в хэш-индексе, поэтому поиск статистик
+для объявления -- O(1), а весь пакет оценивается одним векторным проходом.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import CACHE_DIR
+from real_estate.features import FLOOR_TYPES, floor_type
+
+
+# Коэффициент, приводящий MAD к стандартному отклонению нормального распределения.
+MAD_SCALE = 1.4826
+
+ANOMALY_PATH = os.path.join(CACHE_DIR, 'anomaly_detector.npz')
+
+
+def _median_mad(values, keys):
+    """Медиана, MAD и число значений по ключам."""
+    values = pd.Series(values)
+    grouped = values.groupby(keys)
+    medians = grouped.median()
+    deviations = (values - medians.reindex(keys).to_numpy()).abs()
+    return pd.DataFrame({'median': medians,
+                         'mad': deviations.groupby(keys).median(),
+                         'count': grouped.size()})
+
+
+class GroupStatistics:
+    """Медиана и MAD по целочисленным ключам с хэш-индексом."""
+
+    def __init__(self, keys, median, mad, count):
+        self.index = pd.Index(np.asarray(keys, dtype='int64'))
+        self.median = np.asarray(median, dtype='float64')
+        # Нулевой MAD (все цены в группе одинаковы) заменяется малым числом.
+        self.mad = np.maximum(np.asarray(mad, dtype='float64'), 1e-3)
+        self.count = np.asarray(count, dtype='int64')
+
+    def shrink(self, parent, median, mad, weight, per_group=False):
+        """Сдвигает медиану и MAD к родительской группе с весом ``weight / (count + weight)``.
+
+        Так малочисленные группы со случайно узким разбросом цен не дают
+        завышенных оценок.
+        """
+        if not per_group:
+            median, mad = median[parent], mad[parent]
+        share = weight / (self.count + weight)
+        self.median = (1 - share) * self.median + share * median
+        self.mad = (1 - share) * self.mad + share * mad
+
+    @classmethod
+    def fit(cls, values, keys, min_rows):
+        stats = _median_mad(values, keys)
+        stats = stats[stats['count'] >= min_rows]
+        return cls(stats.index, stats['median'], stats['mad'], stats['count'])
+
+    def lookup(self, keys):
+        """Позиции ключей в таблице; отсутствующие ключи -- -1."""
+        return self.index.get_indexer(np.asarray(keys, dtype='int64'))
+
+    def take(self, positions, fallback_median, fallback_mad):
+        """Медиана и MAD по позициям из ``lookup``; для -1 -- запасные значения.
+
+        Возвращает (медиана, MAD, найден ли ключ). Таблица индексируется только
+        найденными позициями: в пустой таблице позиция -1 не существует.
+        """
+        found = positions >= 0
+        median = np.array(np.broadcast_to(fallback_median, positions.shape), dtype='float64')
+        mad = np.array(np.broadcast_to(fallback_mad, positions.shape), dtype='float64')
+        median[found] = self.median[positions[found]]
+        mad[found] = self.mad[positions[found]]
+        return median, mad, found
+
+
+class AnomalyDetector:
+    """Робастные отклонения цены объявления от цен похожих объявлений."""
+
+    def __init__(self, min_rows=5, max_rooms=10, max_km=100, shrinkage=10):
+        self.min_rows = min_rows
+        self.shrinkage = shrinkage
+        self.max_rooms = max_rooms
+        self.max_km = max_km
+
+    # Ключи групп ---------------------------------------------------------
+
+    def _locality_codes(self, frame):
+        names = pd.Series(frame['locality_name']).astype(str)
+        return pd.Index(self.localities).get_indexer(names)
+
+    def _keys(self, frame):
+        locality = self._locality_codes(frame)
+        rooms = np.clip(np.nan_to_num(frame['rooms'].to_numpy(dtype='float64'), nan=1),
+                        0, self.max_rooms).astype('int64')
+        if 'floor_type' in frame:
+            floor = pd.Categorical(frame['floor_type'], categories=FLOOR_TYPES).codes
+        else:
+            floor = floor_type(frame['floor'], frame['floors_total']).codes
+        km = frame['city_centers_km'].to_numpy(dtype='float64')
+        km_known = ~np.isnan(km)
+        km = np.clip(np.nan_to_num(km), 0, self.max_km).astype('int64')
+        similar = (locality * (self.max_rooms + 1) + rooms) * len(FLOOR_TYPES) + floor
+        distance = np.where(km_known, locality * (self.max_km + 1) + km, -1)
+        # Для неизвестного населенного пункта ключи групп заведомо не найдутся.
+        similar = np.where(locality >= 0, similar, -1)
+        distance = np.where(locality >= 0, distance, -1)
+        return locality, similar, distance
+
+    # Обучение ------------------------------------------------------------
+
+    def fit(self, data):
+        """Считает статистики по очищенным данным с добавленными признаками."""
+        self.localities = sorted(data['locality_name'].astype(str).unique())
+        values = np.log(data['price_per_sqm'].to_numpy(dtype='float64'))
+        locality, similar, distance = self._keys(data)
+        overall = _median_mad(values, np.zeros(len(values), dtype='int64'))
+        self.overall_median = float(overall['median'].iloc[0])
+        self.overall_mad = max(float(overall['mad'].iloc[0]), 1e-3)
+        self.locality = GroupStatistics.fit(values, locality, self.min_rows)
+        self.locality.shrink(np.zeros(len(self.locality.count), dtype='int64'),
+                             np.array([self.overall_median]), np.array([self.overall_mad]),
+                             self.shrinkage)
+        self.similar = GroupStatistics.fit(values, similar, self.min_rows)
+        self._shrink_to_locality(self.similar, (self.max_rooms + 1) * len(FLOOR_TYPES))
+        known = distance >= 0
+        self.distance = GroupStatistics.fit(values[known], distance[known], self.min_rows)
+        self._shrink_to_locality(self.distance, self.max_km + 1)
+        return self
+
+    def _shrink_to_locality(self, stats, keys_per_locality):
+        parent = self.locality.lookup(stats.index.to_numpy() // keys_per_locality)
+        median, mad, _ = self.locality.take(parent, self.overall_median, self.overall_mad)
+        stats.shrink(parent, median, mad, self.shrinkage, per_group=True)
+
+    # Оценка --------------------------------------------------------------
+
+    def _robust_z(self, values, stats, keys, fallback_median, fallback_mad):
+        median, mad, found = stats.take(stats.lookup(keys), fallback_median, fallback_mad)
+        return (values - median) / (MAD_SCALE * mad), found
+
+    def score(self, frame):
+        """Робастные z-оценки цены для пакета объявлений.
+
+        ``z_similar`` -- отклонение от похожих квартир, ``z_distance`` -- от квартир
+        на том же расстоянии от центра, ``anomaly_score`` -- наибольшее по модулю.
+        Отрицательные значения -- объявление дешевле обычного.
+        """
+        values = np.log(frame['price_per_sqm'].to_numpy(dtype='float64'))
+        locality, similar, distance = self._keys(frame)
+        locality_median, locality_mad, found = self.locality.take(
+            self.locality.lookup(locality), self.overall_median, self.overall_mad)
+        z_similar, similar_found = self._robust_z(values, self.similar, similar,
+                                                  locality_median, locality_mad)
+        z_distance, distance_found = self._robust_z(values, self.distance, distance,
+                                                    locality_median, locality_mad)
+        anomaly = np.maximum(np.abs(z_similar), np.abs(z_distance))
+        return pd.DataFrame({
+            'z_similar': z_similar,
+            'z_distance': z_distance,
+            'anomaly_score': anomaly,
+            'baseline': np.where(similar_found, 'группа',
+                                 np.where(found, 'населенный пункт', 'общая')),
+        }, index=frame.index)
+
+    def suspicious(self, frame, threshold=3.5, top=None):
+        """Объявления с anomaly_score выше порога, по убыванию подозрительности."""
+        scores = self.score(frame)
+        flagged = scores[scores['anomaly_score'] > threshold]
+        flagged = flagged.sort_values('anomaly_score', ascending=False, kind='stable')
+        if top is not None:
+            flagged = flagged.head(top)
+        return frame.loc[flagged.index].join(flagged)
+
+    # Сохранение ----------------------------------------------------------
+
+    def save(self, path=ANOMALY_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        arrays = {}
+        for name in ('similar', 'distance', 'locality'):
+            stats = getattr(self, name)
+            arrays.update({f'{name}_keys': stats.index.to_numpy(), f'{name}_median': stats.median,
+                           f'{name}_mad': stats.mad, f'{name}_count': stats.count})
+        np.savez(path, localities=np.array(self.localities),
+                 params=np.array([self.min_rows, self.max_rooms, self.max_km, self.shrinkage],
+                                 dtype='float64'),
+                 overall=np.array([self.overall_median, self.overall_mad]), **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path=ANOMALY_PATH):
+        with np.load(path, allow_pickle=False) as state:
+            min_rows, max_rooms, max_km, shrinkage = state['params']
+            # shrinkage может быть дробным, остальные параметры -- целые.
+            detector = cls(int(min_rows), int(max_rooms), int(max_km), float(shrinkage))
+            detector.localities = state['localities'].tolist()
+            detector.overall_median, detector.overall_mad = (float(v) for v in state['overall'])
+            for name in ('similar', 'distance', 'locality'):
+                setattr(detector, name, GroupStatistics(
+                    state[f'{name}_keys'], state[f'{name}_median'],
+                    state[f'{name}_mad'], state[f'{name}_count']))
+        return detector
@@ -0,0 +1,108 @@
+"""Базовая оценка цены квадратного метра.
+
+Оценка = медиана price_per_sqm населенного пункта
+         × поправка на число комнат
+         × поправка на расстояние до центра (city_centers_km).
+
+Поправки -- медианы отношения фактической цены квадратного метра к уже
+учтенной части оценки. Все таблицы небольшие и хранятся плотными
+массивами, поэтому оценка пакета -- несколько поисков по индексу.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import CACHE_DIR
+
+
+BASELINE_PATH = os.path.join(CACHE_DIR, 'price_baseline.json')
+
+
+class PricePerSqmBaseline:
+    """Оценка цены квадратного метра по населенному пункту, комнатам и удаленности от центра."""
+
+    def __init__(self, min_locality_rows=10, min_factor_rows=20, max_rooms=5, max_km=60):
+        self.min_locality_rows = min_locality_rows
+        self.min_factor_rows = min_factor_rows
+        self.max_rooms = max_rooms
+        self.max_km = max_km
+
+    def _locality_base(self, locality):
+        codes = pd.Index(self.localities).get_indexer(pd.Series(locality).astype(str))
+        return np.where(codes >= 0, self.locality_medians[codes], self.global_median)
+
+    def _rooms_index(self, rooms):
+        rooms = np.nan_to_num(np.asarray(rooms, dtype='float64'), nan=1)
+        return np.clip(rooms, 0, self.max_rooms).astype('int64')
+
+    def _km_factor(self, km):
+        km = np.asarray(km, dtype='float64')
+        index = np.clip(np.nan_to_num(km, nan=0), 0, self.max_km).astype('int64')
+        return np.where(np.isnan(km), 1.0, self.km_factors[index])
+
+    def _factors(self, ratio, keys, size):
+        """Медианы отношения по ключу; редкие и отсутствующие ключи -- 1."""
+        grouped = pd.Series(ratio).groupby(keys)
+        medians = grouped.median()[grouped.size() >= self.min_factor_rows]
+        factors = np.ones(size)
+        factors[medians.index.to_numpy(dtype='int64')] = medians.to_numpy()
+        return factors
+
+    def fit(self, data):
+        price_per_sqm = data['price_per_sqm'].to_numpy(dtype='float64')
+        locality = data['locality_name'].astype(str).to_numpy()
+        self.global_median = float(np.median(price_per_sqm))
+        grouped = pd.Series(price_per_sqm).groupby(locality)
+        medians = grouped.median()[grouped.size() >= self.min_locality_rows]
+        self.localities = medians.index.tolist()
+        self.locality_medians = medians.to_numpy()
+
+        ratio = price_per_sqm / self._locality_base(locality)
+        rooms = self._rooms_index(data['rooms'])
+        self.rooms_factors = self._factors(ratio, rooms, self.max_rooms + 1)
+        ratio = ratio / self.rooms_factors[rooms]
+
+        km = data['city_centers_km'].to_numpy(dtype='float64')
+        known = ~np.isnan(km)
+        km_index = np.clip(km[known], 0, self.max_km).astype('int64')
+        self.km_factors = self._factors(ratio[known], km_index, self.max_km + 1)
+        return self
+
+    def estimate(self, frame):
+        """Оценка цены квадратного метра для пакета объявлений."""
+        return (self._locality_base(frame['locality_name'])
+                * self.rooms_factors[self._rooms_index(frame['rooms'])]
+                * self._km_factor(frame['city_centers_km']))
+
+    def to_dict(self):
+        return {
+            'min_locality_rows': self.min_locality_rows, 'min_factor_rows': self.min_factor_rows,
+            'max_rooms': self.max_rooms, 'max_km': self.max_km,
+            'global_median': self.global_median, 'localities': self.localities,
+            'locality_medians': self.locality_medians.tolist(),
+            'rooms_factors': self.rooms_factors.tolist(), 'km_factors': self.km_factors.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        baseline = cls(state['min_locality_rows'], state['min_factor_rows'],
+                       state['max_rooms'], state['max_km'])
+        baseline.global_median = state['global_median']
+        baseline.localities = state['localities']
+        for name in ('locality_medians', 'rooms_factors', 'km_factors'):
+            setattr(baseline, name, np.array(state[name], dtype='float64'))
+        return baseline
+
+    def save(self, path=BASELINE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        return path
+
+    @classmethod
+    def load(cls, path=BASELINE_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,249 @@
+"""Пакетная оценка больших файлов объявлений.
+
+Входной TSV/CSV читается порциями по ``chunk_rows`` строк. Каждая порция
+проходит те же шаги, что и в анализе: заполнение пропусков по статистикам
+эталонного датасета, нормализация названий населенных пунктов, признаки
+(тип этажа, цена квадратного метра, расстояние до центра в км). Затем к ней
+добавляются базовая оценка цены квадратного метра (``PricePerSqmBaseline``),
+оценка цены, отношение цены объявления к оценке, признак выброса по
+правилам ``OUTLIER_RULES`` и, если задана модель, прогноз ``PriceModel``.
+Строки не отбрасываются, кроме объявлений без населенного пункта. Во
+входном файле может не быть цены (``last_price``): тогда в результате нет
+столбцов цены и отношения к оценке, а правила по отсутствующим столбцам
+не проверяются.
+
+Порции оцениваются в пуле процессов; в работе одновременно не больше
+``max_pending`` порций, поэтому чтение не убегает вперед и память
+ограничена. Каждая порция записывается отдельной частью в колоночном
+формате (``parts/part-000042``), а номера готовых порций -- в манифест.
+При повторном запуске с тем же входным файлом и параметрами готовые порции
+пропускаются (их строки даже не разбираются), поэтому прерванная оценка
+продолжается с места остановки.
+
+Запуск::
+
+    python -m real_estate batch feed.tsv -o valuations --workers 4
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from real_estate.baseline import PricePerSqmBaseline
+from real_estate.cleaning import clean_chunk, fill_missing, global_medians
+from real_estate.columnar import read_columns, write_columns
+from real_estate.dataset import DATA_PATH, DATA_URL, load_listings
+from real_estate.features import add_features
+from real_estate.filters import OUTLIER_RULES
+from real_estate.imputation import LOCALITY_RULES, GroupMedianImputer
+from real_estate.locality import LocalityNormalizer, normalize_locality_names
+
+
+CHUNK_ROWS = 100_000
+MANIFEST_FILE = 'manifest.json'
+PARTS_DIR = 'parts'
+ROW_COLUMN = 'row'
+OUTPUT_COLUMNS = ('locality_name', 'total_area', 'rooms', 'floor', 'floor_type',
+                  'city_centers_km')
+# Есть только у объявлений с ценой; без нее нет и отношения цены к оценке.
+PRICE_COLUMNS = ('last_price', 'price_per_sqm')
+
+
+class BatchValuer:
+    """Статистики эталонного датасета и оценка одной порции объявлений."""
+
+    def __init__(self, medians, imputer, normalizer, baseline, model=None):
+        self.medians = medians
+        self.imputer = imputer
+        self.normalizer = normalizer
+        self.baseline = baseline
+        self.model = model
+
+    @classmethod
+    def from_listings(cls, raw, model=None, rules=LOCALITY_RULES):
+        """Статистики по сырому эталонному датасету той же предобработкой, что и анализ."""
+        medians = global_medians(raw)
+        imputer = GroupMedianImputer(rules).fit(raw.dropna(subset=['locality_name']))
+        # Тот же словарь названий, что сохранил анализ, -- канонические названия совпадают.
+        normalizer = LocalityNormalizer.load_or_create()
+        data = clean_chunk(raw, medians, imputer, normalizer=normalizer)
+        return cls(medians, imputer, normalizer, PricePerSqmBaseline().fit(data), model)
+
+    def value(self, chunk):
+        """Оценки порции; индекс порции -- номера строк входного файла."""
+        data = fill_missing(chunk, self.medians, self.imputer)
+        data = add_features(normalize_locality_names(data, self.normalizer))
+        priced = 'last_price' in data
+        result = data[list(OUTPUT_COLUMNS + PRICE_COLUMNS if priced else OUTPUT_COLUMNS)].copy()
+        result.insert(0, ROW_COLUMN, data.index.to_numpy(dtype='int64'))
+        result = result.reset_index(drop=True)
+        estimate = self.baseline.estimate(data)
+        result['baseline_price_per_sqm'] = estimate
+        result['baseline_price'] = estimate * data['total_area'].to_numpy(dtype='float64')
+        if priced:
+            result['price_ratio'] = result['last_price'] / result['baseline_price']
+        passed = np.ones(len(data), dtype=bool)
+        for rule in OUTLIER_RULES:
+            if rule.column in data:
+                passed &= rule.passes(data)
+        result['outlier'] = ~passed
+        if self.model is not None:
+            result['model_price'] = self.model.predict(data)
+        return result
+
+
+# Порции --------------------------------------------------------------------
+
+_VALUER = {}
+
+
+def _init_worker(valuer):
+    _VALUER['valuer'] = valuer
+
+
+def _part_path(output, number):
+    return os.path.join(output, PARTS_DIR, f'part-{number:06d}')
+
+
+def _value_chunk(chunk, number, first_row, output):
+    """Оценивает порцию и записывает ее часть; возвращает (номер, строк на входе, на выходе)."""
+    chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+    result = _VALUER['valuer'].value(chunk)
+    write_columns(result, _part_path(output, number))
+    return number, len(chunk), len(result)
+
+
+def _fingerprint(path, chunk_rows, sep, model):
+    stat = os.stat(path)
+    return {'input': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'chunk_rows': chunk_rows, 'sep': sep, 'model': bool(model)}
+
+
+def _read_manifest(output, fingerprint):
+    path = os.path.join(output, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'run': fingerprint, 'done': {}}
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest['run'] != fingerprint:
+        raise ValueError(f'Каталог {output} относится к другому входному файлу или параметрам; '
+                         'удалите его или укажите другой')
+    # Часть могла не дописаться, если процесс прервали; такие порции оцениваются заново.
+    manifest['done'] = {number: rows for number, rows in manifest['done'].items()
+                        if os.path.isdir(_part_path(output, int(number)))}
+    return manifest
+
+
+def _write_manifest(output, manifest):
+    path = os.path.join(output, MANIFEST_FILE)
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def _chunks(path, chunk_rows, sep, done):
+    """Порции (номер, первая строка, датафрейм), кроме готовых.
+
+    Готовые порции в начале файла пропускаются без разбора строк.
+    """
+    skip = 0
+    while str(skip) in done:
+        skip += 1
+    rows = range(1, skip * chunk_rows + 1) if skip else None
+    reader = pd.read_csv(path, sep=sep, chunksize=chunk_rows, skiprows=rows)
+    for number, chunk in enumerate(reader, start=skip):
+        # Если готов весь файл, читатель отдает одну пустую порцию.
+        if len(chunk) and str(number) not in done:
+            yield number, number * chunk_rows, chunk
+
+
+def value_file(path, output, valuer, chunk_rows=CHUNK_ROWS, sep='\t', workers=None,
+               max_pending=None, progress=sys.stderr):
+    """Оценивает файл ``path`` порциями и пишет части в каталог ``output``.
+
+    Возвращает словарь с числом прочитанных и записанных строк, порций и
+    временем работы.
+    """
+    os.makedirs(os.path.join(output, PARTS_DIR), exist_ok=True)
+    manifest = _read_manifest(output, _fingerprint(path, chunk_rows, sep, valuer.model))
+    done = manifest['done']
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    started = time.perf_counter()
+    totals = {'rows_in': 0, 'rows_out': 0, 'chunks': 0, 'skipped_chunks': len(done)}
+
+    def finish(number, rows_in, rows_out):
+        done[str(number)] = [rows_in, rows_out]
+        _write_manifest(output, manifest)
+        totals['rows_in'] += rows_in
+        totals['rows_out'] += rows_out
+        totals['chunks'] += 1
+        if progress is not None:
+            seconds = time.perf_counter() - started
+            print(f'порция {number}: {totals["rows_in"]} строк, '
+                  f'{totals["rows_in"] / seconds:,.0f} строк/с', file=progress)
+
+    chunks = _chunks(path, chunk_rows, sep, done)
+    if workers == 1:
+        _init_worker(valuer)
+        for number, first_row, chunk in chunks:
+            finish(*_value_chunk(chunk, number, first_row, output))
+    else:
+        pending = deque()
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(valuer,)) as pool:
+            for number, first_row, chunk in chunks:
+                # Очередь ограничена: пока старейшая порция не готова, новые не читаются.
+                if len(pending) >= max_pending:
+                    finish(*pending.popleft().result())
+                pending.append(pool.submit(_value_chunk, chunk, number, first_row, output))
+            while pending:
+                finish(*pending.popleft().result())
+    totals['seconds'] = time.perf_counter() - started
+    return totals
+
+
+def read_results(output, columns=None):
+    """Все готовые части каталога ``output`` в порядке строк входного файла."""
+    parts = sorted(os.listdir(os.path.join(output, PARTS_DIR)))
+    frames = [read_columns(os.path.join(output, PARTS_DIR, part), columns, mmap=False)
+              for part in parts if part.startswith('part-') and '.tmp-' not in part]
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетная оценка файла объявлений')
+    parser.add_argument('input', help='TSV/CSV с объявлениями')
+    parser.add_argument('-o', '--output', required=True, help='каталог результатов')
+    parser.add_argument('--reference', default=DATA_PATH,
+                        help='эталонный датасет для статистик и базовой оценки')
+    parser.add_argument('--offline', action='store_true', help='не скачивать эталонный датасет')
+    parser.add_argument('--model', help='файл PriceModel для дополнительного прогноза')
+    parser.add_argument('--sep', default='\t')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--max-pending', type=int, help='порций в работе одновременно')
+    args = parser.parse_args(argv)
+
+    model = None
+    if args.model:
+        from real_estate.model import PriceModel
+        model = PriceModel.load(args.model)
+    valuer = BatchValuer.from_listings(load_listings(args.reference, DATA_URL, offline=args.offline),
+                                       model)
+    totals = value_file(args.input, args.output, valuer, args.chunk_rows, args.sep, args.workers,
+                        args.max_pending)
+    print(f'{totals["rows_in"]} строк за {totals["seconds"]:.1f} с '
+          f'({totals["rows_in"] / max(totals["seconds"], 1e-9):,.0f} строк/с), '
+          f'пропущено готовых порций: {totals["skipped_chunks"]}: {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
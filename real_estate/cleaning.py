@@ -0,0 +1,69 @@
+"""Этапы предобработки объявлений.
+
+Функции повторяют шаги исследовательского анализа и принимают готовые
+статистики (медианы, импьютер), поэтому одинаково работают и на всем
+датафрейме, и на отдельной порции данных при потоковой обработке.
+"""
+
+import pandas as pd
+
+from real_estate.dataset import DATE_FORMAT
+from real_estate.features import add_features
+from real_estate.filters import OUTLIER_RULES, apply_filters
+from real_estate.imputation import LOCALITY_RULES, GroupMedianImputer
+from real_estate.instrument import traced
+from real_estate.locality import normalize_locality_names
+
+
+# Столбцы, пропуски в которых заполняются общей медианой.
+GLOBAL_MEDIAN_COLUMNS = ('ceiling_height', 'balcony')
+
+
+def global_medians(data):
+    return {column: data[column].median() for column in GLOBAL_MEDIAN_COLUMNS}
+
+
+@traced()
+def fill_missing(data, medians, imputer):
+    """Заполняет пропуски и приводит дату публикации к datetime."""
+    data = data.copy()
+    data['ceiling_height'] = data['ceiling_height'].fillna(medians['ceiling_height'])
+    data['kitchen_area'] = data['kitchen_area'].fillna(0)
+    data['living_area'] = data['living_area'].fillna(data['total_area'] - data['kitchen_area'])
+    data['balcony'] = data['balcony'].fillna(medians['balcony'])
+    data = data.dropna(subset=['locality_name'])
+    data = imputer.transform(data)
+    data['is_apartment'] = data['is_apartment'].fillna(False)
+    data['first_day_exposition'] = pd.to_datetime(data['first_day_exposition'], format=DATE_FORMAT)
+    return data
+
+
+@traced()
+def fix_anomalies(data):
+    """Исправляет высоту потолков с ошибкой в запятой и удаляет аномалии."""
+    data = data[(data['ceiling_height'] < 100) & (data['ceiling_height'] > 1.2)].copy()
+    data.loc[data['ceiling_height'] >= 20, 'ceiling_height'] /= 10
+    data = data[data['ceiling_height'] < 8]
+    return data[data['airports_nearest'] != 0]
+
+
+def drop_outliers(data, rules=OUTLIER_RULES):
+    return apply_filters(data, rules)[0]
+
+
+@traced()
+def clean_chunk(data, medians, imputer, filter_rules=OUTLIER_RULES, normalizer=None):
+    """Полная предобработка порции данных по готовым статистикам."""
+    data = fill_missing(data, medians, imputer)
+    data = normalize_locality_names(data, normalizer)
+    data = fix_anomalies(data)
+    data = add_features(data)
+    return drop_outliers(data, filter_rules)
+
+
+@traced()
+def clean(data, rules=LOCALITY_RULES, filter_rules=OUTLIER_RULES, normalizer=None):
+    """Полная предобработка датафрейма, статистики считаются по нему же."""
+    medians = global_medians(data)
+    imputer = GroupMedianImputer(rules).fit(data.dropna(subset=['locality_name']))
+    return clean_chunk(data, medians, imputer, filter_rules, normalizer)
@@ -0,0 +1,130 @@
+"""Командная строка пакета: ``python -m real_estate <команда>``.
+
+Модуль импортирует только стандартную библиотеку: pandas, numpy и модули
+пакета загружаются внутри команды, уже после разбора аргументов, а
+matplotlib -- только командой ``report``. Поэтому ``--help`` и запуск
+короткоживущих процессов не тратят время на импорт тяжелых библиотек
+(проверяется ``benchmarks/startup.py``).
+
+Команды ``clean``, ``train`` и ``score`` описаны здесь; остальные передают
+аргументы в ``main`` своего модуля.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+
+# Команда -> (модуль с функцией main, описание).
+MODULE_COMMANDS = {
+    'batch': ('real_estate.batch', 'потоковая оценка большого файла объявлений'),
+    'pipeline': ('real_estate.stages', 'конвейер предобработки с кэшем стадий'),
+    'report': ('real_estate.report', 'графики исследовательского анализа'),
+    'serve': ('real_estate.service', 'HTTP-сервис оценки объявлений'),
+    'store': ('real_estate.store', 'партиционированное хранилище объявлений'),
+    'synthetic': ('real_estate.synthetic', 'генерация синтетических объявлений'),
+    'update': ('real_estate.incremental', 'обновление статистик по новым объявлениям'),
+}
+TEXT_SUFFIXES = {'.csv': ',', '.tsv': '\t', '.txt': '\t'}
+
+
+def _read(path, sep):
+    from real_estate.dataset import parse_listings
+    return parse_listings(path, sep=sep)
+
+
+def _write(frame, path):
+    """Текстовый файл по расширению ``.csv``/``.tsv``, иначе -- колоночный каталог."""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in TEXT_SUFFIXES:
+        frame.to_csv(path, sep=TEXT_SUFFIXES[suffix], index=False)
+    else:
+        from real_estate.columnar import write_columns
+        write_columns(frame, path)
+
+
+def clean_command(args):
+    from real_estate.cleaning import clean
+
+    data = clean(_read(args.input, args.sep))
+    _write(data, args.output)
+    print(f'{len(data)} объявлений: {args.output}', file=sys.stderr)
+
+
+def train_command(args):
+    from real_estate.model import MODEL_PATH, train_price_model
+
+    model = train_price_model(_read(args.input, args.sep), args.alpha)
+    print(f'Модель: {model.save(args.model or MODEL_PATH)}', file=sys.stderr)
+
+
+def score_command(args):
+    """Оценка объявлений сохраненной моделью без отбрасывания строк.
+
+    Пропуски заполняются статистиками эталонного датасета, а не оцениваемого
+    файла: оценка объявления не зависит от того, с какими объявлениями оно
+    пришло. Цены во входном файле может не быть.
+    """
+    from real_estate.cleaning import fill_missing, global_medians
+    from real_estate.dataset import DATA_PATH, DATA_URL, load_listings
+    from real_estate.features import add_features
+    from real_estate.imputation import LOCALITY_RULES, GroupMedianImputer
+    from real_estate.locality import LocalityNormalizer, normalize_locality_names
+    from real_estate.model import MODEL_PATH, PriceModel
+
+    model = PriceModel.load(args.model or MODEL_PATH)
+    reference = load_listings(args.reference or DATA_PATH, DATA_URL, offline=args.offline)
+    imputer = GroupMedianImputer(LOCALITY_RULES).fit(reference.dropna(subset=['locality_name']))
+    raw = _read(args.input, args.sep)
+    data = fill_missing(raw, global_medians(reference), imputer)
+    data = add_features(normalize_locality_names(data, LocalityNormalizer.load_or_create()))
+    data['predicted_price'] = model.predict(data)
+    if 'last_price' in data:
+        data['price_ratio'] = data['last_price'] / data['predicted_price']
+    _write(data, args.output)
+    print(f'{len(data)} объявлений: {args.output}', file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m real_estate',
+                                     description='Анализ и оценка объявлений о продаже квартир')
+    commands = parser.add_subparsers(dest='command', metavar='команда', required=True)
+
+    def add(name, handler, help, output=True):
+        command = commands.add_parser(name, help=help, description=help)
+        command.add_argument('input', help='файл с объявлениями')
+        if output:
+            command.add_argument('-o', '--output', required=True,
+                                 help='.csv/.tsv или каталог в колоночном формате')
+        command.add_argument('--sep', default='\t', help='разделитель входного файла')
+        command.set_defaults(handler=handler)
+        return command
+
+    add('clean', clean_command, 'предобработка: пропуски, названия, аномалии, признаки, выбросы')
+    train = add('train', train_command, 'обучение модели цены', output=False)
+    train.add_argument('--alpha', type=float, default=1.0)
+    train.add_argument('--model', help='куда сохранить модель')
+    score = add('score', score_command, 'оценка объявлений сохраненной моделью')
+    score.add_argument('--model', help='файл модели')
+    score.add_argument('--reference', help='эталонный датасет для заполнения пропусков '
+                                           '(по умолчанию -- датасет анализа)')
+    score.add_argument('--offline', action='store_true', help='не скачивать эталонный датасет')
+    for name, (_, help) in MODULE_COMMANDS.items():
+        commands.add_parser(name, help=help, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in MODULE_COMMANDS:
+        module = importlib.import_module(MODULE_COMMANDS[argv[0]][0])
+        # Для справки модуля: имя программы -- как ее запустили.
+        sys.argv[0] = f'python -m real_estate {argv[0]}'
+        return module.main(argv[1:])
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
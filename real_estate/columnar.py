@@ -0,0 +1,127 @@
+"""Колоночный бинарный формат для датафреймов.
+
+Каждый столбец хранится отдельным ``.npy`` файлом, описание столбцов --
+в ``meta.json``. При чтении массивы отображаются в память (``mmap``),
+поэтому загрузка не требует разбора текста и занимает миллисекунды.
+
+Кодирование столбцов:
+- целые числа -- как есть (``int64``): узкий целый тип молча переполняется
+  в арифметике после загрузки;
+- дробные -- ``float32``, если все значения представимы в нем точно, иначе
+  ``float64``;
+- даты -- ``datetime64`` с единицей исходного столбца (``us`` у ``pd.to_datetime``
+  в pandas 3, ``ns`` раньше);
+- строки -- категории: коды ``int16``/``int32`` и список категорий в ``meta.json``;
+- логические с пропусками и смеси True/False с 0/1 -- ``int8`` со значением
+  ``-1`` для пропуска.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+META_FILE = 'meta.json'
+
+
+def _compact_numeric(values):
+    """``float32`` для дробных значений, если он хранит их без потерь.
+
+    Целые столбцы не сужаются: ``int8`` для комнат или ``int32`` для цены
+    переполнились бы в арифметике после загрузки без всякого предупреждения.
+    """
+    if values.dtype.kind != 'f' or values.dtype.itemsize <= 4:
+        return values
+    compact = values.astype('float32')
+    if np.array_equal(compact.astype(values.dtype), values, equal_nan=True):
+        return compact
+    return values
+
+
+def encode_column(series, compact=True):
+    """Возвращает (массив для записи, описание столбца)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        codes = series.cat.codes.to_numpy()
+        codes = codes.astype('int16' if len(categories) < 2 ** 15 else 'int32')
+        return codes, {'kind': 'category', 'categories': [str(c) for c in categories]}
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype=f'datetime64[{series.dt.unit}]'), {'kind': 'datetime'}
+    if pd.api.types.is_bool_dtype(series) and not series.hasnans:
+        return series.to_numpy(dtype=bool), {'kind': 'bool'}
+    known = series.dropna()
+    if pd.api.types.infer_dtype(series, skipna=True) == 'boolean' or (
+            series.dtype == object and len(known) and known.isin([0, 1]).all()):
+        # Смесь True/False и 0/1 (is_apartment после fillna(False)) -- тоже логический столбец.
+        values = np.where(series.isna(), -1, series.fillna(False).astype(bool)).astype('int8')
+        return values, {'kind': 'boolean'}
+    if pd.api.types.is_numeric_dtype(series):
+        if not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            values = series.to_numpy()
+        elif series.hasnans:
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            values = series.to_numpy(dtype=series.dtype.numpy_dtype)
+        if compact:
+            values = _compact_numeric(values)
+        return values, {'kind': 'numeric'}
+    return encode_column(series.astype('category'), compact)
+
+
+def decode_column(values, meta):
+    kind = meta['kind']
+    if kind == 'category':
+        return pd.Categorical.from_codes(values, categories=meta['categories'])
+    if kind == 'boolean':
+        return pd.arrays.BooleanArray(np.asarray(values) == 1, np.asarray(values) < 0)
+    return values
+
+
+def write_columns(frame, path, compact=True, extra=None):
+    """Записывает датафрейм в каталог ``path`` атомарно (через временный каталог)."""
+    tmp = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = []
+    for number, name in enumerate(frame.columns):
+        values, meta = encode_column(frame[name], compact)
+        meta.update(name=str(name), file=f'{number:03d}.npy', dtype=str(values.dtype))
+        np.save(os.path.join(tmp, meta['file']), values, allow_pickle=False)
+        columns.append(meta)
+    meta = {'rows': len(frame), 'columns': columns}
+    if extra:
+        meta.update(extra)
+    with open(os.path.join(tmp, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_columns(path, columns=None, mmap=True):
+    """Читает столбцы из каталога ``path``.
+
+    При ``mmap=True`` числовые столбцы и даты не копируются в память, а
+    отображаются из файлов в режиме copy-on-write: изменения датафрейма не
+    попадают на диск.
+    """
+    meta = read_meta(path)
+    wanted = None if columns is None else set(columns)
+    result = {}
+    for column in meta['columns']:
+        if wanted is not None and column['name'] not in wanted:
+            continue
+        values = np.load(os.path.join(path, column['file']),
+                         mmap_mode='c' if mmap else None, allow_pickle=False)
+        result[column['name']] = decode_column(values, column)
+    if columns is not None:
+        result = {name: result[name] for name in columns}
+    return pd.DataFrame(result, copy=False)
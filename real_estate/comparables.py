@@ -0,0 +1,310 @@
+"""Поиск аналогов (comparables) для оценки квартиры.
+
+Аналоги -- квартиры того же населенного пункта, близкие по площади,
+комнатам, типу этажа, высоте потолков и расстояниям до центра и до
+аэропорта. Признаки стандартизуются по всему датасету, тип этажа
+кодируется one-hot с весом ``floor_weight``, так что несовпадение типа
+этажа стоит столько же, сколько разница на ``floor_weight`` стандартных
+отклонений. Пропуски расстояний заполняются медианой населенного пункта
+(или общей медианой).
+
+Для каждого населенного пункта и для всего датасета (на случай
+неизвестного населенного пункта) строится KD-дерево: узлы хранятся в
+плоских массивах, точки листьев лежат подряд, поэтому лист проверяется
+одной векторной операцией. Индекс сохраняется каталогом ``.npy`` и
+загружается через отображение в память.
+
+Оценка по аналогам -- среднее price_per_sqm аналогов с весами, обратными
+расстоянию, умноженное на площадь квартиры.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import CACHE_DIR
+from real_estate.features import FLOOR_TYPES, floor_type
+
+
+FEATURES = ('total_area', 'rooms', 'ceiling_height', 'cityCenters_nearest', 'airports_nearest')
+COMPARABLES_PATH = os.path.join(CACHE_DIR, 'comparables')
+# Массивы индекса: объявления в исходном порядке и деревья. Метки строк
+# (``labels``) хранятся отдельно: индекс данных может быть и не числовым.
+LISTING_ARRAYS = ('locality', 'values', 'floor', 'last_price')
+TREE_ARRAYS = ('points', 'point_rows', 'node_start', 'node_stop', 'node_dim',
+               'node_split', 'node_left', 'node_right', 'roots')
+
+
+def _floor_codes(frame):
+    if 'floor_type' in frame:
+        return pd.Categorical(frame['floor_type'], categories=FLOOR_TYPES).codes.astype('int64')
+    return floor_type(frame['floor'], frame['floors_total']).codes.astype('int64')
+
+
+def build_tree(points, leaf_size):
+    """KD-дерево над ``points``: порядок точек и плоские массивы узлов.
+
+    Узел делится по медиане признака с наибольшим разбросом; у листа
+    ``left == right == -1``, его точки -- ``order[start:stop]``.
+    """
+    order = np.arange(len(points))
+    start, stop, dim, split, left, right = [], [], [], [], [], []
+    stack = [(0, len(points), None)]
+    while stack:
+        lo, hi, parent = stack.pop()
+        node = len(start)
+        if parent is not None:
+            parent_node, side = parent
+            (left if side == 0 else right)[parent_node] = node
+        start.append(lo)
+        stop.append(hi)
+        left.append(-1)
+        right.append(-1)
+        block = points[order[lo:hi]]
+        spread = block.max(axis=0) - block.min(axis=0) if hi > lo else np.zeros(points.shape[1])
+        if hi - lo <= leaf_size or not spread.any():
+            dim.append(-1)
+            split.append(0.0)
+            continue
+        axis = int(np.argmax(spread))
+        mid = (lo + hi) // 2
+        order[lo:hi] = order[lo:hi][np.argpartition(block[:, axis], mid - lo)]
+        dim.append(axis)
+        split.append(float(points[order[mid], axis]))
+        stack.append((mid, hi, (node, 1)))
+        stack.append((lo, mid, (node, 0)))
+    nodes = {'node_start': start, 'node_stop': stop, 'node_dim': dim, 'node_split': split,
+             'node_left': left, 'node_right': right}
+    return order, {name: np.asarray(values, dtype='float64' if name == 'node_split' else 'int64')
+                   for name, values in nodes.items()}
+
+
+class ComparablesIndex:
+    """Индекс аналогов по населенным пунктам на KD-деревьях."""
+
+    def __init__(self, k=10, leaf_size=64, floor_weight=1.0, weights=None):
+        self.k = k
+        self.leaf_size = leaf_size
+        self.floor_weight = floor_weight
+        # Веса признаков в расстоянии, по умолчанию 1.
+        self.weights = dict(weights or {})
+
+    # Признаки ------------------------------------------------------------
+
+    def _locality_codes(self, frame):
+        names = pd.Series(frame['locality_name']).astype(str)
+        return pd.Index(self.localities).get_indexer(names)
+
+    def _prepare(self, listings):
+        """Точки и коды населенных пунктов для датафрейма или одного объявления.
+
+        Одно объявление (словарь) разбирается без pandas: для одиночного
+        запроса построение датафрейма дороже самого поиска.
+        """
+        if not isinstance(listings, dict):
+            locality = self._locality_codes(listings)
+            return self._points(self._raw_values(listings), _floor_codes(listings), locality), locality
+        if not hasattr(self, '_locality_lookup'):
+            self._locality_lookup = {name: code for code, name in enumerate(self.localities)}
+        locality = np.array([self._locality_lookup.get(str(listings.get('locality_name')), -1)])
+        values = np.array([[np.nan if listings.get(column) is None else float(listings[column])
+                            for column in FEATURES]])
+        if listings.get('floor_type') in FLOOR_TYPES:
+            floor = FLOOR_TYPES.index(listings['floor_type'])
+        else:
+            floor = floor_type([listings.get('floor', np.nan)],
+                               [listings.get('floors_total', np.nan)]).codes[0]
+        return self._points(values, np.array([floor]), locality), locality
+
+    def _raw_values(self, frame):
+        missing = np.full(len(frame), np.nan)
+        return np.column_stack([frame[column].to_numpy(dtype='float64', na_value=np.nan)
+                                if column in frame else missing for column in FEATURES])
+
+    def _points(self, values, floor, locality):
+        """Стандартизованные точки; пропуски -- медианы населенного пункта."""
+        fill = np.where(locality[:, None] >= 0, self.fill[np.maximum(locality, 0)], self.overall_fill)
+        values = np.where(np.isnan(values), fill, values)
+        values = np.where(np.isnan(values), self.overall_fill, values)
+        scaled = (values - self.mean) / self.scale * self.feature_weights
+        one_hot = np.zeros((len(values), len(FLOOR_TYPES)))
+        known = floor >= 0
+        one_hot[np.flatnonzero(known), floor[known]] = self.floor_weight / np.sqrt(2)
+        return np.hstack([scaled, one_hot])
+
+    # Построение ----------------------------------------------------------
+
+    def fit(self, data):
+        """Строит индекс по очищенным данным с добавленными признаками."""
+        names = data['locality_name'].astype(str).to_numpy()
+        self.localities = sorted(set(names))
+        locality = pd.Index(self.localities).get_indexer(names)
+        values = self._raw_values(data)
+        self.overall_fill = np.nan_to_num(np.nanmedian(values, axis=0))
+        self.fill = pd.DataFrame(values).groupby(locality).median().reindex(
+            range(len(self.localities))).to_numpy()
+        self.mean = np.nanmean(values, axis=0)
+        self.scale = np.nanstd(values, axis=0)
+        self.scale[~(self.scale > 0)] = 1
+        self.feature_weights = np.array([self.weights.get(name, 1.0) for name in FEATURES])
+
+        self.labels = data.index
+        self.locality = locality
+        self.values = values
+        self.floor = _floor_codes(data)
+        self.last_price = data['last_price'].to_numpy(dtype='float64')
+        points = self._points(values, self.floor, locality)
+
+        # Дерево с номером len(localities) -- по всему датасету.
+        order = np.argsort(locality, kind='stable')
+        bounds = np.searchsorted(locality[order], np.arange(len(self.localities) + 1))
+        groups = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.localities))]
+        groups.append(np.arange(len(data)))
+        tree = {name: [] for name in TREE_ARRAYS}
+        offset = nodes = 0
+        for rows in groups:
+            tree_order, tree_nodes = build_tree(points[rows], self.leaf_size)
+            tree['points'].append(points[rows[tree_order]])
+            tree['point_rows'].append(rows[tree_order])
+            tree['roots'].append([nodes])
+            for name in ('node_start', 'node_stop'):
+                tree[name].append(tree_nodes[name] + offset)
+            for name in ('node_left', 'node_right'):
+                tree[name].append(np.where(tree_nodes[name] >= 0, tree_nodes[name] + nodes, -1))
+            tree['node_dim'].append(tree_nodes['node_dim'])
+            tree['node_split'].append(tree_nodes['node_split'])
+            offset += len(rows)
+            nodes += len(tree_nodes['node_start'])
+        for name, parts in tree.items():
+            setattr(self, name, np.concatenate(parts) if name != 'roots' else
+                    np.asarray(parts, dtype='int64').ravel())
+        return self
+
+    # Поиск ---------------------------------------------------------------
+
+    def _nodes(self):
+        # Обход дерева обращается к узлам по одному: списки Python здесь
+        # быстрее массивов numpy (и тем более отображенных в память).
+        if not hasattr(self, '_node_lists'):
+            self._node_lists = tuple(getattr(self, name).tolist() for name in (
+                'node_start', 'node_stop', 'node_dim', 'node_split', 'node_left', 'node_right'))
+        return self._node_lists
+
+    def _search(self, root, point, k):
+        """k ближайших точек дерева: расстояния и позиции в ``points``."""
+        node_start, node_stop, node_dim, node_split, node_left, node_right = self._nodes()
+        point_values = point.tolist()
+        best = np.full(k, np.inf)
+        found = np.full(k, -1, dtype='int64')
+        stack = [(root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best[-1]:
+                continue
+            dim = node_dim[node]
+            if dim < 0:
+                start, stop = node_start[node], node_stop[node]
+                diff = self.points[start:stop] - point
+                distances = np.einsum('ij,ij->i', diff, diff)
+                candidates = np.concatenate([best, distances])
+                positions = np.concatenate([found, np.arange(start, stop)])
+                keep = np.argsort(candidates, kind='stable')[:k]
+                best, found = candidates[keep], positions[keep]
+                continue
+            gap = point_values[dim] - node_split[node]
+            near, far = ((node_left[node], node_right[node]) if gap < 0
+                         else (node_right[node], node_left[node]))
+            stack.append((far, max(bound, gap * gap)))
+            stack.append((near, bound))
+        return np.sqrt(best), found
+
+    def neighbours(self, frame, k=None):
+        """Расстояния и строки (позиции в данных ``fit``) ``k`` аналогов для пакета.
+
+        ``frame`` -- датафрейм или одно объявление-словарь. Неизвестные
+        позиции (аналогов меньше ``k``) -- -1 с расстоянием inf.
+        """
+        k = k or self.k
+        points, locality = self._prepare(frame)
+        roots = self.roots[np.where(locality >= 0, locality, len(self.localities))]
+        distances = np.empty((len(points), k))
+        rows = np.empty((len(points), k), dtype='int64')
+        for i, (root, point) in enumerate(zip(roots, points)):
+            distances[i], found = self._search(root, point, k)
+            rows[i] = np.where(found >= 0, self.point_rows[np.maximum(found, 0)], -1)
+        return distances, rows
+
+    def comparables(self, listing, k=None):
+        """Таблица аналогов одного объявления, от ближайшего к дальнему."""
+        distances, rows = self.neighbours(listing, k)
+        found = rows[0] >= 0
+        rows, distances = rows[0][found], distances[0][found]
+        table = pd.DataFrame(self.values[rows], columns=list(FEATURES),
+                             index=pd.Index(self.labels[rows]))
+        table.insert(0, 'locality_name', np.asarray(self.localities, dtype=object)[self.locality[rows]])
+        table['floor_type'] = pd.Categorical.from_codes(self.floor[rows], categories=FLOOR_TYPES)
+        table['last_price'] = self.last_price[rows]
+        table['price_per_sqm'] = self.last_price[rows] / self.values[rows, 0]
+        table['distance'] = distances
+        return table
+
+    def estimate(self, frame, k=None):
+        """Оценка цены по аналогам для пакета объявлений."""
+        distances, rows = self.neighbours(frame, k)
+        if isinstance(frame, dict):
+            frame = pd.DataFrame([frame])
+        found = rows >= 0
+        safe = np.maximum(rows, 0)
+        prices = np.where(found, self.last_price[safe] / self.values[safe, 0], np.nan)
+        # Точное совпадение признаков не должно давать бесконечный вес.
+        weights = np.where(found, 1 / (distances + 1e-3), 0)
+        price_per_sqm = (np.nansum(prices * weights, axis=1)
+                         / np.where(weights.sum(axis=1) > 0, weights.sum(axis=1), np.nan))
+        return pd.DataFrame({
+            'price_per_sqm': price_per_sqm,
+            'median_price_per_sqm': np.nanmedian(np.where(found, prices, np.nan), axis=1),
+            'last_price': price_per_sqm * frame['total_area'].to_numpy(dtype='float64'),
+            'comparables': found.sum(axis=1),
+            'mean_distance': np.where(found, distances, np.nan).mean(axis=1, where=found),
+        }, index=frame.index)
+
+    # Сохранение ----------------------------------------------------------
+
+    def save(self, path=COMPARABLES_PATH):
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        arrays = LISTING_ARRAYS + TREE_ARRAYS + ('overall_fill', 'fill', 'mean', 'scale',
+                                                  'feature_weights')
+        for name in arrays:
+            np.save(os.path.join(tmp, f'{name}.npy'), getattr(self, name))
+        meta = {'k': self.k, 'leaf_size': self.leaf_size, 'floor_weight': self.floor_weight,
+                'weights': self.weights, 'localities': self.localities}
+        labels = self.labels.to_numpy()
+        # Числовые метки -- массивом .npy, остальные (строки) -- списком в index.json.
+        if labels.dtype.kind == 'O':
+            meta['labels'] = labels.tolist()
+        else:
+            np.save(os.path.join(tmp, 'labels.npy'), labels)
+        with open(os.path.join(tmp, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path=COMPARABLES_PATH, mmap=True):
+        """Загружает индекс; большие массивы отображаются в память."""
+        with open(os.path.join(path, 'index.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(meta['k'], meta['leaf_size'], meta['floor_weight'], meta['weights'])
+        index.localities = meta['localities']
+        for name in os.listdir(path):
+            if name.endswith('.npy'):
+                array = np.load(os.path.join(path, name), mmap_mode='r' if mmap else None)
+                setattr(index, name[:-4], array)
+        index.labels = pd.Index(meta['labels'] if 'labels' in meta else index.labels)
+        return index
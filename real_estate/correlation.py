@@ -0,0 +1,203 @@
+"""Корреляции признаков с ценой по объявлениям.
+
+Для всех числовых признаков сразу считаются корреляции Пирсона и
+Спирмена с ``last_price`` и ``price_per_sqm``: суммы, произведения и
+квадраты для всех пар «признак × цена» получаются несколькими матричными
+умножениями, а пропуски исключаются попарно, как в ``DataFrame.corr``.
+Спирмен -- тот же расчет на рангах (средние ранги для совпадающих
+значений; цены ранжируются заново на строках, где признак известен).
+
+``by`` дает ту же таблицу для каждой группы (например, населенного
+пункта). ``bootstrap_intervals`` строит доверительные интервалы по
+бутстрэп-выборкам (внутри групп, если задан ``by``); выборки делятся на
+порции с генераторами ``default_rng([seed, номер порции])`` и считаются в
+пуле процессов, поэтому результат не зависит от числа процессов.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+TARGETS = ('last_price', 'price_per_sqm')
+METHODS = ('pearson', 'spearman')
+MIN_ROWS = 3
+# Бутстрэп-выборок в одной задаче пула.
+RESAMPLES_PER_TASK = 25
+
+
+def numeric_features(data, targets=TARGETS):
+    """Числовые (не логические) столбцы, кроме целевых."""
+    return [name for name in data.columns
+            if name not in targets and pd.api.types.is_numeric_dtype(data[name])
+            and not pd.api.types.is_bool_dtype(data[name])]
+
+
+def _pearson(x, y):
+    """Корреляции столбцов ``x`` со столбцами ``y`` с попарным исключением пропусков."""
+    known_x = ~np.isnan(x)
+    known_y = ~np.isnan(y)
+    # Центрирование снижает потерю точности в суммах квадратов.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        x = np.where(known_x, x - np.nanmean(x, axis=0), 0)
+        y = np.where(known_y, y - np.nanmean(y, axis=0), 0)
+    mask_x, mask_y = known_x.astype('float64'), known_y.astype('float64')
+    count = mask_x.T @ mask_y
+    sum_x, sum_y = x.T @ mask_y, mask_x.T @ y
+    with np.errstate(all='ignore'):
+        covariance = x.T @ y - sum_x * sum_y / count
+        variance_x = (x * x).T @ mask_y - sum_x ** 2 / count
+        variance_y = mask_x.T @ (y * y) - sum_y ** 2 / count
+        result = covariance / np.sqrt(variance_x * variance_y)
+    result[count < MIN_ROWS] = np.nan
+    return result, count
+
+
+def _ranks(values):
+    return pd.DataFrame(values).rank().to_numpy(dtype='float64')
+
+
+def _spearman(x, y):
+    """Спирмен: Пирсон на рангах; цены ранжируются на строках, где известен признак."""
+    x_ranks = _ranks(x)
+    result = np.full((x.shape[1], y.shape[1]), np.nan)
+    count = np.zeros_like(result)
+    missing = np.isnan(x)
+    patterns = {}
+    for column in range(x.shape[1]):
+        patterns.setdefault(missing[:, column].tobytes(), []).append(column)
+    for columns in patterns.values():
+        known = ~missing[:, columns[0]]
+        y_ranks = _ranks(np.where(known[:, None], y, np.nan))
+        result[columns], count[columns] = _pearson(x_ranks[:, columns], y_ranks)
+    return result, count
+
+
+def _table(x, y, methods):
+    """Массив методы × признаки × цены и число пар."""
+    tables, count = [], None
+    for method in methods:
+        result, count = (_pearson(x, y) if method == 'pearson' else _spearman(x, y))
+        tables.append(result)
+    return np.stack(tables), count
+
+
+def _grouped_tables(x, y, codes, groups, methods):
+    """Таблицы по группам: массив группы × методы × признаки × цены."""
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(groups + 1))
+    tables = np.full((groups, len(methods), x.shape[1], y.shape[1]), np.nan)
+    counts = np.zeros((groups, x.shape[1], y.shape[1]))
+    for group in range(groups):
+        rows = order[bounds[group]:bounds[group + 1]]
+        if len(rows) >= MIN_ROWS:
+            tables[group], counts[group] = _table(x[rows], y[rows], methods)
+    return tables, counts
+
+
+def _prepare(data, features, targets, by):
+    features = list(features or numeric_features(data, targets))
+    # Объявления без цены не участвуют ни в одной паре.
+    data = data.dropna(subset=list(targets))
+    x = np.column_stack([data[name].to_numpy(dtype='float64', na_value=np.nan) for name in features])
+    y = np.column_stack([data[name].to_numpy(dtype='float64', na_value=np.nan) for name in targets])
+    if by is None:
+        return features, x, y, None, None
+    codes, names = pd.factorize(data[by].astype(str), sort=True)
+    return features, x, y, codes, list(names)
+
+
+def _frame(tables, counts, features, targets, methods, groups=None, by=None):
+    """Таблица в длинном формате: (группа), признак, цена, метод, r, n."""
+    if groups is None:
+        tables, counts = tables[None], counts[None]
+    g, m, f, t = np.meshgrid(np.arange(tables.shape[0]), np.arange(len(methods)),
+                             np.arange(len(features)), np.arange(len(targets)), indexing='ij')
+    result = pd.DataFrame({
+        'feature': np.asarray(features, dtype=object)[f.ravel()],
+        'target': np.asarray(targets, dtype=object)[t.ravel()],
+        'method': np.asarray(methods, dtype=object)[m.ravel()],
+        'r': tables.ravel(),
+        'n': counts[g.ravel(), f.ravel(), t.ravel()].astype('int64'),
+    })
+    if groups is not None:
+        result.insert(0, by, np.asarray(groups, dtype=object)[g.ravel()])
+    return result
+
+
+def correlations(data, features=None, targets=TARGETS, methods=METHODS, by=None, min_rows=MIN_ROWS):
+    """Корреляции признаков с ценами, по всем данным или по группам ``by``."""
+    features, x, y, codes, groups = _prepare(data, features, targets, by)
+    if by is None:
+        tables, counts = _table(x, y, methods)
+    else:
+        tables, counts = _grouped_tables(x, y, codes, len(groups), methods)
+    result = _frame(tables, counts, features, targets, methods, groups, by)
+    return result[result['n'] >= min_rows].reset_index(drop=True)
+
+
+# Бутстрэп ------------------------------------------------------------------
+
+_ARRAYS = {}
+
+
+def _init_worker(x, y, codes, groups, methods):
+    _ARRAYS.update(x=x, y=y, codes=codes, groups=groups, methods=methods)
+
+
+def _resample_task(seed, task, resamples):
+    """Корреляции ``resamples`` бутстрэп-выборок порции ``task``."""
+    x, y, codes = _ARRAYS['x'], _ARRAYS['y'], _ARRAYS['codes']
+    rng = np.random.default_rng([seed, task])
+    results = []
+    if codes is None:
+        for _ in range(resamples):
+            rows = rng.integers(0, len(x), len(x))
+            results.append(_table(x[rows], y[rows], _ARRAYS['methods'])[0])
+        return np.stack(results)
+    # Выборка внутри групп: размеры групп сохраняются.
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes, minlength=_ARRAYS['groups'])
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    sorted_codes = codes[order]
+    for _ in range(resamples):
+        offsets = np.floor(rng.random(len(x)) * sizes[sorted_codes]).astype('int64')
+        rows = order[starts[sorted_codes] + offsets]
+        results.append(_grouped_tables(x[rows], y[rows], codes[rows], _ARRAYS['groups'],
+                                       _ARRAYS['methods'])[0])
+    return np.stack(results)
+
+
+def bootstrap_intervals(data, features=None, targets=TARGETS, methods=METHODS, by=None,
+                        resamples=200, level=0.95, seed=0, workers=None, min_rows=MIN_ROWS):
+    """``correlations`` с перцентильными бутстрэп-интервалами ``low`` и ``high``."""
+    features, x, y, codes, groups = _prepare(data, features, targets, by)
+    group_count = len(groups) if groups is not None else None
+    tasks = [(task, min(RESAMPLES_PER_TASK, resamples - start))
+             for task, start in enumerate(range(0, resamples, RESAMPLES_PER_TASK))]
+    workers = min(workers or os.cpu_count() or 1, len(tasks)) or 1
+    arguments = (x, y, codes, group_count, tuple(methods))
+    if workers == 1:
+        _init_worker(*arguments)
+        samples = [_resample_task(seed, task, size) for task, size in tasks]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=arguments) as pool:
+            futures = [pool.submit(_resample_task, seed, task, size) for task, size in tasks]
+            samples = [future.result() for future in futures]
+    samples = np.concatenate(samples)
+    alpha = (1 - level) / 2
+    with np.errstate(all='ignore'):
+        low, high = np.nanquantile(samples, [alpha, 1 - alpha], axis=0)
+
+    if by is None:
+        tables, counts = _table(x, y, methods)
+    else:
+        tables, counts = _grouped_tables(x, y, codes, group_count, methods)
+    result = _frame(tables, counts, features, targets, methods, groups, by)
+    result['low'] = low.ravel()
+    result['high'] = high.ravel()
+    return result[result['n'] >= min_rows].reset_index(drop=True)
@@ -0,0 +1,229 @@
+"""Агрегатный куб цен для быстрых сводных запросов.
+
+Куб хранит для каждой непустой ячейки «населенный пункт × комнаты × тип
+этажа × год × месяц × city_centers_km» число объявлений и суммы last_price,
+price_per_sqm и total_area, а также гистограмму price_per_sqm
+(``GroupQuantileSketch``) для медиан. Ячеек на порядки меньше, чем
+объявлений, поэтому свертки по любым измерениям с фильтрами (в том числе
+таблица ``top_price_per_sqm`` и цена километра до центра Санкт-Петербурга)
+считаются по кубу за миллисекунды, без обращения к исходным строкам.
+
+Кубы объединяются (``merge``): суммы и гистограммы складываются.
+
+Пример::
+
+    cube = PriceCube.build(data)
+    cube.query(by='rooms', where={'locality_name': 'Санкт-Петербург', 'year': ('>=', 2017)})
+    cube.top(10, by='locality_name', measure='mean_price_per_sqm')
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from real_estate.columnar import read_columns, write_columns
+from real_estate.dataset import CACHE_DIR
+from real_estate.features import FLOOR_TYPES, floor_type
+from real_estate.imputation import OPERATORS
+from real_estate.incremental import SPB, spb_data_pivot, top_price_per_sqm
+from real_estate.sketches import GroupQuantileSketch
+
+
+DIMENSIONS = ('locality_name', 'rooms', 'floor_type', 'year', 'month', 'city_centers_km')
+SUMS = ('last_price', 'price_per_sqm', 'total_area')
+MEASURES = ('count', 'mean_last_price', 'mean_price_per_sqm', 'median_price_per_sqm',
+            'price_per_sqm_by_area')
+CUBE_PATH = os.path.join(CACHE_DIR, 'price_cube')
+# Пропуск в числовом измерении (например, неизвестное расстояние до центра).
+MISSING = -1
+
+
+def _encode(data):
+    """Измерения объявлений: названия населенных пунктов и целые коды остальных."""
+    if 'floor_type' in data:
+        floors = pd.Categorical(data['floor_type'], categories=FLOOR_TYPES).codes
+    else:
+        floors = floor_type(data['floor'], data['floors_total']).codes
+    dims = {'locality_name': data['locality_name'].astype(str).to_numpy(),
+            'floor_type': floors.astype('int64')}
+    for name in ('rooms', 'year', 'month', 'city_centers_km'):
+        values = data[name].to_numpy(dtype='float64', na_value=np.nan)
+        dims[name] = np.where(np.isnan(values), MISSING, np.nan_to_num(values)).astype('int64')
+    return dims
+
+
+def _condition(values, condition):
+    """Маска фильтра: значение, список значений или пара (оператор, значение)."""
+    if (isinstance(condition, tuple) and len(condition) == 2
+            and isinstance(condition[0], str) and condition[0] in OPERATORS):
+        op, value = condition
+        if op != '==' and values.dtype == object:
+            raise ValueError(f'Оператор {op} не применим к названиям')
+        return OPERATORS[op](values, value)
+    if isinstance(condition, (list, tuple, set, frozenset)):
+        return np.isin(values, list(condition))
+    return values == condition
+
+
+class PriceCube:
+    """Суммы, число объявлений и гистограммы price_per_sqm по ячейкам измерений."""
+
+    def __init__(self, cells, sketch, significant_digits=5):
+        # cells: измерения и суммы по ячейкам, индекс -- номер ячейки.
+        self.cells = cells.reset_index(drop=True)
+        self.sketch = sketch
+        self.significant_digits = significant_digits
+        self._dims = {name: self.cells[name].to_numpy() for name in DIMENSIONS}
+        self._dims['locality_name'] = self.cells['locality_name'].astype(str).to_numpy()
+
+    @classmethod
+    def build(cls, data, significant_digits=5):
+        """Куб по очищенным данным с добавленными признаками."""
+        dims = _encode(data)
+        frame = pd.DataFrame(dims)
+        for name in SUMS:
+            frame[name] = data[name].to_numpy(dtype='float64')
+        grouped = frame.groupby(list(DIMENSIONS), sort=True)
+        cells = grouped[list(SUMS)].sum()
+        cells['count'] = grouped.size()
+        cells = cells.reset_index()
+        cell_ids = grouped.ngroup().to_numpy()
+        sketch = GroupQuantileSketch(significant_digits).update(cell_ids, frame['price_per_sqm'])
+        return cls(cells, sketch, significant_digits)
+
+    # Запросы -------------------------------------------------------------
+
+    def _mask(self, where):
+        mask = np.ones(len(self.cells), dtype=bool)
+        for name, condition in (where or {}).items():
+            if name not in self._dims:
+                raise KeyError(f'Неизвестное измерение: {name}')
+            mask &= _condition(self._dims[name], condition)
+        return mask
+
+    def query(self, by=(), where=None, measures=MEASURES, min_count=1):
+        """Свертка куба по измерениям ``by`` с фильтром ``where``.
+
+        ``where`` -- словарь измерение -> значение, список значений или пара
+        (оператор, значение), например ``{'year': ('>=', 2017)}``.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = [name for name in by if name not in DIMENSIONS]
+        if unknown:
+            raise KeyError(f'Неизвестные измерения: {", ".join(unknown)}')
+        cells = self.cells[self._mask(where)]
+        keys = [cells[name] for name in by] if by else np.zeros(len(cells), dtype='int64')
+        grouped = cells.groupby(keys, sort=True)
+        sums = grouped[['count'] + list(SUMS)].sum()
+        result = pd.DataFrame(index=sums.index)
+        result['count'] = sums['count'].astype('int64')
+        result['mean_last_price'] = sums['last_price'] / sums['count']
+        result['mean_price_per_sqm'] = sums['price_per_sqm'] / sums['count']
+        result['price_per_sqm_by_area'] = sums['last_price'] / sums['total_area']
+        if 'median_price_per_sqm' in measures:
+            result['median_price_per_sqm'] = self._medians(cells.index.to_numpy(),
+                                                           grouped.ngroup().to_numpy(), result.index)
+        result = result[result['count'] >= min_count]
+        if by:
+            result = self._decode_missing(result, by)
+        else:
+            result.index = ['all']
+        return result[[measure for measure in MEASURES if measure in measures]]
+
+    def _medians(self, cell_ids, group_ids, index):
+        counts = self.sketch.counts
+        if not len(counts) or not len(cell_ids):
+            return np.full(len(index), np.nan)
+        group_of_cell = np.full(len(self.cells), -1, dtype='int64')
+        group_of_cell[cell_ids] = group_ids
+        groups = group_of_cell[counts.index.get_level_values(0).to_numpy(dtype='int64')]
+        selected = groups >= 0
+        frame = pd.DataFrame({'group': groups[selected],
+                              'value': counts.index.get_level_values(1).to_numpy()[selected],
+                              'count': counts.to_numpy()[selected]})
+        medians = GroupQuantileSketch.from_frame(frame, self.significant_digits).median()
+        return medians.reindex(np.arange(len(index))).to_numpy()
+
+    @staticmethod
+    def _decode_missing(result, by):
+        """Код пропуска в числовых измерениях -> NaN."""
+        if len(by) == 1:
+            values = result.index.to_numpy()
+            if by[0] != 'locality_name':
+                result.index = pd.Index(np.where(values == MISSING, np.nan, values), name=by[0])
+            return result
+        frame = result.index.to_frame(index=False)
+        for name in by:
+            if name != 'locality_name':
+                frame[name] = frame[name].where(frame[name] != MISSING)
+        result.index = pd.MultiIndex.from_frame(frame)
+        return result
+
+    def top(self, n=10, by='locality_name', measure='mean_price_per_sqm', where=None,
+            min_count=1, ascending=False):
+        """``n`` групп с наибольшим (или наименьшим) значением ``measure``."""
+        result = self.query(by, where, min_count=min_count)
+        return result.sort_values(measure, ascending=ascending, kind='stable').head(n)
+
+    def top_price_per_sqm(self, top=10, where=None):
+        """Таблица ``top_price_per_sqm`` исследовательского анализа."""
+        sums = self.query('locality_name', where, measures=('count', 'mean_price_per_sqm'))
+        sums = pd.DataFrame({'sum': sums['mean_price_per_sqm'] * sums['count'], 'count': sums['count']})
+        return top_price_per_sqm(sums, top)
+
+    def spb_data_pivot(self, where=None):
+        """Таблица ``spb_data_pivot``: цена километра до центра Санкт-Петербурга."""
+        result = self.query('city_centers_km', {**(where or {}), 'locality_name': SPB},
+                            measures=('count', 'mean_last_price'))
+        result = result[result.index.notna()]
+        sums = pd.DataFrame({'sum': result['mean_last_price'] * result['count'],
+                             'count': result['count']})
+        return spb_data_pivot(sums)
+
+    # Объединение и сохранение -------------------------------------------
+
+    def merge(self, other):
+        """Новый куб, объединяющий ячейки и гистограммы двух кубов."""
+        cells = pd.concat([self.cells, other.cells], ignore_index=True)
+        cells['locality_name'] = cells['locality_name'].astype(str)
+        grouped = cells.groupby(list(DIMENSIONS), sort=True)
+        ids = grouped.ngroup().to_numpy()
+        merged = grouped[['count'] + list(SUMS)].sum().reset_index()
+        sketch = GroupQuantileSketch(self.significant_digits)
+        for cube, offset in ((self, 0), (other, len(self.cells))):
+            frame = cube.sketch.to_frame()
+            known = frame['value'].notna()
+            frame = frame[known].copy()
+            frame['group'] = ids[offset + frame['group'].to_numpy(dtype='int64')]
+            sketch.merge(GroupQuantileSketch.from_frame(frame, self.significant_digits))
+        return PriceCube(merged, sketch, self.significant_digits)
+
+    def save(self, path=CUBE_PATH):
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        cells = self.cells.copy()
+        cells['locality_name'] = cells['locality_name'].astype('category')
+        write_columns(cells, os.path.join(tmp, 'cells'))
+        write_columns(self.sketch.to_frame(), os.path.join(tmp, 'sketch'))
+        with open(os.path.join(tmp, 'cube.json'), 'w', encoding='utf-8') as f:
+            json.dump({'significant_digits': self.significant_digits}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        with open(os.path.join(path, 'cube.json'), encoding='utf-8') as f:
+            digits = json.load(f)['significant_digits']
+        cells = read_columns(os.path.join(path, 'cells'), mmap=False)
+        for name in DIMENSIONS[1:]:
+            cells[name] = cells[name].astype('int64')
+        for name in ('count',) + SUMS:
+            cells[name] = cells[name].astype('int64' if name == 'count' else 'float64')
+        sketch = GroupQuantileSketch.from_frame(read_columns(os.path.join(path, 'sketch'), mmap=False),
+                                                digits)
+        return cls(cells, sketch, digits)
@@ -0,0 +1,145 @@
+"""Загрузка датасета объявлений с бинарным кэшем.
+
+При первой загрузке TSV разбирается один раз, даты приводятся к datetime,
+населенные пункты -- к категориям, числа -- к компактным типам, и результат
+сохраняется в колоночном формате (см. ``real_estate.columnar``) под ключом
+хэша содержимого исходного файла. Последующие загрузки отображают кэш в
+память. Если исходный файл изменился, хэш меняется и кэш пересобирается.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import urllib.request
+
+import pandas as pd
+
+from real_estate.columnar import read_columns, read_meta, write_columns
+from real_estate.instrument import traced
+
+
+DATA_PATH = '/datasets/real_estate_data.csv'
+DATA_URL = 'https://code.s3.yandex.net/datasets/real_estate_data.csv'
+DATE_COLUMNS = ('first_day_exposition',)
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+CACHE_DIR = os.environ.get('REAL_ESTATE_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'real_estate'))
+SOURCES_FILE = 'sources.json'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_sources(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, SOURCES_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_sources(cache_dir, sources):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = os.path.join(cache_dir, f'{SOURCES_FILE}.tmp-{os.getpid()}')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(sources, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(cache_dir, SOURCES_FILE))
+
+
+def source_hash(path, cache_dir=CACHE_DIR):
+    """Хэш содержимого файла.
+
+    Хэш запоминается вместе с размером и временем изменения файла, поэтому
+    неизменный файл повторно не читается.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    sources = _read_sources(cache_dir)
+    known = sources.get(path)
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known['sha256']
+    digest = file_hash(path)
+    sources[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+    _write_sources(cache_dir, sources)
+    return digest
+
+
+def parse_listings(path, sep='\t'):
+    """Разбирает TSV с объявлениями без кэша."""
+    data = pd.read_csv(path, sep=sep)
+    for column in DATE_COLUMNS:
+        if column in data:
+            data[column] = pd.to_datetime(data[column], format=DATE_FORMAT)
+    if 'locality_name' in data:
+        data['locality_name'] = data['locality_name'].astype('category')
+    return data
+
+
+def download(url=DATA_URL, cache_dir=CACHE_DIR):
+    """Скачивает датасет в каталог кэша и возвращает путь к файлу."""
+    target = os.path.join(cache_dir, 'downloads', os.path.basename(url))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f'{target}.tmp-{os.getpid()}'
+    with urllib.request.urlopen(url) as response, open(tmp, 'wb') as f:
+        shutil.copyfileobj(response, f)
+    os.replace(tmp, target)
+    return target
+
+
+def resolve_source(path=DATA_PATH, url=DATA_URL, cache_dir=CACHE_DIR, offline=False):
+    """Возвращает путь к локальному файлу датасета.
+
+    Если файла нет, он берется из ранее скачанной копии или скачивается по
+    ``url``. В режиме ``offline`` сеть не используется никогда.
+    """
+    if os.path.exists(path):
+        return path
+    downloaded = os.path.join(cache_dir, 'downloads', os.path.basename(url or path))
+    if os.path.exists(downloaded):
+        return downloaded
+    if offline or not url:
+        raise FileNotFoundError(f'Датасет не найден: {path} (офлайн-режим, скачивание отключено)'
+                                if offline else f'Датасет не найден: {path}')
+    return download(url, cache_dir)
+
+
+@traced()
+def load_listings(path=DATA_PATH, url=DATA_URL, cache_dir=CACHE_DIR, offline=False, sep='\t'):
+    """Загружает датасет объявлений через бинарный кэш.
+
+    Кэш хранится в ``cache_dir/<имя файла>-<хэш>``; устаревшие копии того же
+    файла (по абсолютному пути из ``meta.json``, а не только по имени)
+    удаляются при пересборке. Типы столбцов совпадают с ``parse_listings``,
+    кроме дробных столбцов, все значения которых точно представимы в
+    ``float32`` (цена, расстояния в целых метрах): они возвращаются как
+    ``float32``. Целые столбцы остаются ``int64``.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    source = resolve_source(path, url, cache_dir, offline)
+    digest = source_hash(source, cache_dir)
+    name = os.path.splitext(os.path.basename(source))[0]
+    cached = os.path.join(cache_dir, f'{name}-{digest[:16]}')
+    if os.path.exists(os.path.join(cached, 'meta.json')):
+        return read_columns(cached)
+    data = parse_listings(source, sep)
+    source = os.path.abspath(source)
+    stale = re.compile(re.escape(name) + r'-[0-9a-f]{16}')
+    for entry in os.listdir(cache_dir):
+        if stale.fullmatch(entry) and entry != os.path.basename(cached):
+            # Файл с тем же именем в другом каталоге -- другой датасет, его кэш не трогаем.
+            try:
+                owner = read_meta(os.path.join(cache_dir, entry)).get('source')
+            except (OSError, ValueError):
+                continue
+            if owner == source:
+                shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    write_columns(data, cached, extra={'source': source, 'sha256': digest})
+    return read_columns(cached)
@@ -0,0 +1,170 @@
+"""Поиск повторных объявлений об одной и той же квартире.
+
+Одна квартира часто выставляется заново с немного другой ценой или датой.
+Объявления сравниваются не попарно все со всеми, а только внутри блоков --
+групп с одинаковыми каноническим названием населенного пункта, этажом,
+этажностью дома и округленными общей площадью и площадью кухни. Блок и
+дата публикации задают один порядок сортировки; каждое объявление
+сравнивается с ``window`` следующими объявлениями того же блока по цене,
+дате и расстояниям до центра, аэропорта, парков и водоемов. Сортировка --
+O(n log n), сравнения -- O(n * window).
+
+Чтобы площади у границы округления не попадали в разные блоки, проходов
+два: второй -- с сеткой округления, сдвинутой на половину шага. Найденные
+пары объединяются в кластеры (компоненты связности) векторным
+распространением меток.
+
+Пример::
+
+    detector = DuplicateDetector(price_tolerance=0.05)
+    data['duplicate_cluster'] = detector.clusters(data)
+    data = data[~detector.relistings(data)]
+"""
+
+import numpy as np
+import pandas as pd
+
+from real_estate.instrument import traced
+from real_estate.locality import LocalityNormalizer
+
+
+DISTANCE_COLUMNS = ('cityCenters_nearest', 'airports_nearest', 'parks_nearest', 'ponds_nearest')
+# Сдвиги сетки округления площадей в долях шага.
+GRID_SHIFTS = (0.0, 0.5)
+NOT_DUPLICATE = -1
+
+
+def _integer(column):
+    """Целочисленный ключ блока; пропуск -- отдельное значение."""
+    values = column.to_numpy(dtype='float64', na_value=np.nan)
+    return np.where(np.isnan(values), -1, values).astype('int64')
+
+
+def _bins(values, step, shift):
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isnan(values), -1, np.floor(values / step + shift)).astype('int64')
+
+
+def _components(size, left, right):
+    """Метки компонент связности: наименьший номер вершины компоненты."""
+    labels = np.arange(size)
+    while len(left):
+        low = np.minimum(labels[left], labels[right])
+        np.minimum.at(labels, left, low)
+        np.minimum.at(labels, right, low)
+        # Перескок по указателям: метка метки тоже в той же компоненте.
+        labels = labels[labels]
+        pending = labels[left] != labels[right]
+        left, right = left[pending], right[pending]
+    while True:
+        jumped = labels[labels]
+        if np.array_equal(jumped, labels):
+            return labels
+        labels = jumped
+
+
+class DuplicateDetector:
+    """Повторные объявления: блокировка, соседи по дате и кластеры."""
+
+    def __init__(self, area_step=1.0, kitchen_step=1.0, price_tolerance=0.1, max_days=365,
+                 distance_tolerance=100.0, window=8, distance_columns=DISTANCE_COLUMNS,
+                 normalizer=None):
+        self.area_step = area_step
+        self.kitchen_step = kitchen_step
+        # Допустимое относительное изменение цены.
+        self.price_tolerance = price_tolerance
+        self.max_days = max_days
+        # Допустимое расхождение расстояний, м; пропуск совместим с любым значением.
+        self.distance_tolerance = distance_tolerance
+        self.window = window
+        self.distance_columns = tuple(distance_columns)
+        self.normalizer = normalizer or LocalityNormalizer()
+
+    def _arrays(self, data):
+        localities = self.normalizer.transform(data['locality_name'])
+        days = pd.to_datetime(data['first_day_exposition']).to_numpy().astype('datetime64[D]')
+        missing_day = np.isnat(days)
+        days = days.astype('int64')
+        # Значение только для сортировки; совпадения без даты отсекает _match.
+        days[missing_day] = np.iinfo('int64').min // 2
+        return {
+            'locality': localities.cat.codes.to_numpy().astype('int64'),
+            'floor': _integer(data['floor']),
+            'floors_total': _integer(data['floors_total']),
+            'area': data['total_area'].to_numpy(dtype='float64', na_value=np.nan),
+            'kitchen': data['kitchen_area'].to_numpy(dtype='float64', na_value=np.nan),
+            'days': days,
+            'missing_day': missing_day,
+            'price': data['last_price'].to_numpy(dtype='float64', na_value=np.nan),
+            'distances': [data[name].to_numpy(dtype='float64', na_value=np.nan)
+                          for name in self.distance_columns if name in data],
+        }
+
+    def _match(self, arrays, left, right):
+        price_left, price_right = arrays['price'][left], arrays['price'][right]
+        mask = (np.abs(price_left - price_right)
+                <= self.price_tolerance * np.maximum(price_left, price_right))
+        mask &= np.abs(arrays['days'][left] - arrays['days'][right]) <= self.max_days
+        # Объявления без даты не совпадают ни с чем, в том числе друг с другом.
+        mask &= ~(arrays['missing_day'][left] | arrays['missing_day'][right])
+        for values in arrays['distances']:
+            a, b = values[left], values[right]
+            mask &= ~(np.abs(a - b) > self.distance_tolerance)
+        return mask
+
+    def _pairs(self, arrays):
+        """Позиции найденных пар (левая меньше правой)."""
+        found = []
+        size = len(arrays['days'])
+        for shift in GRID_SHIFTS:
+            keys = (arrays['locality'], arrays['floor'], arrays['floors_total'],
+                    _bins(arrays['area'], self.area_step, shift),
+                    _bins(arrays['kitchen'], self.kitchen_step, shift))
+            order = np.lexsort((arrays['days'],) + keys[::-1])
+            sorted_keys = [key[order] for key in keys]
+            for lag in range(1, min(self.window, size - 1) + 1):
+                same_block = np.ones(size - lag, dtype=bool)
+                for key in sorted_keys:
+                    same_block &= key[lag:] == key[:-lag]
+                left, right = order[:-lag][same_block], order[lag:][same_block]
+                keep = self._match(arrays, left, right)
+                found.append(np.sort(np.stack([left[keep], right[keep]]), axis=0))
+        if not found:
+            return np.empty((2, 0), dtype='int64')
+        return np.unique(np.concatenate(found, axis=1), axis=1)
+
+    def pairs(self, data):
+        """Пары повторных объявлений: метки строк, изменение цены и дни между публикациями."""
+        arrays = self._arrays(data)
+        left, right = self._pairs(arrays)
+        return pd.DataFrame({
+            'left': data.index[left], 'right': data.index[right],
+            'price_change': arrays['price'][right] / arrays['price'][left] - 1,
+            'days_between': arrays['days'][right] - arrays['days'][left],
+        })
+
+    def _labels(self, data):
+        arrays = self._arrays(data)
+        left, right = self._pairs(arrays)
+        return _components(len(data), left, right), arrays['days']
+
+    @traced()
+    def clusters(self, data):
+        """Номер кластера повторных объявлений для каждой строки (-1 -- повторов нет)."""
+        labels, _ = self._labels(data)
+        sizes = np.bincount(labels, minlength=len(labels))
+        duplicated = sizes[labels] > 1
+        # Кластеры нумеруются подряд в порядке первой строки.
+        numbers = np.full(len(labels), NOT_DUPLICATE, dtype='int64')
+        numbers[duplicated] = np.unique(labels[duplicated], return_inverse=True)[1]
+        return pd.Series(numbers, index=data.index, name='duplicate_cluster')
+
+    @traced()
+    def relistings(self, data):
+        """Маска повторов: все объявления кластера, кроме самого раннего."""
+        labels, days = self._labels(data)
+        order = np.lexsort((np.arange(len(labels)), days, labels))
+        first = np.r_[True, labels[order][1:] != labels[order][:-1]]
+        mask = np.ones(len(labels), dtype=bool)
+        mask[order[first]] = False
+        return pd.Series(mask, index=data.index, name='is_relisting')
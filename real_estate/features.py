@@ -0,0 +1,57 @@
+"""Расчет добавленных признаков целыми столбцами.
+
+``add_features`` считает price_per_sqm, weekday, month, year, floor_type и
+city_centers_km без построчного ``apply``. Функция принимает как датафрейм,
+так и одно объявление в виде словаря, поэтому используется и при анализе,
+и при оценке новых объявлений.
+"""
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import DATE_FORMAT
+from real_estate.instrument import traced
+
+
+FLOOR_TYPES = ('первый', 'последний', 'другой')
+FLOOR_TYPE_DTYPE = pd.CategoricalDtype(FLOOR_TYPES)
+
+
+def get_floor_type(row):
+    """Тип этажа для одной строки (построчный вариант, оставлен для сравнения)."""
+    if row['floor'] == 1:
+        return 'первый'
+    elif row['floor'] == row['floors_total']:
+        return 'последний'
+    else:
+        return 'другой'
+
+
+def floor_type(floor, floors_total):
+    """Тип этажа для столбцов ``floor`` и ``floors_total`` в виде категорий."""
+    floor = np.asarray(floor, dtype='float64')
+    floors_total = np.asarray(floors_total, dtype='float64')
+    codes = np.where(floor == 1, 0, np.where(floor == floors_total, 1, 2)).astype('int8')
+    return pd.Categorical.from_codes(codes, dtype=FLOOR_TYPE_DTYPE)
+
+
+@traced()
+def add_features(data):
+    """Добавляет признаки к датафрейму или к одному объявлению (словарю)."""
+    if isinstance(data, dict):
+        data = pd.DataFrame([data])
+    else:
+        data = data.copy()
+    # У оцениваемого объявления цены или даты публикации может не быть.
+    if 'last_price' in data:
+        data['price_per_sqm'] = data['last_price'] / data['total_area']
+    if 'first_day_exposition' in data:
+        exposition = data['first_day_exposition']
+        if not pd.api.types.is_datetime64_any_dtype(exposition):
+            exposition = pd.to_datetime(exposition, format=DATE_FORMAT)
+        data['weekday'] = exposition.dt.weekday
+        data['month'] = exposition.dt.month
+        data['year'] = exposition.dt.year
+    data['floor_type'] = floor_type(data['floor'], data['floors_total'])
+    data['city_centers_km'] = (data['cityCenters_nearest'] / 1000).round()
+    return data
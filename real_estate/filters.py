@@ -0,0 +1,143 @@
+"""Фильтрация выбросов по таблице правил.
+
+Все правила проверяются за один проход: для каждого правила считается
+булев столбец нарушений, строки отбираются общей маской один раз, без
+промежуточных копий датафрейма. Вместе с результатом возвращается отчет,
+сколько строк отбросило каждое правило и как правила пересекаются.
+
+Правила можно хранить в JSON и настраивать под регион без правки кода::
+
+    [{"column": "last_price", "op": "<", "value": 60000000}, ...]
+"""
+
+from dataclasses import asdict, dataclass, replace
+import json
+
+import numpy as np
+import pandas as pd
+
+from real_estate.imputation import OPERATORS
+from real_estate.instrument import traced
+
+
+@dataclass(frozen=True)
+class FilterRule:
+    """Строка остается, если ``column <op> value`` (и если значение есть,
+    когда ``keep_missing`` не задан)."""
+
+    column: str
+    op: str
+    value: float
+    keep_missing: bool = False
+
+    @property
+    def name(self):
+        return f'{self.column} {self.op} {self.value:g}'
+
+    def passes(self, data):
+        column = data[self.column]
+        passed = OPERATORS[self.op](column, self.value).to_numpy(dtype=bool, na_value=False)
+        if self.keep_missing:
+            passed = passed | column.isna().to_numpy()
+        return passed
+
+
+OUTLIER_RULES = (
+    FilterRule('total_area', '<', 200),
+    FilterRule('living_area', '<', 150),
+    FilterRule('kitchen_area', '<', 50),
+    FilterRule('last_price', '<', 40000000),
+    FilterRule('rooms', '<', 6),
+    FilterRule('ceiling_height', '<', 5),
+    FilterRule('floor', '<', 25),
+    FilterRule('floors_total', '<', 30),
+    FilterRule('airports_nearest', '<', 70000),
+    FilterRule('parks_nearest', '<', 1500, keep_missing=True),
+)
+
+
+def load_rules(path):
+    with open(path, encoding='utf-8') as f:
+        return tuple(FilterRule(**rule) for rule in json.load(f))
+
+
+def save_rules(rules, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([asdict(rule) for rule in rules], f, ensure_ascii=False, indent=1)
+
+
+def override_rules(rules, **limits):
+    """Возвращает правила с другими границами, например ``last_price=60000000``."""
+    return tuple(replace(rule, value=limits[rule.column]) if rule.column in limits else rule
+                 for rule in rules)
+
+
+@dataclass
+class FilterReport:
+    """Отчет о фильтрации.
+
+    ``failed`` -- сколько строк нарушают правило;
+    ``only`` -- сколько строк отброшены только этим правилом;
+    ``sequential`` -- сколько строк отбросило правило при применении правил
+    по очереди (как в исходном анализе);
+    ``overlap`` -- матрица числа строк, нарушающих одновременно пару правил.
+    """
+
+    rows_in: int
+    rows_out: int
+    rules: tuple
+    failed: np.ndarray
+    only: np.ndarray
+    sequential: np.ndarray
+    overlap: np.ndarray
+
+    @property
+    def dropped(self):
+        return self.rows_in - self.rows_out
+
+    @property
+    def dropped_share(self):
+        return self.dropped / self.rows_in if self.rows_in else 0.0
+
+    def to_frame(self):
+        names = [rule.name for rule in self.rules]
+        rows_before = self.rows_in - np.r_[0, np.cumsum(self.sequential)[:-1]]
+        return pd.DataFrame({
+            'rows_before': rows_before,
+            'dropped': self.sequential,
+            'dropped_share': np.divide(self.sequential, rows_before,
+                                       out=np.zeros(len(names)), where=rows_before > 0),
+            'failed': self.failed,
+            'only': self.only,
+        }, index=pd.Index(names, name='rule'))
+
+    def overlap_frame(self):
+        names = [rule.name for rule in self.rules]
+        return pd.DataFrame(self.overlap, index=names, columns=names)
+
+
+@traced()
+def apply_filters(data, rules=OUTLIER_RULES):
+    """Отбирает строки, проходящие все правила; возвращает (данные, отчет)."""
+    rules = tuple(rules)
+    failed = np.empty((len(data), len(rules)), dtype=bool)
+    for number, rule in enumerate(rules):
+        failed[:, number] = ~rule.passes(data)
+    dropped = failed.any(axis=1)
+    first = np.where(dropped, failed.argmax(axis=1), -1)
+    only = failed & (failed.sum(axis=1) == 1)[:, None]
+    # Пересечения правил считаются по строкам, не прошедшим каждое правило:
+    # таких строк немного, и целочисленная копия всей матрицы не нужна.
+    overlap = np.zeros((len(rules), len(rules)), dtype='int64')
+    for number in range(len(rules)):
+        overlap[number] = np.count_nonzero(failed[failed[:, number]], axis=0)
+    report = FilterReport(
+        rows_in=len(data),
+        rows_out=int(len(data) - dropped.sum()),
+        rules=rules,
+        failed=failed.sum(axis=0),
+        only=only.sum(axis=0),
+        sequential=np.bincount(first[dropped], minlength=len(rules)),
+        overlap=overlap,
+    )
+    return data[~dropped], report
@@ -0,0 +1,185 @@
+"""Значимость признаков для цены: перестановочная и групповая.
+
+Модель цены (``real_estate.model.PriceModel``) обучается на обучающей части
+очищенных данных, а значимость признака -- насколько вырастает средняя
+относительная ошибка (MAPE) на тестовой части, если значения признака
+перемешать. Группы признаков (все расстояния, все площади) перемешиваются
+одной перестановкой, поэтому связи внутри группы сохраняются, а связь с
+ценой разрывается.
+
+Перемешанный столбец создается только для оцениваемого признака: модель
+получает обертку над тестовым датафреймом, которая отдает переставленные
+столбцы, а остальные берет из исходного без копирования. Перестановки
+считаются в пуле процессов; тестовые данные и модель передаются процессу
+один раз, генератор каждой перестановки -- ``default_rng([seed, номер
+признака, повтор])``, поэтому результат не зависит от числа процессов.
+
+С ``by='locality_name'`` значения перемешиваются внутри каждого населенного
+пункта и ошибки считаются по каждому пункту -- все пункты оцениваются
+одними и теми же предсказаниями. Результат кэшируется по хэшу данных и
+параметрам.
+
+Пример::
+
+    report = permutation_importance(data, by='locality_name', repeats=5)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import CACHE_DIR
+from real_estate.model import NUMERIC_FEATURES, PriceModel, split_train_test
+from real_estate.stages import StageCache, package_digest
+
+
+FEATURES = NUMERIC_FEATURES + ('floor_type', 'locality_name', 'year')
+FEATURE_GROUPS = {
+    'расстояния': ('airports_nearest', 'cityCenters_nearest', 'parks_around3000',
+                   'parks_nearest', 'ponds_around3000', 'ponds_nearest'),
+    'площади': ('total_area', 'living_area', 'kitchen_area'),
+}
+IMPORTANCE_DIR = os.path.join(CACHE_DIR, 'importance')
+MIN_GROUP_ROWS = 30
+ALL = 'все'
+
+
+def dataset_hash(data):
+    """Хэш содержимого датафрейма (значения, индекс, столбцы и типы)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[name, str(dtype)] for name, dtype in data.dtypes.items()],
+                             ensure_ascii=False).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class _PermutedFrame:
+    """Датафрейм, в котором столбцы ``columns`` переставлены порядком ``order``.
+
+    Поддерживает то, что нужно модели: ``len``, ``in`` и выбор столбца.
+    """
+
+    def __init__(self, frame, columns, order):
+        self.frame = frame
+        self.columns = set(columns)
+        self.order = order
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __contains__(self, name):
+        return name in self.frame
+
+    def __getitem__(self, name):
+        column = self.frame[name]
+        if name not in self.columns:
+            return column
+        return pd.Series(column.array.take(self.order), index=column.index, name=name)
+
+
+def _within_groups(codes, rng):
+    """Перестановка строк, не выходящая за пределы групп ``codes``."""
+    base = np.argsort(codes, kind='stable')
+    shuffled = np.lexsort((rng.random(len(codes)), codes))
+    order = np.empty(len(codes), dtype='int64')
+    order[base] = shuffled
+    return order
+
+
+def _errors(model, frame, actual):
+    return np.abs(model.predict(frame) - actual) / actual
+
+
+_STATE = {}
+
+
+def _init_worker(model, frame, codes, groups):
+    _STATE.update(model=model, frame=frame, codes=codes, groups=groups,
+                  actual=frame['last_price'].to_numpy(dtype='float64'))
+
+
+def _permutation_task(columns, number, repeat, seed):
+    """Суммы ошибок по группам после одной перестановки столбцов ``columns``."""
+    order = _within_groups(_STATE['codes'], np.random.default_rng([seed, number, repeat]))
+    errors = _errors(_STATE['model'], _PermutedFrame(_STATE['frame'], columns, order),
+                     _STATE['actual'])
+    return np.bincount(_STATE['codes'], weights=errors, minlength=_STATE['groups'])
+
+
+def permutation_importance(data, features=None, groups=FEATURE_GROUPS, by=None, repeats=5,
+                           seed=12345, workers=None, test_share=0.2, alpha=1.0,
+                           min_rows=MIN_GROUP_ROWS, cache=True):
+    """Рост MAPE модели цены при перестановке признаков и групп признаков.
+
+    Возвращает таблицу: (группа ``by``), ``feature``, ``kind`` (признак или
+    группа признаков), ``importance`` -- средний рост MAPE, ``std`` --
+    разброс по повторам, ``baseline`` -- MAPE без перестановки, ``rows`` --
+    число тестовых строк.
+    """
+    features = [name for name in (features or FEATURES) if name in data and name != by]
+    groups = {name: tuple(column for column in columns if column in data and column != by)
+              for name, columns in (groups or {}).items()}
+    params = {'features': features, 'groups': groups, 'by': by, 'repeats': repeats, 'seed': seed,
+              'test_share': test_share, 'alpha': alpha, 'min_rows': min_rows}
+    store = StageCache(IMPORTANCE_DIR) if cache else None
+    key = None
+    if store is not None:
+        key = hashlib.sha256(json.dumps({'data': dataset_hash(data), 'params': params,
+                                         'package': package_digest()},
+                                        sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        if key in store:
+            return store.get(key)
+
+    train, test = split_train_test(data, test_share, seed)
+    model = PriceModel(alpha).fit(train)
+    test = test.reset_index(drop=True)
+    if by is None:
+        codes, names = np.zeros(len(test), dtype='int64'), [ALL]
+    else:
+        codes, names = pd.factorize(test[by].astype(str), sort=True)
+        names = list(names)
+    counts = np.bincount(codes, minlength=len(names))
+    actual = test['last_price'].to_numpy(dtype='float64')
+    baseline = np.bincount(codes, weights=_errors(model, test, actual), minlength=len(names)) / counts
+
+    items = [(name, (name,), 'признак') for name in features]
+    items += [(name, columns, 'группа') for name, columns in groups.items() if columns]
+    tasks = [(columns, number, repeat) for number, (_, columns, _) in enumerate(items)
+             for repeat in range(repeats)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks)) or 1
+    arguments = (model, test, codes, len(names))
+    if workers == 1:
+        _init_worker(*arguments)
+        sums = [_permutation_task(*task, seed) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=arguments) as pool:
+            futures = [pool.submit(_permutation_task, *task, seed) for task in tasks]
+            sums = [future.result() for future in futures]
+    # Повторы × элементы × группы.
+    increase = (np.array(sums).reshape(len(items), repeats, len(names)) / counts
+                - baseline).transpose(1, 0, 2)
+
+    result = pd.DataFrame({
+        'group': np.repeat(np.array(names, dtype=object), len(items)),
+        'feature': [name for name, _, _ in items] * len(names),
+        'kind': [kind for _, _, kind in items] * len(names),
+        'importance': increase.mean(axis=0).T.ravel(),
+        'std': increase.std(axis=0).T.ravel(),
+        'baseline': np.repeat(baseline, len(items)),
+        'rows': np.repeat(counts, len(items)),
+    })
+    result = result[result['rows'] >= min_rows]
+    if by is None:
+        result = result.drop(columns='group')
+        result = result.sort_values('importance', ascending=False)
+    else:
+        result = result.rename(columns={'group': by})
+        result = result.sort_values([by, 'importance'], ascending=[True, False])
+    result = result.reset_index(drop=True)
+    if store is not None:
+        store.put(key, result)
+    return result
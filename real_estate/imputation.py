@@ -0,0 +1,129 @@
+"""Заполнение пропусков групповыми медианами.
+
+Каждое правило заполняет один столбец медианой по группе (по умолчанию по
+населенному пункту) за один сгруппированный проход, а не перебором всех
+населенных пунктов с построением маски по всему датафрейму.
+"""
+
+from dataclasses import dataclass, field
+import operator
+
+import numpy as np
+import pandas as pd
+
+from real_estate.instrument import traced
+
+
+# Сравнения, допустимые в условиях правил.
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Особое значение в цепочке запасных вариантов: медиана групповых медиан.
+MEDIAN_OF_MEDIANS = 'median_of_medians'
+
+
+@dataclass(frozen=True)
+class GroupMedianRule:
+    """Правило заполнения пропусков столбца ``column`` медианой по группе ``by``.
+
+    ``where`` -- необязательное условие вида ``('parks_around3000', '>=', 1)``:
+    заполняются только строки, где оно выполняется.
+    ``fallback`` -- цепочка запасных значений для строк, которые остались
+    пустыми после групповой медианы: ``MEDIAN_OF_MEDIANS`` или константа.
+    """
+
+    column: str
+    by: str = 'locality_name'
+    where: tuple = None
+    fallback: tuple = field(default_factory=tuple)
+
+    def condition(self, data):
+        if self.where is None:
+            return pd.Series(True, index=data.index)
+        column, op, value = self.where
+        return OPERATORS[op](data[column], value)
+
+
+# Правила в том порядке, в котором их применял исходный анализ:
+# условия по parks_nearest / ponds_nearest опираются на уже заполненные
+# parks_around3000 / ponds_around3000.
+LOCALITY_RULES = (
+    GroupMedianRule('airports_nearest', fallback=(MEDIAN_OF_MEDIANS,)),
+    GroupMedianRule('cityCenters_nearest', fallback=(MEDIAN_OF_MEDIANS,)),
+    GroupMedianRule('parks_around3000', fallback=(0,)),
+    GroupMedianRule('parks_nearest', where=('parks_around3000', '>=', 1)),
+    GroupMedianRule('ponds_around3000', fallback=(0,)),
+    GroupMedianRule('ponds_nearest', where=('ponds_around3000', '>=', 1)),
+)
+
+
+class GroupMedianImputer:
+    """Набор правил вместе с посчитанными таблицами медиан.
+
+    После ``fit`` в ``tables`` лежат медианы по группам для каждого столбца,
+    в ``fallbacks`` -- вычисленные запасные значения. Таблицы можно
+    сохранить и применять к новым объявлениям без исходных данных.
+    """
+
+    def __init__(self, rules=LOCALITY_RULES):
+        self.rules = tuple(rules)
+        self.tables = {}
+        self.fallbacks = {}
+
+    @classmethod
+    def from_tables(cls, tables, rules=LOCALITY_RULES):
+        """Собирает импьютер из готовых таблиц медиан (например, из скетчей)."""
+        imputer = cls(rules)
+        imputer.tables = {column: pd.Series(table, dtype='float64')
+                          for column, table in tables.items()}
+        imputer.fallbacks = {rule.column: imputer._resolve_fallback(rule)
+                             for rule in imputer.rules}
+        return imputer
+
+    @traced()
+    def fit(self, data):
+        for rule in self.rules:
+            self.tables[rule.column] = (data
+                                        .groupby(rule.by, observed=True, sort=False)[rule.column]
+                                        .median())
+            self.fallbacks[rule.column] = self._resolve_fallback(rule)
+        return self
+
+    def _resolve_fallback(self, rule):
+        values = []
+        for value in rule.fallback:
+            if value == MEDIAN_OF_MEDIANS:
+                value = self.tables[rule.column].median()
+            values.append(value)
+        return tuple(values)
+
+    @traced()
+    def transform(self, data):
+        data = data.copy()
+        for rule in self.rules:
+            condition = rule.condition(data).to_numpy(dtype=bool)
+            values = data[rule.column].to_numpy(dtype='float64', na_value=np.nan, copy=True)
+            missing = np.isnan(values) & condition
+            if not missing.any():
+                continue
+            groups = data[rule.by].to_numpy()[missing]
+            values[missing] = pd.Series(groups).map(self.tables[rule.column]).to_numpy(dtype='float64')
+            for value in self.fallbacks[rule.column]:
+                values[np.isnan(values) & condition] = value
+            data[rule.column] = values
+        return data
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+
+@traced()
+def fill_group_medians(data, rules=LOCALITY_RULES):
+    """Заполняет пропуски по всем правилам и возвращает новый датафрейм."""
+    return GroupMedianImputer(rules).fit_transform(data)
@@ -0,0 +1,312 @@
+"""Ежедневное инкрементальное обновление статистик и сводных таблиц.
+
+Каждый день приходит несколько тысяч новых объявлений. Чтобы не
+перечитывать и не очищать заново весь архив, ``IncrementalState`` хранит на
+диске объединяемое состояние:
+
+- гистограммы ``StreamStatistics`` для медиан заполнения пропусков;
+- гистограмму, сумму и число значений price_per_sqm по населенным пунктам
+  (сводная таблица ``top_price_per_sqm``);
+- сумму и число значений last_price по city_centers_km в Санкт-Петербурге
+  (таблица ``spb_data_pivot``);
+- словарь нормализации названий населенных пунктов.
+
+``update`` добавляет новую порцию к гистограммам, очищает только эту порцию
+по обновленным медианам и добавляет ее к суммам. Время обновления зависит от
+размера порции и числа различных значений в гистограммах, но не от размера
+архива. Уже обработанные объявления не переочищаются, поэтому при сдвиге
+медиан сводные таблицы могут немного отличаться от полной пересборки;
+величину расхождения показывает ``consistency_check``.
+
+Запуск::
+
+    python -m real_estate.incremental new_listings.csv
+"""
+
+import argparse
+from dataclasses import dataclass, field
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from real_estate.cleaning import clean, clean_chunk
+from real_estate.columnar import read_columns, write_columns
+from real_estate.dataset import CACHE_DIR
+from real_estate.imputation import LOCALITY_RULES
+from real_estate.locality import LocalityNormalizer
+from real_estate.sketches import GroupQuantileSketch
+from real_estate.streaming import StreamStatistics
+
+
+SPB = 'Санкт-Петербург'
+STATE_DIR = os.path.join(CACHE_DIR, 'incremental')
+STATE_FILE = 'state.json'
+
+
+def _accumulate(table, keys, values):
+    """Добавляет к таблице (sum, count) суммы и число непустых значений по ключам."""
+    values = pd.Series(np.asarray(values, dtype='float64'))
+    batch = pd.DataFrame({'sum': values.fillna(0).to_numpy(),
+                          'count': values.notna().to_numpy().astype('int64')})
+    batch = batch.groupby(np.asarray(keys)).sum()
+    if len(table):
+        batch = table.add(batch, fill_value=0)
+    batch['count'] = batch['count'].astype('int64')
+    return batch
+
+
+def _empty_sums():
+    return pd.DataFrame({'sum': pd.Series(dtype='float64'), 'count': pd.Series(dtype='int64')})
+
+
+def top_price_per_sqm(locality_sums, top=10):
+    """Таблица ``top_price_per_sqm`` по суммам и числу значений price_per_sqm."""
+    table = pd.DataFrame({
+        'price_per_sqm': (locality_sums['sum'] / locality_sums['count']).round(),
+        'count': locality_sums['count'],
+    }).rename_axis('locality_name')
+    return table.sort_values(by='price_per_sqm', ascending=False).head(top)
+
+
+def spb_data_pivot(spb_sums):
+    """Таблица ``spb_data_pivot`` по суммам и числу значений last_price."""
+    pivot = (spb_sums['sum'] / spb_sums['count']).round(2).rename('last_price')
+    pivot = pivot.rename_axis('city_centers_km').to_frame().sort_index()
+    pivot['mean_price_per_km'] = (pivot['last_price'] / pivot.index).round(2)
+    if 0 in pivot.index:
+        pivot.loc[0, 'mean_price_per_km'] = pivot.loc[0, 'last_price']
+    pivot['city_centers_km'] = pivot.index
+    return pivot
+
+
+def _relative_difference(actual, expected):
+    """Наибольшее относительное расхождение; ключ, которого нет с одной из сторон, -- inf."""
+    actual, expected = actual.align(expected, join='outer')
+    if actual.isna().ne(expected.isna()).any():
+        return float('inf')
+    known = expected.notna() & (expected != 0)
+    if not known.any():
+        return 0.0
+    return float(((actual[known] - expected[known]).abs() / expected[known].abs()).max())
+
+
+@dataclass
+class ConsistencyReport:
+    """Расхождение инкрементального состояния с полной пересборкой."""
+
+    rows_incremental: int
+    rows_full: int
+    differences: dict = field(default_factory=dict)
+    tolerance: float = 0.01
+
+    @property
+    def ok(self):
+        return (self.rows_incremental == self.rows_full
+                and all(value <= self.tolerance for value in self.differences.values()))
+
+    def to_frame(self):
+        frame = pd.Series(self.differences, name='max_relative_difference').to_frame()
+        frame['ok'] = frame['max_relative_difference'] <= self.tolerance
+        return frame
+
+
+class IncrementalState:
+    """Объединяемое состояние архива объявлений для ежедневных обновлений."""
+
+    def __init__(self, rules=LOCALITY_RULES, normalizer=None, significant_digits=5):
+        self.rules = tuple(rules)
+        self.significant_digits = significant_digits
+        self.statistics = StreamStatistics(self.rules, significant_digits)
+        self.normalizer = normalizer or LocalityNormalizer()
+        self.locality_sketch = GroupQuantileSketch(significant_digits)
+        self.locality_sums = _empty_sums()
+        self.spb_sums = _empty_sums()
+        self.rows_in = 0
+        self.rows_out = 0
+
+    # Обновление ----------------------------------------------------------
+
+    def update(self, raw):
+        """Добавляет порцию новых сырых объявлений и возвращает ее очищенной."""
+        self.statistics.update(raw)
+        cleaned = clean_chunk(raw, self.statistics.medians(), self.statistics.imputer(),
+                              normalizer=self.normalizer)
+        locality = cleaned['locality_name'].astype(str).to_numpy()
+        self.locality_sketch.update(locality, cleaned['price_per_sqm'])
+        self.locality_sums = _accumulate(self.locality_sums, locality, cleaned['price_per_sqm'])
+        spb = locality == SPB
+        self.spb_sums = _accumulate(self.spb_sums,
+                                    cleaned['city_centers_km'].to_numpy(dtype='float64')[spb],
+                                    cleaned['last_price'].to_numpy(dtype='float64')[spb])
+        self.rows_in += len(raw)
+        self.rows_out += len(cleaned)
+        return cleaned
+
+    @classmethod
+    def build(cls, raw, rules=LOCALITY_RULES, normalizer=None, chunksize=None):
+        """Состояние по всему архиву; ``chunksize`` -- добавлять его порциями."""
+        state = cls(rules, normalizer)
+        if chunksize is None:
+            state.update(raw)
+        else:
+            for start in range(0, len(raw), chunksize):
+                state.update(raw.iloc[start:start + chunksize])
+        return state
+
+    # Заполнение пропусков ------------------------------------------------
+
+    def medians(self):
+        return self.statistics.medians()
+
+    def imputer(self):
+        return self.statistics.imputer()
+
+    # Сводные таблицы -----------------------------------------------------
+
+    def locality_mean_price_per_sqm(self):
+        table = self.locality_sums
+        return (table['sum'] / table['count']).rename_axis('locality_name').rename('price_per_sqm')
+
+    def locality_median_price_per_sqm(self):
+        return self.locality_sketch.median().rename_axis('locality_name').rename('price_per_sqm')
+
+    def top_price_per_sqm(self, top=10):
+        """Населенные пункты с самой высокой средней ценой квадратного метра."""
+        return top_price_per_sqm(self.locality_sums, top)
+
+    def spb_mean_price_by_km(self):
+        table = self.spb_sums
+        return (table['sum'] / table['count']).rename_axis('city_centers_km').rename('last_price')
+
+    def spb_data_pivot(self):
+        """Средняя цена квартиры в Санкт-Петербурге по удаленности от центра."""
+        return spb_data_pivot(self.spb_sums)
+
+    # Проверка ------------------------------------------------------------
+
+    def consistency_check(self, raw, tolerance=0.01):
+        """Сравнивает состояние с полной пересборкой по всему архиву ``raw``.
+
+        ``raw`` -- все объявления, добавленные в состояние. Полная пересборка
+        очищает их заново по точным медианам, как исследовательский анализ.
+        """
+        normalizer = LocalityNormalizer(self.normalizer.patterns, self.normalizer.replacement)
+        data = clean(raw, self.rules, normalizer=normalizer)
+        locality = data['locality_name'].astype(str)
+        spb = data[locality == SPB]
+        located = raw.dropna(subset=['locality_name'])
+        differences = {
+            'price_per_sqm_mean': _relative_difference(
+                self.locality_mean_price_per_sqm(),
+                data['price_per_sqm'].groupby(locality.to_numpy()).mean()),
+            'price_per_sqm_median': _relative_difference(
+                self.locality_median_price_per_sqm(),
+                data['price_per_sqm'].groupby(locality.to_numpy()).median()),
+            'spb_last_price_by_km': _relative_difference(
+                self.spb_mean_price_by_km(),
+                spb['last_price'].astype('float64').groupby(spb['city_centers_km']).mean()),
+        }
+        medians = self.medians()
+        for column in medians:
+            differences[f'median_{column}'] = _relative_difference(
+                pd.Series([medians[column]]), pd.Series([raw[column].median()]))
+        tables = self.imputer().tables
+        for rule in self.rules:
+            differences[f'median_{rule.column}_by_{rule.by}'] = _relative_difference(
+                tables[rule.column], located.groupby(rule.by)[rule.column].median())
+        return ConsistencyReport(self.rows_out, len(data), differences, tolerance)
+
+    # Сохранение ----------------------------------------------------------
+
+    def _tables(self):
+        tables = {f'global-{column}': sketch.to_frame()
+                  for column, sketch in self.statistics.global_sketches.items()}
+        tables.update({f'group-{column}': sketch.to_frame()
+                       for column, sketch in self.statistics.group_sketches.items()})
+        tables['locality-sketch'] = self.locality_sketch.to_frame()
+        tables['locality-sums'] = self.locality_sums.rename_axis('key').reset_index()
+        tables['spb-sums'] = self.spb_sums.rename_axis('key').reset_index()
+        return tables
+
+    def save(self, path=STATE_DIR):
+        """Записывает состояние в каталог ``path`` атомарно."""
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, table in self._tables().items():
+            write_columns(table, os.path.join(tmp, name))
+        self.normalizer.save(os.path.join(tmp, 'locality_names.json'))
+        with open(os.path.join(tmp, STATE_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'significant_digits': self.significant_digits,
+                       'rows': self.statistics.rows,
+                       'rows_in': self.rows_in, 'rows_out': self.rows_out}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path=STATE_DIR, rules=LOCALITY_RULES):
+        with open(os.path.join(path, STATE_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        digits = meta['significant_digits']
+        state = cls(rules, LocalityNormalizer.load(os.path.join(path, 'locality_names.json')), digits)
+
+        def table(name):
+            frame = read_columns(os.path.join(path, name), mmap=False)
+            # Ключи групп возвращаются строками, а не категориями, чтобы при
+            # объединении с новыми порциями не появлялись неиспользуемые категории.
+            for column in ('group', 'key'):
+                if column in frame and isinstance(frame[column].dtype, pd.CategoricalDtype):
+                    frame[column] = frame[column].astype(str)
+            return frame
+
+        def sketch(name):
+            return GroupQuantileSketch.from_frame(table(name), digits)
+
+        def sums(name):
+            frame = table(name).set_index('key').rename_axis(None)
+            if pd.api.types.is_float_dtype(frame.index):
+                # Расстояния записываются компактно (float32), в состоянии они float64.
+                frame.index = frame.index.astype('float64')
+            return frame.astype({'sum': 'float64', 'count': 'int64'})
+
+        statistics = state.statistics
+        statistics.rows = meta['rows']
+        for column in statistics.global_sketches:
+            statistics.global_sketches[column] = sketch(f'global-{column}')
+        for column in statistics.group_sketches:
+            statistics.group_sketches[column] = sketch(f'group-{column}')
+        state.locality_sketch = sketch('locality-sketch')
+        state.locality_sums = sums('locality-sums')
+        state.spb_sums = sums('spb-sums')
+        state.rows_in, state.rows_out = meta['rows_in'], meta['rows_out']
+        return state
+
+    @classmethod
+    def load_or_create(cls, path=STATE_DIR, rules=LOCALITY_RULES):
+        if os.path.exists(os.path.join(path, STATE_FILE)):
+            return cls.load(path, rules)
+        return cls(rules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ежедневное обновление статистик по новым объявлениям')
+    parser.add_argument('paths', nargs='+', help='TSV с новыми объявлениями')
+    parser.add_argument('--state', default=STATE_DIR, help='каталог с состоянием')
+    parser.add_argument('--sep', default='\t')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    state = IncrementalState.load_or_create(args.state)
+    for path in args.paths:
+        cleaned = state.update(pd.read_csv(path, sep=args.sep))
+        print(f'{path}: добавлено {len(cleaned)} объявлений, всего {state.rows_out}')
+    state.save(args.state)
+    print(state.top_price_per_sqm(args.top))
+
+
+if __name__ == '__main__':
+    main()
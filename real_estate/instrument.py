@@ -0,0 +1,323 @@
+"""Замеры этапов обработки: время, память и число строк.
+
+Для каждого этапа (``Tracer.stage`` или функции с декоратором ``traced``)
+записываются время по часам и процессорное время, RSS до и после этапа и
+его пик, число строк на входе и выходе и, если включено отслеживание
+выделений (``allocations=True``), пик памяти, выделенной во время этапа
+(tracemalloc). Этапы вкладываются друг в друга, путь этапа -- имена через
+``/``.
+
+Трассировка выключена по умолчанию (или включается переменной окружения
+``REAL_ESTATE_TRACE=1``); в выключенном состоянии декоратор стоит одной
+проверки флага. Результат выгружается в JSON в формате Chrome trace
+(открывается в chrome://tracing и Perfetto) вместе со списком этапов, а
+``summary`` печатает дерево этапов с долями времени. ``folded`` дает
+свернутые стеки для flamegraph.pl.
+
+Пример::
+
+    tracer = enable()
+    data = clean(raw)
+    tracer.save('trace.json')
+    print(tracer.summary())
+"""
+
+from contextlib import contextmanager
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+TRACE_PATH = 'trace.json'
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Текущий RSS процесса в байтах (None, если узнать нельзя)."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss():
+    """Пик RSS процесса в байтах с последнего сброса."""
+    try:
+        with open('/proc/self/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def reset_peak_rss():
+    """Сбрасывает пик RSS (только Linux); возвращает, удалось ли."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    if isinstance(value, tuple) and value and isinstance(value[0], (pd.DataFrame, pd.Series)):
+        return len(value[0])
+    return None
+
+
+class Span:
+    """Замер одного этапа."""
+
+    __slots__ = ('name', 'path', 'depth', 'start', 'wall', 'cpu', 'rows_in', 'rows_out',
+                 'rss_before', 'rss_after', 'peak_rss', 'allocated', '_cpu_start',
+                 '_child_peak', '_child_allocated', '_traced_start')
+
+    def __init__(self, name, path, depth, rows_in=None):
+        self.name = name
+        self.path = path
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.start = self.wall = self.cpu = None
+        self.rss_before = self.rss_after = self.peak_rss = self.allocated = None
+        self._cpu_start = None
+        self._child_peak = 0
+        self._child_allocated = 0
+        self._traced_start = 0
+
+    def done(self, value):
+        """Запоминает число строк результата и возвращает его без изменений."""
+        rows = _rows(value)
+        if rows is not None:
+            self.rows_out = rows
+        return value
+
+    def to_dict(self):
+        rss_delta = (self.rss_after - self.rss_before
+                     if self.rss_after is not None and self.rss_before is not None else None)
+        return {'name': self.name, 'path': self.path, 'depth': self.depth, 'start': self.start,
+                'wall_seconds': self.wall, 'cpu_seconds': self.cpu,
+                'rows_in': self.rows_in, 'rows_out': self.rows_out,
+                'rss_before_bytes': self.rss_before, 'rss_after_bytes': self.rss_after,
+                'rss_delta_bytes': rss_delta, 'peak_rss_bytes': self.peak_rss,
+                'allocated_bytes': self.allocated}
+
+
+class _NullSpan:
+    rows_out = None
+
+    def done(self, value):
+        return value
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Собирает замеры этапов текущего процесса."""
+
+    def __init__(self, enabled=False, allocations=False):
+        self.enabled = False
+        self.allocations = False
+        self.spans = []
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        if enabled:
+            self.enable(allocations)
+
+    def enable(self, allocations=False):
+        self.enabled = True
+        self.allocations = allocations
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def disable(self):
+        self.enabled = False
+        if self.allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.allocations = False
+        return self
+
+    def reset(self):
+        self.spans = []
+        self._origin = time.perf_counter()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Замеряет блок кода; ``rows`` -- число строк или датафрейм на входе.
+
+        Выходное число строк задается через ``span.done(result)``.
+        """
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        path = f'{parent.path}/{name}' if parent else name
+        span = Span(name, path, len(stack), rows if rows is None or isinstance(rows, int) else _rows(rows))
+        if parent is not None:
+            # Пики сбрасываются в начале этапа; то, что родитель успел
+            # набрать до этого, сохраняется в нем.
+            parent._child_peak = max(parent._child_peak, peak_rss() or 0)
+            if self.allocations:
+                parent._child_allocated = max(parent._child_allocated,
+                                              tracemalloc.get_traced_memory()[1] - parent._traced_start)
+        stack.append(span)
+        span.rss_before = current_rss()
+        reset_peak_rss()
+        if self.allocations:
+            span._traced_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        span.start = time.perf_counter() - self._origin
+        span._cpu_start = time.process_time()
+        try:
+            yield span
+        finally:
+            span.wall = time.perf_counter() - self._origin - span.start
+            span.cpu = time.process_time() - span._cpu_start
+            span.rss_after = current_rss()
+            # Пик этапа -- максимум из собственного замера и пиков, сохраненных
+            # перед вложенными этапами и в них.
+            span.peak_rss = max(peak_rss() or 0, span._child_peak) or None
+            if self.allocations:
+                peak = tracemalloc.get_traced_memory()[1] - span._traced_start
+                span.allocated = max(peak, span._child_allocated, 0)
+            stack.pop()
+            if parent is not None:
+                parent._child_peak = max(parent._child_peak, span.peak_rss or 0)
+                if self.allocations:
+                    # Пик вложенного этапа -- относительно его начала; для
+                    # родителя добавляется то, что было выделено до него.
+                    offset = span._traced_start - parent._traced_start
+                    parent._child_allocated = max(parent._child_allocated, offset + span.allocated)
+            self.spans.append(span)
+
+    def trace(self, name=None):
+        """Декоратор: этап -- вызов функции, строки -- первого датафрейма аргументов и результата."""
+        def decorate(func):
+            stage_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                rows = next((_rows(arg) for arg in args if _rows(arg) is not None), None)
+                with self.stage(stage_name, rows) as span:
+                    return span.done(func(*args, **kwargs))
+            return wrapper
+        return decorate
+
+    # Отчеты --------------------------------------------------------------
+
+    def records(self):
+        """Этапы в порядке начала."""
+        return [span.to_dict() for span in sorted(self.spans, key=lambda span: span.start)]
+
+    def to_chrome_trace(self):
+        events = [{'name': span.name, 'cat': 'stage', 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                   'ts': round(span.start * 1e6), 'dur': round(span.wall * 1e6),
+                   'args': {key: value for key, value in span.to_dict().items()
+                            if key not in ('name', 'start', 'depth')}}
+                  for span in self.spans]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'spans': self.records()}
+
+    def save(self, path=TRACE_PATH):
+        tmp = f'{path}.tmp-{os.getpid()}'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    def _tree(self):
+        """Суммы по путям этапов в порядке первого появления."""
+        tree = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            node = tree.setdefault(span.path, {'name': span.name, 'depth': span.depth, 'calls': 0,
+                                               'wall': 0.0, 'cpu': 0.0, 'rows_in': None,
+                                               'rows_out': None, 'rss_delta': 0, 'peak_rss': 0,
+                                               'allocated': None})
+            node['calls'] += 1
+            node['wall'] += span.wall
+            node['cpu'] += span.cpu
+            for key, value in (('rows_in', span.rows_in), ('rows_out', span.rows_out),
+                               ('allocated', span.allocated)):
+                if value is not None:
+                    node[key] = (node[key] or 0) + value if key != 'allocated' else max(node[key] or 0, value)
+            if span.rss_after is not None and span.rss_before is not None:
+                node['rss_delta'] += span.rss_after - span.rss_before
+            node['peak_rss'] = max(node['peak_rss'], span.peak_rss or 0)
+        return tree
+
+    def summary(self, width=30):
+        """Дерево этапов: время, доля от общего времени, строки и память."""
+        tree = self._tree()
+        total = sum(node['wall'] for node in tree.values() if node['depth'] == 0) or 1
+        lines = [f'{"этап":<36}{"вызовы":>7}{"время, с":>10}{"CPU, с":>9}{"строки":>21}'
+                 f'{"ΔRSS, МБ":>10}{"пик RSS, МБ":>13}'
+                 + (f'{"выделено, МБ":>14}' if self.allocations else '')]
+        for node in tree.values():
+            rows = (f'{node["rows_in"] if node["rows_in"] is not None else "":>9} -> '
+                    f'{node["rows_out"] if node["rows_out"] is not None else "":<8}')
+            bar = '█' * round(width * node['wall'] / total)
+            allocated = ('' if not self.allocations else
+                         f'{(node["allocated"] or 0) / 2**20:14.1f}')
+            lines.append(f'{"  " * node["depth"] + node["name"]:<36.36}{node["calls"]:>7}'
+                         f'{node["wall"]:10.3f}{node["cpu"]:9.3f}{rows:>21}'
+                         f'{node["rss_delta"] / 2**20:10.1f}{node["peak_rss"] / 2**20:13.1f}'
+                         f'{allocated}  {bar}')
+        return '\n'.join(lines)
+
+    def folded(self):
+        """Свернутые стеки (``a;b;c микросекунды``) собственного времени этапов."""
+        tree = self._tree()
+        own = {path: node['wall'] for path, node in tree.items()}
+        for path, node in tree.items():
+            parent = path.rpartition('/')[0]
+            if parent in own:
+                own[parent] -= node['wall']
+        return '\n'.join(f'{path.replace("/", ";")} {max(0, round(seconds * 1e6))}'
+                         for path, seconds in own.items())
+
+
+TRACER = Tracer(enabled=os.environ.get('REAL_ESTATE_TRACE', '') not in ('', '0'))
+
+
+def traced(name=None):
+    """Декоратор этапа для общего трассировщика ``TRACER``."""
+    return TRACER.trace(name)
+
+
+def stage(name, rows=None):
+    """Блок кода как этап общего трассировщика."""
+    return TRACER.stage(name, rows)
+
+
+def enable(allocations=False):
+    """Включает общий трассировщик и возвращает его."""
+    return TRACER.enable(allocations)
+
+
+def disable():
+    return TRACER.disable()
@@ -0,0 +1,113 @@
+"""Нормализация названий населенных пунктов.
+
+Разных названий всего несколько сотен, поэтому регулярные выражения
+применяются только к уникальным названиям, а не к каждой строке.
+Результат -- словарь «исходное название -> каноническое», который
+сохраняется в JSON и применяется к столбцу как перекодировка категорий.
+При оценке новых объявлений нормализация сводится к поиску в словаре.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import CACHE_DIR
+from real_estate.instrument import traced
+
+
+# Разные написания типов поселков, которые приводятся к слову «поселок».
+# Порядок важен: длинные написания заменяются раньше короткого «посёлок».
+LOCALITY_PATTERNS = ('коттеджный посёлок', 'посёлок городского типа',
+                     'городской поселок', 'поселок городского типа',
+                     'городской посёлок', 'посёлок при железнодорожной станции',
+                     'посёлок')
+LOCALITY_REPLACEMENT = 'поселок'
+
+LOCALITY_MAP_PATH = os.path.join(CACHE_DIR, 'locality_names.json')
+
+
+class LocalityNormalizer:
+    """Словарь канонических названий населенных пунктов."""
+
+    def __init__(self, patterns=LOCALITY_PATTERNS, replacement=LOCALITY_REPLACEMENT, mapping=None):
+        self.patterns = tuple(dict.fromkeys(patterns))
+        self.replacement = replacement
+        self.mapping = dict(mapping or {})
+        self._compiled = [re.compile(pattern) for pattern in self.patterns]
+
+    def canonical(self, name):
+        """Каноническое название без обращения к словарю."""
+        for pattern in self._compiled:
+            name = pattern.sub(self.replacement, name)
+        return name
+
+    def normalize(self, name):
+        """Каноническое название одного населенного пункта (с пополнением словаря)."""
+        if name not in self.mapping:
+            self.mapping[name] = self.canonical(name)
+        return self.mapping[name]
+
+    def fit(self, names):
+        for name in pd.unique(pd.Series(names).dropna().astype(str)):
+            self.normalize(name)
+        return self
+
+    @traced()
+    def transform(self, names):
+        """Возвращает столбец канонических названий в виде категорий.
+
+        Регулярные выражения применяются только к названиям, которых еще нет
+        в словаре; строки перекодируются через коды категорий.
+        """
+        names = pd.Series(names)
+        if not isinstance(names.dtype, pd.CategoricalDtype):
+            names = names.astype('category')
+        categories = [str(name) for name in names.cat.categories]
+        canonical = [self.normalize(name) for name in categories]
+        new_categories = sorted(set(canonical))
+        position = {name: number for number, name in enumerate(new_categories)}
+        remap = np.array([position[name] for name in canonical] + [-1], dtype='int32')
+        # Код -1 (пропуск) указывает на последний элемент remap и остается -1.
+        codes = remap[names.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=new_categories),
+                         index=names.index, name=names.name)
+
+    @traced()
+    def fit_transform(self, names):
+        return self.fit(names).transform(names)
+
+    def save(self, path=LOCALITY_MAP_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f'{path}.tmp-{os.getpid()}'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'patterns': list(self.patterns), 'replacement': self.replacement,
+                       'mapping': self.mapping}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path=LOCALITY_MAP_PATH):
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        return cls(state['patterns'], state['replacement'], state['mapping'])
+
+    @classmethod
+    def load_or_create(cls, path=LOCALITY_MAP_PATH, patterns=LOCALITY_PATTERNS):
+        """Загружает словарь; если его нет или список написаний изменился -- создает новый."""
+        if os.path.exists(path):
+            normalizer = cls.load(path)
+            if normalizer.patterns == tuple(dict.fromkeys(patterns)):
+                return normalizer
+        return cls(patterns)
+
+
+@traced()
+def normalize_locality_names(data, normalizer=None):
+    """Заменяет столбец ``locality_name`` каноническими названиями."""
+    normalizer = normalizer or LocalityNormalizer()
+    data = data.copy()
+    data['locality_name'] = normalizer.transform(data['locality_name'])
+    return data
@@ -0,0 +1,199 @@
+"""Модель рыночной стоимости квартиры.
+
+Линейная модель с L2-регуляризацией (гребневая регрессия) предсказывает
+логарифм цены квадратного метра по площадям, комнатам, высоте потолков,
+расстояниям, паркам и водоемам, типу этажа, населенному пункту и году
+публикации. Цена квартиры -- экспонента прогноза, умноженная на площадь.
+
+Обучение -- решение одной системы линейных уравнений, поэтому модель
+полностью воспроизводится по тем же данным. Предсказание для пакета
+объявлений -- одно матричное умножение и поиск весов категорий по кодам,
+без циклов по строкам.
+"""
+
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from real_estate.cleaning import clean
+from real_estate.dataset import CACHE_DIR
+from real_estate.features import FLOOR_TYPES, floor_type
+from real_estate.instrument import traced
+
+
+NUMERIC_FEATURES = (
+    'total_area', 'living_area', 'kitchen_area', 'rooms', 'ceiling_height',
+    'floors_total', 'airports_nearest', 'cityCenters_nearest',
+    'parks_around3000', 'parks_nearest', 'ponds_around3000', 'ponds_nearest',
+    'month',
+)
+# Признаки, наличие значения в которых само по себе информативно
+# (парк или водоем в пределах 3 км).
+MISSING_INDICATORS = ('parks_nearest', 'ponds_nearest')
+OTHER_LOCALITY = 'другой'
+
+MODEL_PATH = os.path.join(CACHE_DIR, 'price_model.npz')
+
+
+def _categories(values, categories):
+    """Коды значений в списке ``categories``; неизвестные значения -- -1."""
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        mapping = pd.Index(categories).get_indexer(values.cat.categories.astype(str))
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, mapping[codes], -1)
+    return pd.Index(categories).get_indexer(values.astype(str))
+
+
+def numeric_matrix(frame):
+    """Числовые признаки модели и индикаторы пропусков (пропуски -- NaN)."""
+    # Отсутствующий у объявления признак заполняется так же, как пропуск.
+    missing = np.full(len(frame), np.nan)
+    values = np.column_stack([frame[column].to_numpy(dtype='float64', na_value=np.nan)
+                              if column in frame else missing
+                              for column in NUMERIC_FEATURES])
+    indicators = np.column_stack([np.isnan(values[:, NUMERIC_FEATURES.index(column)])
+                                  for column in MISSING_INDICATORS])
+    return np.hstack([values, indicators.astype('float64')])
+
+
+def floor_codes(frame):
+    """Коды типа этажа в ``FLOOR_TYPES``."""
+    if 'floor_type' in frame:
+        return _categories(frame['floor_type'], FLOOR_TYPES)
+    return floor_type(frame['floor'], frame['floors_total']).codes
+
+
+class PriceModel:
+    """Гребневая регрессия log(price_per_sqm) с категориальными признаками."""
+
+    def __init__(self, alpha=1.0, min_locality_rows=20):
+        self.alpha = alpha
+        self.min_locality_rows = min_locality_rows
+
+    # Признаки ------------------------------------------------------------
+
+    def _numeric(self, frame):
+        return numeric_matrix(frame)
+
+    def _floor_codes(self, frame):
+        return floor_codes(frame)
+
+    def _locality_codes(self, frame):
+        codes = _categories(frame['locality_name'], self.localities)
+        return np.where(codes >= 0, codes, len(self.localities) - 1)
+
+    def _year_codes(self, frame):
+        if 'year' not in frame:
+            return np.full(len(frame), len(self.years) - 1)
+        years = frame['year'].to_numpy(dtype='float64')
+        codes = np.searchsorted(self.years, years)
+        return np.clip(codes, 0, len(self.years) - 1)
+
+    # Обучение ------------------------------------------------------------
+
+    @traced()
+    def fit(self, data):
+        """Обучает модель на очищенных данных с добавленными признаками."""
+        counts = data['locality_name'].astype(str).value_counts()
+        self.localities = sorted(counts[counts >= self.min_locality_rows].index) + [OTHER_LOCALITY]
+        self.years = np.unique(data['year'].to_numpy(dtype='float64'))
+
+        numeric = self._numeric(data)
+        # Признак, у которого нет ни одного значения (в поселках нет расстояний),
+        # заполняется нулем: столбец постоянный и получает нулевой вес.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            self.fill = np.nan_to_num(np.nanmean(numeric, axis=0), nan=0.0)
+        numeric = np.where(np.isnan(numeric), self.fill, numeric)
+        self.mean = numeric.mean(axis=0)
+        self.scale = numeric.std(axis=0)
+        self.scale[self.scale == 0] = 1
+        standardized = (numeric - self.mean) / self.scale
+
+        blocks = [standardized]
+        for codes, size in ((self._floor_codes(data), len(FLOOR_TYPES)),
+                            (self._locality_codes(data), len(self.localities)),
+                            (self._year_codes(data), len(self.years))):
+            one_hot = np.zeros((len(data), size))
+            one_hot[np.arange(len(data)), codes] = 1
+            blocks.append(one_hot)
+        design = np.hstack([np.ones((len(data), 1))] + blocks)
+        target = np.log(data['last_price'].to_numpy(dtype='float64')
+                        / data['total_area'].to_numpy(dtype='float64'))
+
+        penalty = self.alpha * np.eye(design.shape[1])
+        penalty[0, 0] = 0
+        weights = np.linalg.solve(design.T @ design + penalty, design.T @ target)
+
+        # Стандартизация переносится в веса, чтобы при предсказании
+        # обойтись одним умножением на исходные значения.
+        numeric_weights = weights[1:1 + numeric.shape[1]] / self.scale
+        self.intercept = weights[0] - numeric_weights @ self.mean
+        self.numeric_weights = numeric_weights
+        offset = 1 + numeric.shape[1]
+        self.floor_weights = weights[offset:offset + len(FLOOR_TYPES)]
+        offset += len(FLOOR_TYPES)
+        self.locality_weights = weights[offset:offset + len(self.localities)]
+        offset += len(self.localities)
+        self.year_weights = weights[offset:]
+        return self
+
+    # Предсказание --------------------------------------------------------
+
+    def predict_log_price_per_sqm(self, frame):
+        numeric = self._numeric(frame)
+        numeric = np.where(np.isnan(numeric), self.fill, numeric)
+        return (numeric @ self.numeric_weights + self.intercept
+                + self.floor_weights[self._floor_codes(frame)]
+                + self.locality_weights[self._locality_codes(frame)]
+                + self.year_weights[self._year_codes(frame)])
+
+    def predict_price_per_sqm(self, frame):
+        return np.exp(self.predict_log_price_per_sqm(frame))
+
+    @traced()
+    def predict(self, frame):
+        """Предсказанная цена квартиры (last_price) для пакета объявлений."""
+        return self.predict_price_per_sqm(frame) * frame['total_area'].to_numpy(dtype='float64')
+
+    def score(self, data):
+        """Качество на размеченных данных: MAPE и медианная относительная ошибка."""
+        actual = data['last_price'].to_numpy(dtype='float64')
+        error = np.abs(self.predict(data) - actual) / actual
+        return {'mape': float(error.mean()), 'median_ape': float(np.median(error))}
+
+    # Сохранение ----------------------------------------------------------
+
+    def save(self, path=MODEL_PATH):
+        np.savez(path, alpha=self.alpha, min_locality_rows=self.min_locality_rows,
+                 localities=np.array(self.localities), years=self.years,
+                 fill=self.fill, mean=self.mean, scale=self.scale,
+                 intercept=self.intercept, numeric_weights=self.numeric_weights,
+                 floor_weights=self.floor_weights, locality_weights=self.locality_weights,
+                 year_weights=self.year_weights)
+        return path
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path, allow_pickle=False) as state:
+            model = cls(float(state['alpha']), int(state['min_locality_rows']))
+            model.localities = state['localities'].tolist()
+            for name in ('years', 'fill', 'mean', 'scale', 'numeric_weights',
+                         'floor_weights', 'locality_weights', 'year_weights'):
+                setattr(model, name, state[name])
+            model.intercept = float(state['intercept'])
+        return model
+
+
+def split_train_test(data, test_share=0.2, seed=12345):
+    """Детерминированное разбиение на обучающую и тестовую выборки."""
+    test = np.random.default_rng(seed).random(len(data)) < test_share
+    return data[~test], data[test]
+
+
+def train_price_model(data, alpha=1.0, min_locality_rows=20):
+    """Обучает модель на сырых объявлениях, прогоняя их через предобработку анализа."""
+    return PriceModel(alpha, min_locality_rows).fit(clean(data))
@@ -0,0 +1,190 @@
+"""Параллельная обработка датасета, разбитого на шарды по населенным пунктам.
+
+``ShardedFrame`` записывает датафрейм на диск в колоночном формате вместе с
+порядком строк, отсортированным по населенному пункту, и делит этот
+порядок на непрерывные диапазоны (шарды). Границы шардов проходят по
+границам населенных пунктов; населенный пункт, который больше шарда
+(Санкт-Петербург), делится на несколько шардов, иначе он один ограничивал
+бы ускорение.
+
+Процессы пула получают только путь и границы шарда, отображают нужные
+столбцы в память и сами выбирают строки своего шарда, поэтому большие
+датафреймы между процессами не передаются, а основной процесс не копирует
+данные при сортировке. Результаты шардов -- объединяемые статистики
+(``StreamStatistics``, суммы по группам) или очищенные шарды на диске --
+объединяются в порядке шардов, поэтому результат не зависит от того, какой
+процесс закончил раньше.
+
+Для экономии памяти буферы можно держать в ``/dev/shm`` (``tmp_dir``).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from real_estate.cleaning import clean_chunk
+from real_estate.columnar import read_columns, write_columns
+from real_estate.imputation import LOCALITY_RULES
+from real_estate.incremental import SPB, spb_data_pivot, top_price_per_sqm
+from real_estate.streaming import StreamStatistics
+
+
+FRAME_DIR = 'frame'
+ORDER_FILE = 'order.npy'
+ROW_COLUMN = '__row__'
+
+
+def shard_bounds(codes, shards):
+    """Границы шардов по отсортированным кодам населенных пунктов.
+
+    Шард закрывается на первой границе населенного пункта после того, как в
+    нем набралось ``len(codes) / shards`` строк; слишком большие населенные
+    пункты делятся по числу строк.
+    """
+    rows = len(codes)
+    if not rows:
+        return []
+    target = max(1, -(-rows // max(1, shards)))
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    bounds = []
+    start = 0
+    for boundary in list(starts[1:]) + [rows]:
+        while boundary - start > target:
+            bounds.append((start, start + target))
+            start += target
+        if boundary - start >= target or boundary == rows:
+            bounds.append((start, int(boundary)))
+            start = int(boundary)
+    return [(int(a), int(b)) for a, b in bounds if b > a]
+
+
+class ShardedFrame:
+    """Датафрейм на диске и порядок его строк по ``by``, разбитый на шарды."""
+
+    def __init__(self, path, bounds, owned=False):
+        self.path = path
+        self.bounds = bounds
+        self.owned = owned
+
+    @classmethod
+    def create(cls, data, shards=None, by='locality_name', path=None, tmp_dir=None):
+        """Записывает ``data`` на диск; ``shards`` по умолчанию -- число ядер."""
+        shards = shards or os.cpu_count() or 1
+        owned = path is None
+        if owned:
+            path = tempfile.mkdtemp(prefix='real_estate-shards-', dir=tmp_dir)
+        codes = pd.Categorical(data[by].astype(str).where(data[by].notna())).codes.astype('int64')
+        # Строки без населенного пункта -- в конце, отдельной группой.
+        codes = np.where(codes < 0, codes.max(initial=0) + 1, codes)
+        order = np.argsort(codes, kind='stable')
+        write_columns(data.reset_index(drop=True), os.path.join(path, FRAME_DIR), compact=False)
+        np.save(os.path.join(path, ORDER_FILE), order)
+        return cls(path, shard_bounds(codes[order], shards), owned)
+
+    def read(self, start, stop, columns=None):
+        return read_shard(self.path, start, stop, columns)
+
+    def map(self, func, *args, workers=None):
+        """Вызывает ``func(path, start, stop, *args)`` для каждого шарда.
+
+        ``func`` читает свой шард через ``read_shard(path, start, stop)``;
+        результаты возвращаются в порядке шардов.
+        """
+        workers = workers or os.cpu_count() or 1
+        tasks = [(self.path, start, stop) + args for start, stop in self.bounds]
+        if workers == 1 or len(tasks) <= 1:
+            return [func(*task) for task in tasks]
+        with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+            futures = [pool.submit(func, *task) for task in tasks]
+            return [future.result() for future in futures]
+
+    def close(self):
+        if self.owned:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Задачи для процессов пула -------------------------------------------------
+
+def read_shard(path, start, stop, columns=None):
+    """Строки шарда; индекс -- позиции строк в исходном датафрейме."""
+    rows = np.load(os.path.join(path, ORDER_FILE), mmap_mode='r')[start:stop]
+    return read_columns(os.path.join(path, FRAME_DIR), columns).iloc[np.asarray(rows)]
+
+
+def _statistics_task(path, start, stop, rules):
+    return StreamStatistics(rules).update(read_shard(path, start, stop))
+
+
+def _clean_task(path, start, stop, medians, imputer, output):
+    chunk = read_shard(path, start, stop)
+    cleaned = clean_chunk(chunk, medians, imputer)
+    target = os.path.join(output, f'{start:012d}')
+    frame = cleaned.reset_index(drop=True)
+    frame[ROW_COLUMN] = cleaned.index.to_numpy()
+    write_columns(frame, target, compact=False)
+    return target, _price_sums(cleaned)
+
+
+def _price_sums(data):
+    """Суммы и число price_per_sqm по населенным пунктам и last_price по км в Санкт-Петербурге."""
+    locality = data['locality_name'].astype(str).to_numpy()
+    prices = data['price_per_sqm'].astype('float64').groupby(locality).agg(['sum', 'count'])
+    spb = data[locality == SPB]
+    spb = spb['last_price'].astype('float64').groupby(spb['city_centers_km']).agg(['sum', 'count'])
+    return prices, spb
+
+
+def _merge_sums(tables):
+    tables = [table for table in tables if len(table)]
+    if not tables:
+        return pd.DataFrame({'sum': pd.Series(dtype='float64'), 'count': pd.Series(dtype='int64')})
+    merged = pd.concat(tables).groupby(level=0, sort=True).sum()
+    merged['count'] = merged['count'].astype('int64')
+    return merged
+
+
+# Параллельные этапы ------------------------------------------------------
+
+def parallel_statistics(sharded, rules=LOCALITY_RULES, workers=None):
+    """Статистики для заполнения пропусков, собранные по шардам параллельно."""
+    statistics = StreamStatistics(rules)
+    for part in sharded.map(_statistics_task, tuple(rules), workers=workers):
+        statistics.merge(part)
+    return statistics
+
+
+def parallel_clean(raw, workers=None, rules=LOCALITY_RULES, shards=None, tmp_dir=None):
+    """Полная предобработка ``raw`` по шардам в пуле процессов.
+
+    Возвращает очищенные данные в исходном порядке строк и словарь сводных
+    таблиц ``top_price_per_sqm`` и ``spb_data_pivot``, собранных из сумм
+    по шардам.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ShardedFrame.create(raw, shards or workers, tmp_dir=tmp_dir) as sharded:
+        statistics = parallel_statistics(sharded, rules, workers)
+        output = os.path.join(sharded.path, 'cleaned')
+        os.makedirs(output)
+        results = sharded.map(_clean_task, statistics.medians(), statistics.imputer(), output,
+                              workers=workers)
+        parts = [read_columns(path, mmap=False) for path, _ in results]
+        data = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        rows = data.pop(ROW_COLUMN).to_numpy()
+        data.index = raw.index[rows]
+        data = data.iloc[np.argsort(rows, kind='stable')]
+        # Категории шардов различаются; общий список -- отсортированные названия.
+        data['locality_name'] = data['locality_name'].astype(str).astype('category')
+        prices = _merge_sums([prices for _, (prices, _) in results])
+        spb = _merge_sums([spb for _, (_, spb) in results])
+    return data, {'top_price_per_sqm': top_price_per_sqm(prices),
+                  'spb_data_pivot': spb_data_pivot(spb)}
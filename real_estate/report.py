@@ -0,0 +1,374 @@
+"""Пакетная отрисовка графиков исследовательского анализа в файлы.
+
+Графики описаны таблицей ``EDA_CHARTS``: гистограммы, средняя цена по
+значению признака, облако точек, hexbin-диаграммы цены по дню недели,
+месяцу и году и цена километра до центра Санкт-Петербурга.
+
+Отрисовка идет в три шага:
+
+1. ``compute_bins`` извлекает каждый нужный столбец один раз и считает
+   счетчики корзин всех графиков векторно в NumPy (гистограммы --
+   ``np.histogram``, hexbin -- та же решетка шестиугольников, что у
+   matplotlib, средние -- ``np.bincount``);
+2. для каждого графика считается хэш корзин; графики, у которых хэш
+   совпадает с записанным в ``manifest.json`` при прошлой отрисовке,
+   пропускаются;
+3. остальные графики рисуются без экрана (backend Agg) в пуле процессов --
+   каждому процессу передаются только небольшие массивы корзин.
+
+Запуск (данные берутся из кэша стадий ``real_estate.stages``)::
+
+    python -m real_estate.report --output reports --region Санкт-Петербург
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import DATA_PATH
+from real_estate.features import FLOOR_TYPES
+from real_estate.incremental import SPB, spb_data_pivot
+
+
+MANIFEST_FILE = 'manifest.json'
+# Увеличивается при изменении оформления графиков, чтобы перерисовать все.
+RENDER_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Histogram:
+    name: str
+    column: str
+    bins: int = 10
+
+
+@dataclass(frozen=True)
+class MeanCurve:
+    """Средняя цена по каждому значению признака (сводная таблица и scatter/line)."""
+
+    name: str
+    column: str
+    max_value: float
+    max_price: float = 20000000
+    kind: str = 'scatter'
+
+
+@dataclass(frozen=True)
+class PointCloud:
+    """Уникальные пары (тип этажа, цена) с числом повторов."""
+
+    name: str
+    column: str
+    max_price: float = 200000000
+
+
+@dataclass(frozen=True)
+class Hexbin:
+    name: str
+    column: str
+    gridsize: int = 20
+    max_price: float = 20000000
+
+
+@dataclass(frozen=True)
+class DistanceLine:
+    """Цена километра до центра Санкт-Петербурга (spb_data_pivot)."""
+
+    name: str = 'spb_price_per_km'
+
+
+EDA_CHARTS = (
+    Histogram('total_area', 'total_area', 50),
+    Histogram('living_area', 'living_area', 50),
+    Histogram('kitchen_area', 'kitchen_area', 50),
+    Histogram('last_price', 'last_price', 100),
+    Histogram('rooms', 'rooms', 10),
+    Histogram('ceiling_height', 'ceiling_height', 10),
+    Histogram('floor', 'floor', 20),
+    Histogram('floor_type', 'floor_type', 5),
+    Histogram('floors_total', 'floors_total', 20),
+    Histogram('cityCenters_nearest', 'cityCenters_nearest', 10),
+    Histogram('airports_nearest', 'airports_nearest', 10),
+    Histogram('parks_nearest', 'parks_nearest', 50),
+    Histogram('weekday', 'weekday', 7),
+    Histogram('month', 'month', 12),
+    Histogram('days_exposition', 'days_exposition', 50),
+    MeanCurve('total_area_last_price', 'total_area', 400),
+    MeanCurve('living_area_last_price', 'living_area', 300),
+    MeanCurve('kitchen_area_last_price', 'kitchen_area', 60),
+    MeanCurve('rooms_last_price', 'rooms', 10, kind='line'),
+    PointCloud('floor_type_last_price', 'floor_type'),
+    Hexbin('weekday_last_price', 'weekday'),
+    Hexbin('month_last_price', 'month'),
+    Hexbin('year_last_price', 'year'),
+    DistanceLine(),
+)
+
+
+# Корзины -----------------------------------------------------------------
+
+def _columns(data, charts):
+    """Каждый нужный графикам столбец -- один раз, как массив float64."""
+    names = {'last_price'}
+    for chart in charts:
+        if isinstance(chart, DistanceLine):
+            names.update(('locality_name', 'city_centers_km'))
+        else:
+            names.add(chart.column)
+    columns = {}
+    for name in names:
+        if name not in data:
+            continue
+        series = data[name]
+        if name == 'floor_type':
+            columns[name] = pd.Categorical(series, categories=FLOOR_TYPES).codes.astype('float64')
+            columns[name][columns[name] < 0] = np.nan
+        elif name == 'locality_name' or series.dtype == object:
+            columns[name] = series.astype(str).to_numpy()
+        else:
+            columns[name] = series.to_numpy(dtype='float64', na_value=np.nan)
+    return columns
+
+
+def _histogram(chart, columns):
+    values = columns[chart.column]
+    values = values[~np.isnan(values)]
+    if chart.column == 'floor_type':
+        counts = np.bincount(values.astype('int64'), minlength=len(FLOOR_TYPES))
+        return {'counts': counts, 'labels': np.array(FLOOR_TYPES)}
+    counts, edges = np.histogram(values, bins=chart.bins)
+    return {'counts': counts, 'edges': edges}
+
+
+def _mean_curve(chart, columns):
+    x, price = columns[chart.column], columns['last_price']
+    known = ~np.isnan(x) & ~np.isnan(price)
+    values, codes = np.unique(x[known], return_inverse=True)
+    means = np.bincount(codes, weights=price[known]) / np.bincount(codes)
+    keep = (values < chart.max_value) & (means < chart.max_price)
+    return {'x': values[keep], 'y': means[keep]}
+
+
+def _point_cloud(chart, columns):
+    x, price = columns[chart.column], columns['last_price']
+    known = ~np.isnan(x) & (price < chart.max_price)
+    pairs, counts = np.unique(np.column_stack([x[known], price[known]]), axis=0, return_counts=True)
+    return {'x': pairs[:, 0], 'y': pairs[:, 1], 'counts': counts,
+            'labels': np.array(FLOOR_TYPES if chart.column == 'floor_type' else [])}
+
+
+def _nonsingular(low, high, expander=0.1):
+    """Расширяет вырожденный диапазон, как это делает matplotlib."""
+    if high - low > 1e-15 * max(abs(low), abs(high)):
+        return low, high
+    if low == high == 0:
+        return -expander, expander
+    return low - expander * abs(low), high + expander * abs(high)
+
+
+def _hexbin(chart, columns):
+    """Счетчики шестиугольников на той же решетке, что строит ``Axes.hexbin``."""
+    x, y = columns[chart.column], columns['last_price']
+    keep = ~np.isnan(x) & (y < chart.max_price)
+    x, y = x[keep], y[keep]
+    nx = chart.gridsize
+    ny = int(nx / math.sqrt(3))
+    xmin, xmax = _nonsingular(*((x.min(), x.max()) if len(x) else (0.0, 1.0)))
+    ymin, ymax = _nonsingular(*((y.min(), y.max()) if len(y) else (0.0, 1.0)))
+    extent = np.array([xmin, xmax, ymin, ymax], dtype='float64')
+    padding = 1e-9 * (xmax - xmin)
+    xmin, xmax = xmin - padding, xmax + padding
+    sx, sy = (xmax - xmin) / nx, (ymax - ymin) / ny
+    ix, iy = (x - xmin) / sx, (y - ymin) / sy
+    ix1, iy1 = np.round(ix).astype('int64'), np.round(iy).astype('int64')
+    ix2, iy2 = np.floor(ix).astype('int64'), np.floor(iy).astype('int64')
+    i1 = np.where((0 <= ix1) & (ix1 <= nx) & (0 <= iy1) & (iy1 <= ny), ix1 * (ny + 1) + iy1 + 1, 0)
+    i2 = np.where((0 <= ix2) & (ix2 < nx) & (0 <= iy2) & (iy2 < ny), ix2 * ny + iy2 + 1, 0)
+    nearest = (ix - ix1) ** 2 + 3 * (iy - iy1) ** 2 < (ix - ix2 - 0.5) ** 2 + 3 * (iy - iy2 - 0.5) ** 2
+    counts1 = np.bincount(i1[nearest], minlength=1 + (nx + 1) * (ny + 1))[1:]
+    counts2 = np.bincount(i2[~nearest], minlength=1 + nx * ny)[1:]
+    centers1 = np.column_stack([np.repeat(np.arange(nx + 1), ny + 1),
+                                np.tile(np.arange(ny + 1), nx + 1)]).astype('float64')
+    centers2 = np.column_stack([np.repeat(np.arange(nx) + 0.5, ny),
+                                np.tile(np.arange(ny), nx) + 0.5])
+    centers = np.vstack([centers1, centers2]) * [sx, sy] + [xmin, ymin]
+    counts = np.concatenate([counts1, counts2])
+    filled = counts > 0
+    return {'centers': centers[filled], 'counts': counts[filled], 'extent': extent}
+
+
+def _distance_line(chart, columns):
+    spb = columns['locality_name'] == SPB
+    km, price = columns['city_centers_km'][spb], columns['last_price'][spb]
+    known = ~np.isnan(km)
+    values, codes = np.unique(km[known], return_inverse=True)
+    sums = pd.DataFrame({'sum': np.bincount(codes, weights=price[known]),
+                         'count': np.bincount(codes)}, index=values)
+    pivot = spb_data_pivot(sums)
+    return {'x': pivot.index.to_numpy(dtype='float64'),
+            'y': pivot['mean_price_per_km'].to_numpy(dtype='float64')}
+
+
+BINNERS = {Histogram: _histogram, MeanCurve: _mean_curve, PointCloud: _point_cloud,
+           Hexbin: _hexbin, DistanceLine: _distance_line}
+
+
+def compute_bins(data, charts=EDA_CHARTS):
+    """Счетчики корзин всех графиков: словарь имя графика -> словарь массивов."""
+    columns = _columns(data, charts)
+    return {chart.name: BINNERS[type(chart)](chart, columns) for chart in charts}
+
+
+def bins_digest(chart, bins):
+    digest = hashlib.sha256(json.dumps({'chart': type(chart).__name__, 'spec': asdict(chart),
+                                        'version': RENDER_VERSION}, sort_keys=True).encode('utf-8'))
+    for key in sorted(bins):
+        values = np.asarray(bins[key])
+        digest.update(key.encode('utf-8'))
+        digest.update(str(values.dtype).encode('utf-8'))
+        digest.update(np.ascontiguousarray(values).tobytes() if values.dtype != object
+                      else json.dumps(values.tolist(), ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Отрисовка ---------------------------------------------------------------
+
+def _draw(ax, fig, chart, bins):
+    if isinstance(chart, Histogram):
+        if 'labels' in bins:
+            ax.bar(bins['labels'], bins['counts'])
+        else:
+            ax.stairs(bins['counts'], bins['edges'], fill=True)
+        ax.grid(True)
+    elif isinstance(chart, MeanCurve):
+        if chart.kind == 'line':
+            ax.plot(bins['x'], bins['y'])
+        else:
+            ax.scatter(bins['x'], bins['y'], alpha=0.3)
+        ax.set_xlabel(chart.column)
+        ax.set_ylabel('last_price')
+    elif isinstance(chart, PointCloud):
+        # Повторяющиеся точки рисуются одной, более насыщенной. Без точек (пустой
+        # регион) остаются пустые оси: scatter не принимает пустой массив alpha.
+        if len(bins['counts']):
+            alpha = np.clip(1 - 0.7 ** bins['counts'], 0.3, 1)
+            ax.scatter(bins['x'], bins['y'], alpha=alpha)
+        if len(bins['labels']):
+            ax.set_xticks(range(len(bins['labels'])), bins['labels'])
+        ax.set_xlabel(chart.column)
+        ax.set_ylabel('last_price')
+    elif isinstance(chart, Hexbin):
+        centers = bins['centers']
+        image = ax.hexbin(centers[:, 0], centers[:, 1], C=bins['counts'], gridsize=chart.gridsize,
+                          extent=tuple(bins['extent']), reduce_C_function=np.sum, cmap='BuGn')
+        fig.colorbar(image, ax=ax)
+        ax.set_xlabel(chart.column)
+        ax.set_ylabel('last_price')
+        ax.grid(True)
+    elif isinstance(chart, DistanceLine):
+        ax.plot(bins['x'], bins['y'], label='mean_price_per_km')
+        ax.set_xlabel('city_centers_km')
+        ax.legend()
+
+
+def render_chart(chart, bins, path, dpi=100):
+    """Рисует один график в файл без экрана."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 6) if isinstance(chart, Hexbin) else (6.4, 4.8))
+    try:
+        _draw(ax, fig, chart, bins)
+        ax.set_title(chart.name)
+        tmp = f'{path}.tmp-{os.getpid()}.png'
+        fig.savefig(tmp, dpi=dpi)
+        os.replace(tmp, path)
+    finally:
+        plt.close(fig)
+    return path
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_manifest(directory, manifest):
+    tmp = os.path.join(directory, f'{MANIFEST_FILE}.tmp-{os.getpid()}')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, MANIFEST_FILE))
+
+
+def render_report(data, directory, charts=EDA_CHARTS, workers=None, force=False):
+    """Рисует графики ``charts`` по ``data`` в каталог ``directory``.
+
+    Возвращает словарь с именами нарисованных и пропущенных графиков.
+    """
+    os.makedirs(directory, exist_ok=True)
+    bins = compute_bins(data, charts)
+    manifest = _read_manifest(directory)
+    jobs = []
+    skipped = []
+    for chart in charts:
+        path = os.path.join(directory, f'{chart.name}.png')
+        digest = bins_digest(chart, bins[chart.name])
+        if not force and manifest.get(chart.name) == digest and os.path.exists(path):
+            skipped.append(chart.name)
+        else:
+            jobs.append((chart, bins[chart.name], path, digest))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        for chart, chart_bins, path, _ in jobs:
+            render_chart(chart, chart_bins, path)
+    elif jobs:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            futures = [pool.submit(render_chart, chart, chart_bins, path)
+                       for chart, chart_bins, path, _ in jobs]
+            for future in futures:
+                future.result()
+    manifest.update({chart.name: digest for chart, _, _, digest in jobs})
+    _write_manifest(directory, manifest)
+    return {'rendered': [chart.name for chart, _, _, _ in jobs], 'skipped': skipped}
+
+
+def render_regions(data, directory, regions=None, charts=EDA_CHARTS, workers=None, force=False):
+    """Отчет по всему датасету (``all``) и по каждому населенному пункту из ``regions``."""
+    results = {'all': render_report(data, os.path.join(directory, 'all'), charts, workers, force)}
+    locality = data['locality_name'].astype(str)
+    for region in regions or ():
+        results[region] = render_report(data[locality == region], os.path.join(directory, region),
+                                         charts, workers, force)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Отрисовка графиков исследовательского анализа')
+    parser.add_argument('--output', default='reports', help='каталог для графиков')
+    parser.add_argument('--data', default=DATA_PATH, help='TSV с объявлениями')
+    parser.add_argument('--offline', action='store_true', help='не скачивать датасет')
+    parser.add_argument('--region', action='append', help='населенный пункт (можно несколько)')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--force', action='store_true', help='перерисовать все графики')
+    args = parser.parse_args(argv)
+
+    from real_estate.stages import analysis_pipeline
+    data = analysis_pipeline(args.data, offline=args.offline).run('data')
+    results = render_regions(data, args.output, args.region, workers=args.workers, force=args.force)
+    for region, result in results.items():
+        print(f'{region}: нарисовано {len(result["rendered"])}, без изменений {len(result["skipped"])}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Компактная схема типов для датафрейма объявлений.
+
+Каждому столбцу real_estate_data и добавленным признакам сопоставлен
+наименьший подходящий тип. Целые типы знаковые и не уже ``int16``: разность
+столбцов (этаж минус этажность) остается отрицательной, а не заворачивается
+через ноль, как в ``uint8``. Для целых типов при наличии пропусков
+используется nullable-вариант (``Int16`` вместо ``int16``). Перед
+приведением проверяется, что значения помещаются в тип без переполнения
+и потери точности; отчет показывает, сколько памяти сэкономлено.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from real_estate.features import FLOOR_TYPE_DTYPE
+from real_estate.instrument import traced
+
+
+# balcony, parks_around3000 и ponds_around3000 -- счетчики, но пропуски в них заполняются
+# медианами, которые могут быть дробными, поэтому для них выбран float32.
+SCHEMA = {
+    'total_images': 'int16',
+    'last_price': 'int32',
+    'total_area': 'float32',
+    'first_day_exposition': 'datetime64[ns]',
+    'rooms': 'int16',
+    'ceiling_height': 'float32',
+    'floors_total': 'int16',
+    'living_area': 'float32',
+    'floor': 'int16',
+    'is_apartment': 'boolean',
+    'studio': 'bool',
+    'open_plan': 'bool',
+    'kitchen_area': 'float32',
+    'balcony': 'float32',
+    'locality_name': 'category',
+    'airports_nearest': 'float32',
+    'cityCenters_nearest': 'float32',
+    'parks_around3000': 'float32',
+    'parks_nearest': 'float32',
+    'ponds_around3000': 'float32',
+    'ponds_nearest': 'float32',
+    'days_exposition': 'int32',
+    'price_per_sqm': 'float32',
+    'weekday': 'int16',
+    'month': 'int16',
+    'year': 'int16',
+    'floor_type': FLOOR_TYPE_DTYPE,
+    'city_centers_km': 'float32',
+}
+
+# Допустимая относительная погрешность при переходе на float32.
+FLOAT32_TOLERANCE = 1e-6
+
+
+def _fits(series, dtype):
+    """Проверяет, что значения столбца помещаются в тип ``dtype`` без потерь."""
+    dtype = np.dtype(dtype)
+    values = series.dropna()
+    if not len(values):
+        return True
+    values = values.to_numpy(dtype='float64')
+    if dtype.kind in 'iu':
+        info = np.iinfo(dtype)
+        return bool(np.all(values == np.round(values))
+                    and values.min() >= info.min and values.max() <= info.max)
+    if dtype == np.float32:
+        finite = values[np.isfinite(values)]
+        if len(finite) and np.abs(finite).max() > np.finfo(np.float32).max:
+            return False
+        error = np.abs(finite.astype('float32').astype('float64') - finite)
+        return bool(np.all(error <= FLOAT32_TOLERANCE * np.maximum(np.abs(finite), 1)))
+    return True
+
+
+def _target_dtype(series, dtype):
+    """Тип с учетом пропусков: nullable-целые и nullable-логические."""
+    if isinstance(dtype, str) and dtype == 'boolean':
+        return dtype if series.hasnans else np.dtype(bool)
+    if isinstance(dtype, str) and dtype == 'category' or isinstance(dtype, pd.CategoricalDtype):
+        return dtype
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iub' and series.hasnans:
+        return {'b': 'boolean'}.get(dtype.kind, dtype.name.capitalize().replace('Uint', 'UInt'))
+    return dtype
+
+
+def _convert(series, dtype):
+    if str(dtype) in ('boolean', 'bool') and series.dtype == object:
+        # Столбец вида is_apartment после fillna(False) хранит смесь True/False/0/1.
+        converted = series.fillna(False).astype(bool)
+        return converted.astype('boolean').mask(series.isna()) if str(dtype) == 'boolean' else converted
+    return series.astype(dtype)
+
+
+@dataclass
+class SchemaReport:
+    """Отчет о приведении типов: по строке на столбец."""
+
+    columns: pd.DataFrame
+
+    @property
+    def bytes_before(self):
+        return int(self.columns['bytes_before'].sum())
+
+    @property
+    def bytes_after(self):
+        return int(self.columns['bytes_after'].sum())
+
+    @property
+    def saved(self):
+        return self.bytes_before - self.bytes_after
+
+    @property
+    def ratio(self):
+        return self.bytes_before / self.bytes_after if self.bytes_after else float('inf')
+
+    def summary(self):
+        return (f'Память: {self.bytes_before / 2**20:.1f} МБ -> {self.bytes_after / 2**20:.1f} МБ '
+                f'(сэкономлено {self.saved / 2**20:.1f} МБ, в {self.ratio:.1f} раза меньше)')
+
+
+@traced()
+def optimize_dtypes(data, schema=SCHEMA, strict=True):
+    """Приводит столбцы к типам из ``schema`` и возвращает (данные, отчет).
+
+    Если значения столбца не помещаются в тип, при ``strict`` выбрасывается
+    ``ValueError``, иначе столбец остается в исходном типе.
+    """
+    data = data.copy()
+    rows = []
+    overflow = []
+    for column in data.columns:
+        before = data[column]
+        target = schema.get(column)
+        after = before
+        if target is not None:
+            target = _target_dtype(before, target)
+            numeric = isinstance(target, np.dtype) and target.kind in 'iuf'
+            nullable_int = isinstance(target, str) and target[0] in 'IU'
+            if (numeric or nullable_int) and not _fits(before, np.dtype(str(target).lower())):
+                overflow.append(column)
+            elif str(before.dtype) != str(target):
+                after = _convert(before, target)
+                data[column] = after
+        rows.append({
+            'column': column,
+            'dtype_before': str(before.dtype),
+            'dtype_after': str(after.dtype),
+            'bytes_before': int(before.memory_usage(index=False, deep=True)),
+            'bytes_after': int(after.memory_usage(index=False, deep=True)),
+        })
+    if overflow and strict:
+        raise ValueError(f'Значения не помещаются в тип схемы: {", ".join(overflow)}')
+    return data, SchemaReport(pd.DataFrame(rows).set_index('column'))
@@ -0,0 +1,337 @@
+"""Локальный HTTP-сервис оценки объявлений.
+
+При старте сервис один раз загружает датасет, очищает его и держит в памяти
+базовую оценку цены квадратного метра (``PricePerSqmBaseline``), таблицы
+медиан по населенным пунктам для заполнения пропусков и словарь
+нормализации названий. Запрос оценки -- поиск по этим таблицам.
+
+Одновременные запросы собираются в пакеты и оцениваются одним векторным
+вызовом: в пакет попадает все, что накопилось в очереди, пока оценивался
+предыдущий пакет (не больше ``max_batch``), и, если задан ``max_wait``,
+запросы, пришедшие за это время.
+
+Маршруты:
+
+- ``POST /valuate`` -- объявление (JSON-объект) или список объявлений;
+- ``GET /stats`` -- p50/p99 задержки, пропускная способность, размер пакетов;
+- ``GET /health``.
+
+Запуск::
+
+    python -m real_estate.service --port 8080
+"""
+
+import argparse
+import asyncio
+from collections import deque
+import json
+import time
+
+import numpy as np
+
+from real_estate.baseline import PricePerSqmBaseline
+from real_estate.cleaning import clean_chunk, global_medians
+from real_estate.dataset import DATA_PATH, DATA_URL, load_listings
+from real_estate.imputation import LOCALITY_RULES, OPERATORS, GroupMedianImputer
+from real_estate.locality import LocalityNormalizer
+
+
+# Расстояния, которые сервис заполняет медианой населенного пункта.
+IMPUTED_COLUMNS = ('airports_nearest', 'cityCenters_nearest', 'parks_nearest', 'ponds_nearest')
+REQUIRED_FIELDS = ('locality_name', 'total_area', 'rooms')
+
+
+class ValuationError(ValueError):
+    """Некорректное объявление в запросе."""
+
+
+class ValuationEngine:
+    """Таблицы, загруженные в память, и векторная оценка пакета объявлений."""
+
+    def __init__(self, baseline, imputer, normalizer):
+        self.baseline = baseline
+        self.normalizer = normalizer
+        # Таблицы медиан превращаются в словари: поиск по названию без pandas.
+        self.tables = {column: imputer.tables[column].dropna().to_dict() for column in IMPUTED_COLUMNS}
+        self.fallbacks = {column: (imputer.fallbacks[column] or (np.nan,))[0]
+                          for column in IMPUTED_COLUMNS}
+        self.conditions = {rule.column: rule.where for rule in imputer.rules
+                           if rule.column in IMPUTED_COLUMNS and rule.where is not None}
+
+    @classmethod
+    def from_listings(cls, raw, rules=LOCALITY_RULES):
+        """Строит таблицы по сырому датасету той же предобработкой, что и анализ."""
+        medians = global_medians(raw)
+        imputer = GroupMedianImputer(rules).fit(raw.dropna(subset=['locality_name']))
+        # Тот же словарь названий, что сохранил анализ, -- канонические названия совпадают.
+        normalizer = LocalityNormalizer.load_or_create()
+        data = clean_chunk(raw, medians, imputer, normalizer=normalizer)
+        return cls(PricePerSqmBaseline().fit(data), imputer, normalizer)
+
+    def _column(self, listings, name):
+        try:
+            values = np.array([np.nan if listing.get(name) is None else listing[name]
+                               for listing in listings], dtype='float64')
+        except (TypeError, ValueError):
+            raise ValuationError(f'Поле {name} должно быть числом') from None
+        # Списки одинаковой длины numpy превращает в матрицу, а не в ошибку.
+        if values.shape != (len(listings),):
+            raise ValuationError(f'Поле {name} должно быть числом')
+        return values
+
+    def value(self, listings):
+        """Оценивает список объявлений (словарей) и возвращает список результатов."""
+        for listing in listings:
+            missing = [field for field in REQUIRED_FIELDS if listing.get(field) is None]
+            if missing:
+                raise ValuationError(f'Не заданы поля: {", ".join(missing)}')
+        names = [str(listing['locality_name']) for listing in listings]
+        columns = {}
+        for column in IMPUTED_COLUMNS:
+            values = self._column(listings, column)
+            table = self.tables[column]
+            missing = np.isnan(values)
+            if column in self.conditions:
+                # parks_nearest/ponds_nearest заполняются, только если парк или водоем
+                # есть в радиусе 3 км, как и при предобработке.
+                condition, op, limit = self.conditions[column]
+                missing &= OPERATORS[op](self._column(listings, condition), limit)
+            for number in np.flatnonzero(missing):
+                values[number] = table.get(names[number], self.fallbacks[column])
+            columns[column] = values
+        total_area = self._column(listings, 'total_area')
+        frame = {
+            'locality_name': [self.normalizer.normalize(name) for name in names],
+            'rooms': self._column(listings, 'rooms'),
+            'city_centers_km': np.round(columns['cityCenters_nearest'] / 1000),
+        }
+        price_per_sqm = self.baseline.estimate(frame)
+        price = price_per_sqm * total_area
+        last_price = self._column(listings, 'last_price')
+        ratio = last_price / price
+        results = []
+        for number in range(len(listings)):
+            result = {
+                'locality_name': frame['locality_name'][number],
+                'price_per_sqm': round(float(price_per_sqm[number]), 2),
+                'price': round(float(price[number]), 2),
+            }
+            for column in IMPUTED_COLUMNS:
+                value = columns[column][number]
+                result[column] = None if np.isnan(value) else float(value)
+            if not np.isnan(ratio[number]):
+                result['price_ratio'] = round(float(ratio[number]), 4)
+            results.append(result)
+        return results
+
+
+class LatencyStats:
+    """Задержки и пропускная способность последних запросов.
+
+    Пропускная способность считается между первым и последним из
+    ``window`` последних запросов, поэтому паузы без запросов до и после
+    нагрузки ее не занижают.
+    """
+
+    def __init__(self, window=100000):
+        self.latencies = deque(maxlen=window)
+        self.finished = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.batched_items = 0
+
+    def record(self, latency):
+        self.latencies.append(latency)
+        self.finished.append(time.perf_counter())
+        self.requests += 1
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_items += size
+
+    def snapshot(self):
+        latencies = np.array(self.latencies) * 1000
+        # Интервал от начала первого запроса окна до конца последнего.
+        elapsed = (self.finished[-1] - self.finished[0] + self.latencies[0]
+                   if self.finished else 0.0)
+        return {
+            'requests': self.requests,
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+            'throughput_rps': round(len(self.finished) / elapsed, 1) if elapsed > 0 else 0.0,
+            'mean_batch': round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class MicroBatcher:
+    """Собирает одновременные запросы в пакеты для векторной оценки."""
+
+    def __init__(self, handler, stats, max_batch=256, max_wait=0.0):
+        self.handler = handler
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+
+    async def submit(self, listings):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((listings, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            # Сначала забираем все, что уже накопилось, пока оценивался прошлый пакет;
+            # ждать новых запросов имеет смысл, только если задан max_wait.
+            while size < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                size += len(batch[-1][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            try:
+                self._process(batch)
+            except Exception as error:
+                # Цикл пакетов не должен останавливаться: иначе все следующие
+                # запросы ждали бы ответа вечно.
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _process(self, batch):
+        # Запросы отключившихся клиентов отменены: их не оцениваем и не отвечаем им.
+        batch = [(items, future) for items, future in batch if not future.done()]
+        if not batch:
+            return
+        listings = [listing for items, _ in batch for listing in items]
+        self.stats.record_batch(len(listings))
+        try:
+            results = self.handler(listings)
+        except Exception:
+            # Одно некорректное объявление не должно ломать весь пакет: запросы
+            # оцениваются по отдельности, ошибка достается только своему запросу.
+            for items, future in batch:
+                try:
+                    result = self.handler(items)
+                except Exception as error:
+                    if not future.done():
+                        future.set_exception(error)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            return
+        offset = 0
+        for items, future in batch:
+            if not future.done():
+                future.set_result(results[offset:offset + len(items)])
+            offset += len(items)
+
+
+class ValuationServer:
+    """HTTP/1.1 с keep-alive поверх asyncio-потоков."""
+
+    def __init__(self, engine, max_batch=256, max_wait=0.0):
+        self.engine = engine
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(engine.value, self.stats, max_batch, max_wait)
+
+    async def route(self, method, path, body):
+        if method == 'POST' and path == '/valuate':
+            try:
+                payload = json.loads(body or b'null')
+            except json.JSONDecodeError:
+                return 400, {'error': 'Тело запроса -- не JSON'}
+            single = isinstance(payload, dict)
+            listings = [payload] if single else payload
+            if not isinstance(listings, list) or not all(isinstance(item, dict) for item in listings):
+                return 400, {'error': 'Ожидается объявление или список объявлений'}
+            try:
+                results = await self.batcher.submit(listings)
+            except ValuationError as error:
+                return 400, {'error': str(error)}
+            except Exception:
+                return 500, {'error': 'Внутренняя ошибка оценки'}
+            return 200, results[0] if single else results
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats.snapshot()
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        return 404, {'error': 'Не найдено'}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                started = time.perf_counter()
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json; charset=utf-8\r\n'
+                             b'Content-Length: %d\r\nConnection: %s\r\n\r\n'
+                             % (status, b'OK' if status == 200 else b'Error', len(data),
+                                b'keep-alive' if keep_alive else b'close') + data)
+                await writer.drain()
+                if path == '/valuate':
+                    self.stats.record(time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        batcher = asyncio.create_task(self.batcher.run())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Локальный сервис оценки объявлений')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--data', default=DATA_PATH, help='TSV с объявлениями')
+    parser.add_argument('--offline', action='store_true', help='не скачивать датасет')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=0.0,
+                        help='сколько ждать новых запросов для пакета')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    engine = ValuationEngine.from_listings(load_listings(args.data, DATA_URL, offline=args.offline))
+    print(f'Таблицы построены за {time.perf_counter() - started:.2f} с, '
+          f'слушаю http://{args.host}:{args.port}', flush=True)
+    server = ValuationServer(engine, args.max_batch, args.max_wait_ms / 1000)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
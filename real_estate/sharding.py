@@ -0,0 +1,197 @@
+"""Модели цены по населенным пунктам.
+
+Цена квадратного метра в Санкт-Петербурге и в поселках области ведет себя
+по-разному, поэтому для каждого населенного пункта, где не меньше
+``min_shard_rows`` объявлений, обучается своя гребневая регрессия
+(``PriceModel`` на объявлениях одного пункта). Для остальных пунктов
+используется общая модель по всем данным. Шарды обучаются параллельно в
+пуле процессов.
+
+Каждый шард -- отдельный файл ``.npy`` с одним вектором параметров
+(свободный член, значения для пропусков, веса признаков, типов этажа и
+лет). Файлы открываются через отображение в память и только тогда, когда
+в пакете встречается объявление этого пункта; общая модель загружается
+только если нужна. Поэтому процесс, оценивающий объявления нескольких
+пунктов, не читает остальные шарды.
+
+Пример::
+
+    ShardedPriceModel(min_shard_rows=300).fit(data).save()
+    model = ShardedPriceModel.load()
+    model.predict(listings)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import CACHE_DIR
+from real_estate.features import FLOOR_TYPES
+from real_estate.instrument import traced
+from real_estate.model import PriceModel, floor_codes, numeric_matrix
+
+
+SHARDS_PATH = os.path.join(CACHE_DIR, 'price_model_shards')
+MANIFEST_FILE = 'manifest.json'
+POOLED_FILE = 'pooled.npz'
+SHARDS_DIR = 'shards'
+
+
+def _fit_shard(frame, alpha, years):
+    """Вектор параметров модели, обученной на объявлениях одного населенного пункта."""
+    model = PriceModel(alpha, min_locality_rows=len(frame) + 1).fit(frame)
+    # Все объявления шарда -- одна категория «другой»: ее вес входит в свободный член.
+    intercept = model.intercept + model.locality_weights[-1]
+    codes = np.clip(np.searchsorted(model.years, years), 0, len(model.years) - 1)
+    return np.concatenate([[intercept], model.fill, model.numeric_weights,
+                           model.floor_weights, model.year_weights[codes]])
+
+
+class ShardedPriceModel:
+    """Модели по населенным пунктам с общей моделью для небольших пунктов."""
+
+    def __init__(self, alpha=1.0, min_shard_rows=300, min_locality_rows=20, workers=None):
+        self.alpha = alpha
+        self.min_shard_rows = min_shard_rows
+        # Для общей модели: пункты с меньшим числом объявлений объединяются.
+        self.min_locality_rows = min_locality_rows
+        self.workers = workers
+        self.path = None
+        self.shards = {}
+        self._vectors = {}
+        self._pooled = None
+
+    # Обучение ------------------------------------------------------------
+
+    @traced()
+    def fit(self, data):
+        """Обучает общую модель и модели крупных населенных пунктов."""
+        self.years = np.unique(data['year'].to_numpy(dtype='float64'))
+        names = data['locality_name'].astype(str)
+        counts = names.value_counts()
+        localities = sorted(counts[counts >= self.min_shard_rows].index)
+        self._pooled = PriceModel(self.alpha, self.min_locality_rows).fit(data)
+
+        indices = names.reset_index(drop=True).groupby(names.to_numpy()).indices
+        frames = [data.iloc[indices[name]] for name in localities]
+        workers = min(self.workers or os.cpu_count() or 1, len(frames)) or 1
+        if workers == 1:
+            vectors = [_fit_shard(frame, self.alpha, self.years) for frame in frames]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                vectors = list(pool.map(_fit_shard, frames, [self.alpha] * len(frames),
+                                        [self.years] * len(frames)))
+        for name, vector in zip(localities, vectors):
+            if not np.isfinite(vector).all():
+                raise ValueError(f'Модель населенного пункта {name}: неконечные параметры')
+        self.path = None
+        self.shards = {name: f'{number:05d}.npy' for number, name in enumerate(localities)}
+        self._vectors = dict(zip(localities, vectors))
+        return self
+
+    # Шарды ---------------------------------------------------------------
+
+    def _vector(self, locality):
+        """Параметры шарда; файл открывается при первом обращении."""
+        if locality not in self._vectors:
+            self._vectors[locality] = np.load(os.path.join(self.path, SHARDS_DIR,
+                                                           self.shards[locality]), mmap_mode='r')
+        return self._vectors[locality]
+
+    def pooled(self):
+        if self._pooled is None:
+            self._pooled = PriceModel.load(os.path.join(self.path, POOLED_FILE))
+        return self._pooled
+
+    @property
+    def loaded(self):
+        """Населенные пункты, шарды которых уже открыты."""
+        return sorted(self._vectors)
+
+    # Предсказание --------------------------------------------------------
+
+    def _year_codes(self, frame):
+        if 'year' not in frame:
+            return np.full(len(frame), len(self.years) - 1)
+        codes = np.searchsorted(self.years, frame['year'].to_numpy(dtype='float64'))
+        return np.clip(codes, 0, len(self.years) - 1)
+
+    def predict_log_price_per_sqm(self, frame):
+        names = frame['locality_name'].astype(str).to_numpy()
+        codes, uniques = pd.factorize(names)
+        order = np.argsort(codes, kind='stable')
+        groups = np.split(order, np.searchsorted(codes[order], np.arange(1, len(uniques))))
+        sharded = [(name, rows) for name, rows in zip(uniques, groups) if name in self.shards]
+
+        result = np.empty(len(frame))
+        pooled = np.ones(len(frame), dtype=bool)
+        if sharded:
+            numeric = numeric_matrix(frame)
+            floors = floor_codes(frame)
+            years = self._year_codes(frame)
+            size = numeric.shape[1]
+            for name, rows in sharded:
+                vector = self._vector(name)
+                fill = vector[1:1 + size]
+                weights = vector[1 + size:1 + 2 * size]
+                floor_weights = vector[1 + 2 * size:1 + 2 * size + len(FLOOR_TYPES)]
+                year_weights = vector[1 + 2 * size + len(FLOOR_TYPES):]
+                values = numeric[rows]
+                values = np.where(np.isnan(values), fill, values)
+                result[rows] = (values @ weights + vector[0] + floor_weights[floors[rows]]
+                                + year_weights[years[rows]])
+                pooled[rows] = False
+        if pooled.any():
+            result[pooled] = self.pooled().predict_log_price_per_sqm(frame[pooled])
+        return result
+
+    def predict_price_per_sqm(self, frame):
+        return np.exp(self.predict_log_price_per_sqm(frame))
+
+    @traced()
+    def predict(self, frame):
+        """Предсказанная цена квартиры (last_price) для пакета объявлений."""
+        return self.predict_price_per_sqm(frame) * frame['total_area'].to_numpy(dtype='float64')
+
+    def score(self, data):
+        """Качество на размеченных данных: MAPE и медианная относительная ошибка."""
+        actual = data['last_price'].to_numpy(dtype='float64')
+        error = np.abs(self.predict(data) - actual) / actual
+        return {'mape': float(error.mean()), 'median_ape': float(np.median(error))}
+
+    # Сохранение ----------------------------------------------------------
+
+    def save(self, path=SHARDS_PATH):
+        """Записывает каталог с манифестом, общей моделью и файлами шардов."""
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(os.path.join(tmp, SHARDS_DIR))
+        for name, file in self.shards.items():
+            vector = np.asarray(self._vector(name))
+            if not np.isfinite(vector).all():
+                raise ValueError(f'Модель населенного пункта {name}: неконечные параметры')
+            np.save(os.path.join(tmp, SHARDS_DIR, file), vector)
+        self.pooled().save(os.path.join(tmp, POOLED_FILE))
+        with open(os.path.join(tmp, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'alpha': self.alpha, 'min_shard_rows': self.min_shard_rows,
+                       'min_locality_rows': self.min_locality_rows, 'years': self.years.tolist(),
+                       'shards': self.shards}, f, ensure_ascii=False, indent=1)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path=SHARDS_PATH, workers=None):
+        """Читает только манифест; шарды и общая модель открываются по мере надобности."""
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+        model = cls(manifest['alpha'], manifest['min_shard_rows'], manifest['min_locality_rows'],
+                    workers)
+        model.path = path
+        model.years = np.array(manifest['years'], dtype='float64')
+        model.shards = manifest['shards']
+        return model
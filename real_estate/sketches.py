@@ -0,0 +1,150 @@
+"""Объединяемые статистики для потоковой обработки.
+
+``GroupQuantileSketch`` хранит для каждой группы гистограмму значений,
+округленных до ``significant_digits`` значащих цифр. Размер состояния
+ограничен числом различных округленных значений, а не числом строк;
+две гистограммы объединяются сложением счетчиков.
+
+Медиана по гистограмме совпадает с точной, только если значения столбца
+не округляются. Так для столбцов, пропуски в которых заполняются
+медианами: расстояния в метрах, высоты потолков с точностью до сантиметра
+и счетчики балконов/парков укладываются в 5 значащих цифр. Цены
+(``last_price``, ``price_per_sqm``) округляются, и их медианы по
+гистограммам приближенные: относительная погрешность до ``5e-5``.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Ключ группы для статистик, не разбитых на группы.
+ALL = '__all__'
+
+
+def quantize(values, significant_digits=5):
+    """Округляет значения до заданного числа значащих цифр."""
+    values = np.asarray(values, dtype='float64')
+    result = values.copy()
+    nonzero = np.isfinite(values) & (values != 0)
+    magnitude = np.floor(np.log10(np.abs(values[nonzero])))
+    scale = 10.0 ** (significant_digits - 1 - magnitude)
+    result[nonzero] = np.round(values[nonzero] * scale) / scale
+    return result
+
+
+class GroupQuantileSketch:
+    """Гистограммы округленных значений по группам.
+
+    Состояние -- серия счетчиков с индексом (группа, значение) и серия
+    числа пропусков по группам. Новые порции накапливаются в буфере и
+    сворачиваются, когда буфер разрастается.
+    """
+
+    def __init__(self, significant_digits=5, compact_every=16):
+        self.significant_digits = significant_digits
+        self.compact_every = compact_every
+        self._counts = pd.Series(dtype='int64')
+        self._missing = pd.Series(dtype='int64')
+        self._pending = []
+
+    def update(self, groups, values):
+        """Добавляет порцию значений. ``groups=None`` -- одна общая группа."""
+        values = np.asarray(values, dtype='float64')
+        if groups is None:
+            codes, names = np.zeros(len(values), dtype='int64'), np.array([ALL], dtype=object)
+        else:
+            # Группировка по целым кодам, а не по строкам: названия
+            # подставляются только в уже свернутый результат.
+            codes, names = pd.factorize(groups)
+            names = np.asarray(names, dtype=object)
+        known = ~np.isnan(values) & (codes >= 0)
+        keys = pd.Series(quantize(values[known], self.significant_digits))
+        counts = keys.groupby([codes[known], keys.to_numpy()]).size()
+        if len(counts):
+            counts.index = counts.index.set_levels(names[counts.index.levels[0]], level=0)
+        missing = pd.Series(np.bincount(codes[np.isnan(values) & (codes >= 0)],
+                                        minlength=len(names)), index=names)
+        missing = missing[missing > 0]
+        self._pending.append((counts, missing))
+        if len(self._pending) >= self.compact_every:
+            self._compact()
+        return self
+
+    def merge(self, other):
+        other._compact()
+        self._pending.append((other._counts, other._missing))
+        self._compact()
+        return self
+
+    def _compact(self):
+        if not self._pending:
+            return
+        counts = [self._counts] + [c for c, _ in self._pending if len(c)]
+        missing = [self._missing] + [m for _, m in self._pending if len(m)]
+        self._pending = []
+        counts = [c for c in counts if len(c)]
+        if counts:
+            self._counts = pd.concat(counts).groupby(level=[0, 1], sort=True).sum()
+        missing = [m for m in missing if len(m)]
+        if missing:
+            self._missing = pd.concat(missing).groupby(level=0).sum()
+
+    @property
+    def counts(self):
+        """Серия счетчиков с индексом (группа, округленное значение)."""
+        self._compact()
+        return self._counts
+
+    def count(self):
+        """Число непустых значений по группам."""
+        counts = self.counts
+        if not len(counts):
+            return pd.Series(dtype='int64')
+        return counts.groupby(level=0, sort=False).sum()
+
+    def missing(self):
+        self._compact()
+        return self._missing
+
+    def quantile(self, q=0.5):
+        """Квантиль по группам с той же интерполяцией, что у ``Series.quantile``.
+
+        Группы, в которых нет ни одного значения, дают NaN.
+        """
+        counts = self.counts
+        groups = pd.Index(counts.index.get_level_values(0).unique()).union(self.missing().index)
+        if not len(counts):
+            return pd.Series(np.nan, index=groups, dtype='float64')
+        values = counts.index.get_level_values(1).to_numpy(dtype='float64')
+        cumulative = np.cumsum(counts.to_numpy())
+        totals = counts.groupby(level=0, sort=True).sum()
+        ends = np.cumsum(totals.to_numpy())
+        starts = ends - totals.to_numpy()
+        position = (totals.to_numpy() - 1) * q
+        lower = np.floor(position).astype('int64')
+        upper = np.ceil(position).astype('int64')
+        low_values = values[np.searchsorted(cumulative, starts + lower, side='right')]
+        high_values = values[np.searchsorted(cumulative, starts + upper, side='right')]
+        result = low_values + (position - lower) * (high_values - low_values)
+        return pd.Series(result, index=totals.index, dtype='float64').reindex(groups)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def to_frame(self):
+        """Состояние в виде датафрейма (для сохранения на диск)."""
+        counts = self.counts.rename('count').reset_index()
+        counts.columns = ['group', 'value', 'count']
+        missing = self.missing().rename('count').rename_axis('group').reset_index()
+        missing['value'] = np.nan
+        return pd.concat([counts, missing[['group', 'value', 'count']]], ignore_index=True)
+
+    @classmethod
+    def from_frame(cls, frame, significant_digits=5):
+        sketch = cls(significant_digits)
+        known = frame['value'].notna()
+        counts = frame[known]
+        sketch._counts = (counts.set_index(['group', 'value'])['count']
+                          .astype('int64').groupby(level=[0, 1]).sum())
+        sketch._missing = frame[~known].groupby('group')['count'].sum().astype('int64')
+        return sketch
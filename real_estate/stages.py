@@ -0,0 +1,372 @@
+"""Конвейер предобработки из именованных стадий с кэшем на диске.
+
+Каждая стадия (``Stage``) объявляет свои входы -- выходы других стадий --
+и параметры. Результат стадии сохраняется на диск под ключом, который
+зависит от:
+
+- имени и исходного кода функции стадии;
+- исходного кода модулей пакета ``real_estate``, от которых зависит функция
+  (изменение ``schema.py`` пересчитывает только стадию типов столбцов и
+  стадии ниже, а не весь конвейер);
+- параметров стадии, включая хэш содержимого файлов-источников;
+- ключей входов.
+
+Поэтому при повторном запуске пересчитываются только стадии ниже по
+конвейеру от того, что изменилось, а если нужный результат уже есть в кэше,
+стадии выше по конвейеру даже не загружаются. Кэш ограничен по размеру:
+при переполнении удаляются записи, которые дольше всего не читались.
+
+Результаты хранятся в pickle, чтобы типы столбцов (в том числе nullable и
+категории) после загрузки из кэша совпадали с только что посчитанными.
+
+Запуск::
+
+    python -m real_estate.stages data top_price_per_sqm
+"""
+
+import argparse
+from dataclasses import dataclass, field, replace
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+from real_estate.cleaning import fill_missing, fix_anomalies, global_medians
+from real_estate.dataset import CACHE_DIR, DATA_PATH, DATA_URL, load_listings, source_hash
+from real_estate.features import add_features
+from real_estate.filters import OUTLIER_RULES, apply_filters
+from real_estate.imputation import LOCALITY_RULES, GroupMedianImputer
+from real_estate.locality import (LOCALITY_PATTERNS, LOCALITY_REPLACEMENT, LocalityNormalizer,
+                                  normalize_locality_names)
+from real_estate.schema import optimize_dtypes
+
+
+STAGES_DIR = os.path.join(CACHE_DIR, 'stages')
+MAX_CACHE_BYTES = 2 << 30
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+VALUE_FILE = 'value.pkl'
+
+
+def package_digest(directory=PACKAGE_DIR):
+    """Хэш исходного кода модулей пакета."""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            digest.update(name.encode('utf-8'))
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _package_module(value):
+    """Имя модуля пакета, в котором определен объект, или None."""
+    name = value.__name__ if inspect.ismodule(value) else getattr(value, '__module__', None)
+    if isinstance(name, str) and name.split('.')[0] == 'real_estate' and name in sys.modules:
+        return name
+    return None
+
+
+def _dependencies(func):
+    """Модули пакета, от которых зависит функция: прямо или через импорты модулей.
+
+    Сам модуль конвейера не учитывается: его стадии-обертки хэшируются по
+    собственному исходному коду.
+    """
+    names = {_package_module(func.__globals__.get(name)) for name in func.__code__.co_names}
+    names.add(_package_module(func))
+    pending = sorted(names - {None, __name__})
+    found = set()
+    while pending:
+        name = pending.pop()
+        if name in found:
+            continue
+        found.add(name)
+        for value in list(vars(sys.modules[name]).values()):
+            module = _package_module(value)
+            if module is not None and module != __name__ and module not in found:
+                pending.append(module)
+    return sorted(found)
+
+
+def _code_digest(func):
+    """Хэш исходного кода функции и модулей пакета, от которых она зависит."""
+    digest = hashlib.sha256()
+    try:
+        digest.update(inspect.getsource(func).encode('utf-8'))
+    except (OSError, TypeError):
+        digest.update(func.__code__.co_code)
+    for name in _dependencies(func):
+        path = getattr(sys.modules[name], '__file__', None)
+        digest.update(name.encode('utf-8'))
+        if path:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class Stage:
+    """Стадия конвейера.
+
+    ``func`` вызывается с результатами ``inputs`` (позиционно) и ``params``
+    (по имени). Если у стадии несколько ``outputs``, функция возвращает
+    кортеж той же длины. ``sources`` -- имена параметров, которые являются
+    путями к файлам: в ключ кэша попадает хэш их содержимого.
+    """
+
+    name: str
+    func: object
+    inputs: tuple = ()
+    outputs: tuple = None
+    params: dict = field(default_factory=dict)
+    sources: tuple = ()
+
+    def __post_init__(self):
+        if self.outputs is None:
+            object.__setattr__(self, 'outputs', (self.name,))
+
+
+class StageCache:
+    """Результаты стадий на диске с вытеснением давно не читавшихся записей."""
+
+    def __init__(self, directory=STAGES_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._path(key), VALUE_FILE))
+
+    def get(self, key):
+        path = self._path(key)
+        with open(os.path.join(path, VALUE_FILE), 'rb') as f:
+            value = pickle.load(f)
+        # Время изменения каталога -- время последнего обращения к записи.
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        with open(os.path.join(tmp, VALUE_FILE), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        self.evict(keep=key)
+
+    def entries(self):
+        """Записи кэша: (время обращения, размер, ключ), от самых старых."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for key in os.listdir(self.directory):
+            path = self._path(key)
+            if '.tmp-' in key or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            entries.append((os.stat(path).st_mtime_ns, size, key))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Удаляет самые давние записи, пока кэш не уложится в ``max_bytes``."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Pipeline:
+    """Граф стадий с мемоизацией результатов по хэшу входов и параметров."""
+
+    def __init__(self, stages, cache=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f'Выход {output} объявлен в стадиях '
+                                     f'{self.producers[output].name} и {stage.name}')
+                self.producers[output] = stage
+        for stage in stages:
+            unknown = [name for name in stage.inputs if name not in self.producers]
+            if unknown:
+                raise ValueError(f'Стадия {stage.name}: неизвестные входы {", ".join(unknown)}')
+        self.cache = cache if cache is not None else StageCache()
+        self.log = []
+
+    def with_params(self, name, **params):
+        """Копия конвейера, в которой у стадии ``name`` изменены параметры."""
+        stages = [replace(stage, params={**stage.params, **params}) if stage.name == name else stage
+                  for stage in self.stages.values()]
+        return Pipeline(stages, self.cache)
+
+    # Ключи ---------------------------------------------------------------
+
+    def _stage_key(self, stage, keys):
+        if stage.name in keys:
+            return keys[stage.name]
+        params = dict(stage.params)
+        for name in stage.sources:
+            path = params[name]
+            params[name] = source_hash(path) if os.path.exists(path) else path
+        digest = hashlib.sha256(json.dumps({
+            'stage': stage.name,
+            'code': _code_digest(stage.func),
+            'params': params,
+            'inputs': [self._output_key(name, keys) for name in stage.inputs],
+        }, sort_keys=True, default=repr, ensure_ascii=False).encode('utf-8')).hexdigest()
+        keys[stage.name] = digest
+        return digest
+
+    def _output_key(self, output, keys):
+        stage = self.producers[output]
+        return f'{stage.name}-{output}-{self._stage_key(stage, keys)[:24]}'
+
+    # Выполнение ----------------------------------------------------------
+
+    def run(self, *targets):
+        """Возвращает результат одной цели или словарь результатов нескольких."""
+        keys = {}
+        values = {}
+        self.log = []
+        for target in targets:
+            if target not in self.producers:
+                raise KeyError(f'Неизвестный выход: {target}')
+            self._resolve(target, values, keys)
+        if len(targets) == 1:
+            return values[targets[0]]
+        return {target: values[target] for target in targets}
+
+    def _resolve(self, output, values, keys):
+        if output in values:
+            return values[output]
+        stage = self.producers[output]
+        output_keys = {name: self._output_key(name, keys) for name in stage.outputs}
+        started = time.perf_counter()
+        if all(key in self.cache for key in output_keys.values()):
+            values[output] = self.cache.get(output_keys[output])
+            self.log.append({'stage': stage.name, 'output': output, 'cached': True,
+                             'seconds': time.perf_counter() - started})
+            return values[output]
+        inputs = [self._resolve(name, values, keys) for name in stage.inputs]
+        started = time.perf_counter()
+        result = stage.func(*inputs, **stage.params)
+        results = (result,) if len(stage.outputs) == 1 else tuple(result)
+        for name, value in zip(stage.outputs, results):
+            self.cache.put(output_keys[name], value)
+            values[name] = value
+        self.log.append({'stage': stage.name, 'output': ', '.join(stage.outputs), 'cached': False,
+                         'seconds': time.perf_counter() - started})
+        return values[output]
+
+    def summary(self):
+        """Какие стадии последнего запуска взяты из кэша и сколько заняли."""
+        return '\n'.join(f'{entry["stage"]:<20} {"кэш" if entry["cached"] else "расчет":<7}'
+                         f'{entry["seconds"]:8.3f} с' for entry in self.log)
+
+
+# Стадии исследовательского анализа -------------------------------------
+
+def load_stage(path, url, offline):
+    return load_listings(path, url, offline=offline)
+
+
+def statistics_stage(raw, rules):
+    return global_medians(raw), GroupMedianImputer(rules).fit(raw.dropna(subset=['locality_name']))
+
+
+def imputation_stage(raw, medians, imputer):
+    return fill_missing(raw, medians, imputer)
+
+
+def locality_stage(data, patterns, replacement):
+    return normalize_locality_names(data, LocalityNormalizer(patterns, replacement))
+
+
+def top_price_per_sqm_stage(data, top):
+    pivot = data.pivot_table(index='locality_name', values='price_per_sqm',
+                             aggfunc=['mean', 'count'], observed=True)
+    pivot.columns = ['price_per_sqm', 'count']
+    pivot['price_per_sqm'] = pivot['price_per_sqm'].round()
+    return pivot.sort_values(by='price_per_sqm', ascending=False).head(top)
+
+
+def spb_data_pivot_stage(data):
+    spb_data = data[data['locality_name'] == 'Санкт-Петербург']
+    pivot = spb_data.pivot_table(index='city_centers_km', values='last_price', aggfunc='mean')
+    pivot['last_price'] = pivot['last_price'].round(2)
+    pivot['mean_price_per_km'] = (pivot['last_price'] / pivot.index).round(2)
+    if 0 in pivot.index:
+        pivot.loc[0, 'mean_price_per_km'] = pivot.loc[0, 'last_price']
+    pivot['city_centers_km'] = pivot.index
+    return pivot
+
+
+def analysis_stages(path=DATA_PATH, url=DATA_URL, offline=False):
+    """Стадии предобработки и сводных таблиц исследовательского анализа."""
+    return [
+        Stage('raw', load_stage, params={'path': path, 'url': url, 'offline': offline},
+              sources=('path',)),
+        Stage('statistics', statistics_stage, ('raw',), ('medians', 'imputer'),
+              params={'rules': LOCALITY_RULES}),
+        Stage('imputed', imputation_stage, ('raw', 'medians', 'imputer')),
+        Stage('localities', locality_stage, ('imputed',),
+              params={'patterns': LOCALITY_PATTERNS, 'replacement': LOCALITY_REPLACEMENT}),
+        Stage('anomalies', fix_anomalies, ('localities',)),
+        Stage('features', add_features, ('anomalies',)),
+        Stage('filters', apply_filters, ('features',), ('filtered', 'filter_report'),
+              params={'rules': OUTLIER_RULES}),
+        Stage('dtypes', optimize_dtypes, ('filtered',), ('data', 'dtype_report')),
+        Stage('top_price_per_sqm', top_price_per_sqm_stage, ('data',), params={'top': 10}),
+        Stage('spb_data_pivot', spb_data_pivot_stage, ('data',)),
+    ]
+
+
+def analysis_pipeline(path=DATA_PATH, url=DATA_URL, offline=False, cache=None):
+    return Pipeline(analysis_stages(path, url, offline), cache)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Конвейер предобработки с кэшем стадий')
+    parser.add_argument('targets', nargs='*', default=['data'], help='выходы стадий')
+    parser.add_argument('--data', default=DATA_PATH, help='TSV с объявлениями')
+    parser.add_argument('--offline', action='store_true', help='не скачивать датасет')
+    parser.add_argument('--max-cache-mb', type=float, default=MAX_CACHE_BYTES / 2 ** 20)
+    parser.add_argument('--clear', action='store_true', help='очистить кэш стадий')
+    args = parser.parse_args(argv)
+
+    cache = StageCache(max_bytes=int(args.max_cache_mb * 2 ** 20))
+    if args.clear:
+        cache.clear()
+    pipeline = analysis_pipeline(args.data, offline=args.offline, cache=cache)
+    results = pipeline.run(*args.targets)
+    print(pipeline.summary())
+    for target in args.targets:
+        value = results if len(args.targets) == 1 else results[target]
+        if hasattr(value, 'shape'):
+            print(f'{target}: {value.shape}')
+        else:
+            print(f'{target}: {type(value).__name__}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""Хранилище очищенных объявлений, разбитое на партиции по населенному пункту и году.
+
+Каждая партиция -- каталог в колоночном формате (``real_estate.columnar``)
+с объявлениями одного года публикации и одного крупного населенного пункта.
+Населенные пункты, в которых меньше ``min_partition_rows`` объявлений,
+делят общую партицию года: строки в ней отсортированы по населенному
+пункту, а диапазоны строк каждого пункта записаны в манифест. Столбцы
+``locality_name`` и ``year`` в партициях не хранятся -- они постоянны и
+восстанавливаются при чтении.
+
+В манифесте для каждой партиции записаны число строк и минимум/максимум
+числовых столбцов, поэтому ``ListingStore.read`` отбрасывает партиции по
+населенному пункту, году и условиям на значения (``('last_price', '<',
+1e7)``), даже не открывая их, а из оставшихся читает только нужные
+столбцы и диапазоны строк через отображение в память.
+
+Пример::
+
+    store = ListingStore.write(data, 'listings_store')
+    spb = store.read(locality='Санкт-Петербург', columns=['city_centers_km', 'last_price'])
+    store.read(year=2017, where=[('last_price', '<', 10_000_000)])
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from real_estate.columnar import read_columns, write_columns
+from real_estate.dataset import CACHE_DIR, DATA_PATH
+from real_estate.imputation import OPERATORS
+
+
+STORE_PATH = os.path.join(CACHE_DIR, 'listings_store')
+MANIFEST_FILE = 'manifest.json'
+PARTITION_KEYS = ('locality_name', 'year')
+INDEX_COLUMN = '__index__'
+# Общая партиция года для небольших населенных пунктов.
+SHARED = None
+
+
+def _partition_dir(group, year):
+    return f'locality={"shared" if group is None else group}/year={year}'
+
+
+def _statistics(frame):
+    """Минимум и максимум числовых столбцов партиции."""
+    stats = {}
+    for name in frame.columns:
+        column = frame[name]
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            values = column.to_numpy(dtype='float64', na_value=np.nan)
+            known = values[~np.isnan(values)]
+            if len(known):
+                stats[name] = [float(known.min()), float(known.max())]
+    return stats
+
+
+def _may_match(stats, predicate):
+    """Может ли в партиции со статистиками ``stats`` найтись строка, где верно условие."""
+    column, op, value = predicate
+    if column not in stats:
+        return True
+    low, high = stats[column]
+    return {
+        '<': low < value,
+        '<=': low <= value,
+        '>': high > value,
+        '>=': high >= value,
+        '==': low <= value <= high,
+        '!=': not (low == high == value),
+    }[op]
+
+
+def _values(selection):
+    if selection is None:
+        return None
+    if isinstance(selection, (list, tuple, set, frozenset)):
+        return set(selection)
+    return {selection}
+
+
+class ListingStore:
+    """Чтение партиционированного хранилища с отбором партиций и столбцов."""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.localities = self.manifest['localities']
+        self.columns = self.manifest['columns']
+
+    @classmethod
+    def write(cls, data, path=STORE_PATH, min_partition_rows=1000):
+        """Записывает очищенные данные с признаками (нужен столбец ``year``).
+
+        Хранилище пересобирается целиком и подменяется атомарно.
+        """
+        names = data['locality_name'].astype(str).to_numpy()
+        years = data['year'].to_numpy(dtype='int64')
+        localities = sorted(set(names))
+        counts = pd.Series(names).value_counts()
+        large = set(counts[counts >= min_partition_rows].index)
+        columns = [name for name in data.columns if name not in PARTITION_KEYS]
+
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        frame = data[columns].copy()
+        frame[INDEX_COLUMN] = data.index.to_numpy()
+        group = np.where(np.isin(names, list(large)), names, '')
+        order = np.lexsort((names, years, group))
+        partitions = []
+        keys = pd.DataFrame({'group': group[order], 'year': years[order]})
+        for (name, year), positions in keys.groupby(['group', 'year'], sort=True).indices.items():
+            rows = order[positions]
+            part = frame.iloc[rows].reset_index(drop=True)
+            group_name = name or SHARED
+            directory = _partition_dir(localities.index(name) if name else None, year)
+            write_columns(part, os.path.join(tmp, directory), compact=False)
+            part_names = names[rows]
+            starts = np.flatnonzero(np.r_[True, part_names[1:] != part_names[:-1]])
+            stops = np.r_[starts[1:], len(rows)]
+            partitions.append({
+                'path': directory, 'locality': group_name, 'year': int(year), 'rows': len(rows),
+                'ranges': {str(part_names[start]): [int(start), int(stop)]
+                           for start, stop in zip(starts, stops)},
+                'stats': _statistics(part),
+            })
+        manifest = {'localities': localities, 'columns': columns, 'partitions': partitions,
+                    'dtypes': {name: str(data[name].dtype) for name in columns
+                               if not isinstance(data[name].dtype, pd.CategoricalDtype)},
+                    'min_partition_rows': min_partition_rows,
+                    'index_dtype': str(data.index.dtype)}
+        with open(os.path.join(tmp, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return cls(path)
+
+    # Отбор партиций ------------------------------------------------------
+
+    def plan(self, locality=None, year=None, where=()):
+        """Партиции и диапазоны строк, которые нужно прочитать.
+
+        ``locality`` и ``year`` -- значение или список значений; ``year``
+        может быть и условием ``('>=', 2017)``. ``where`` -- условия
+        ``(столбец, оператор, значение)``.
+        """
+        localities = _values(locality)
+        if isinstance(year, tuple) and len(year) == 2 and year[0] in OPERATORS:
+            years, year_condition = None, year
+        else:
+            years, year_condition = _values(year), None
+        selected = []
+        for partition in self.manifest['partitions']:
+            if years is not None and partition['year'] not in years:
+                continue
+            if year_condition and not OPERATORS[year_condition[0]](partition['year'], year_condition[1]):
+                continue
+            if not all(_may_match(partition['stats'], predicate) for predicate in where):
+                continue
+            ranges = partition['ranges']
+            if localities is not None:
+                ranges = {name: bounds for name, bounds in ranges.items() if name in localities}
+                if not ranges:
+                    continue
+            selected.append((partition, ranges))
+        return selected
+
+    def explain(self, locality=None, year=None, where=()):
+        """Сколько партиций и строк будет прочитано из общего числа."""
+        plan = self.plan(locality, year, where)
+        rows = sum(stop - start for _, ranges in plan for start, stop in ranges.values())
+        return {'partitions': len(plan), 'partitions_total': len(self.manifest['partitions']),
+                'rows': rows, 'rows_total': sum(p['rows'] for p in self.manifest['partitions'])}
+
+    # Чтение --------------------------------------------------------------
+
+    def read(self, columns=None, locality=None, year=None, where=(), mmap=True):
+        """Объявления, удовлетворяющие условиям, только со столбцами ``columns``."""
+        where = tuple(where)
+        wanted = list(columns) if columns is not None else self.columns + list(PARTITION_KEYS)
+        unknown = [name for name in wanted if name not in self.columns and name not in PARTITION_KEYS]
+        if unknown:
+            raise KeyError(f'Нет столбцов: {", ".join(unknown)}')
+        stored = [name for name in wanted if name in self.columns]
+        needed = list(dict.fromkeys(stored + [column for column, _, _ in where
+                                               if column not in PARTITION_KEYS]
+                                    + [INDEX_COLUMN]))
+        parts = []
+        for partition, ranges in self.plan(locality, year, where):
+            frame = read_columns(os.path.join(self.path, partition['path']), needed, mmap)
+            if len(ranges) < len(partition['ranges']):
+                rows = np.concatenate([np.arange(start, stop) for start, stop in ranges.values()])
+                frame = frame.iloc[rows]
+            names = np.repeat(np.array(list(ranges), dtype=object),
+                              [stop - start for start, stop in ranges.values()])
+            frame = frame.assign(locality_name=names, year=partition['year'])
+            if where:
+                mask = np.ones(len(frame), dtype=bool)
+                for column, op, value in where:
+                    mask &= OPERATORS[op](frame[column], value).to_numpy(dtype=bool, na_value=False)
+                frame = frame[mask]
+            parts.append(frame)
+        if not parts:
+            return pd.DataFrame({name: pd.Series(dtype='float64') for name in wanted})
+        result = pd.concat(parts, ignore_index=True)
+        result.index = pd.Index(result.pop(INDEX_COLUMN).to_numpy(), dtype=self.manifest['index_dtype'])
+        result['locality_name'] = pd.Categorical(result['locality_name'], categories=self.localities)
+        result['year'] = result['year'].astype('int16')
+        # В партициях без пропусков nullable-столбцы хранятся обычными
+        # массивами, с пропусками -- float64; общий тип -- из манифеста.
+        for name in stored:
+            dtype = self.manifest['dtypes'].get(name)
+            if dtype and str(result[name].dtype) != dtype:
+                result[name] = result[name].astype(dtype)
+        return result[wanted]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сборка партиционированного хранилища объявлений')
+    parser.add_argument('--output', default=STORE_PATH)
+    parser.add_argument('--data', default=DATA_PATH, help='TSV с объявлениями')
+    parser.add_argument('--offline', action='store_true', help='не скачивать датасет')
+    parser.add_argument('--min-partition-rows', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    from real_estate.stages import analysis_pipeline
+    data = analysis_pipeline(args.data, offline=args.offline).run('data')
+    store = ListingStore.write(data, args.output, args.min_partition_rows)
+    print(f'{len(data)} объявлений, {len(store.manifest["partitions"])} партиций: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
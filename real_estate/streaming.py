@@ -0,0 +1,98 @@
+"""Потоковая предобработка архивов объявлений, не помещающихся в память.
+
+Обработка идет в два прохода по файлу порциями по ``chunksize`` строк:
+
+1. ``collect_statistics`` собирает объединяемые статистики -- гистограммы
+   для общих медиан (``ceiling_height``, ``balcony``) и для медиан по
+   населенным пунктам из ``LOCALITY_RULES``;
+2. ``clean_stream`` очищает каждую порцию по этим статистикам теми же
+   функциями, что и обработка в памяти, и дописывает результат в выходной
+   файл.
+
+Память ограничена размером порции и числом различных значений в
+статистиках, а не размером архива.
+"""
+
+import os
+
+import pandas as pd
+
+from real_estate.cleaning import GLOBAL_MEDIAN_COLUMNS, clean_chunk
+from real_estate.imputation import LOCALITY_RULES, GroupMedianImputer
+from real_estate.locality import LocalityNormalizer
+from real_estate.sketches import ALL, GroupQuantileSketch
+
+
+CHUNKSIZE = 100000
+
+
+class StreamStatistics:
+    """Объединяемые статистики по архиву объявлений."""
+
+    def __init__(self, rules=LOCALITY_RULES, significant_digits=5):
+        self.rules = tuple(rules)
+        self.rows = 0
+        self.global_sketches = {column: GroupQuantileSketch(significant_digits)
+                                for column in GLOBAL_MEDIAN_COLUMNS}
+        self.group_sketches = {rule.column: GroupQuantileSketch(significant_digits)
+                               for rule in self.rules}
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for column, sketch in self.global_sketches.items():
+            sketch.update(None, chunk[column])
+        located = chunk.dropna(subset=['locality_name'])
+        for rule in self.rules:
+            self.group_sketches[rule.column].update(located[rule.by], located[rule.column])
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        for column, sketch in self.global_sketches.items():
+            sketch.merge(other.global_sketches[column])
+        for column, sketch in self.group_sketches.items():
+            sketch.merge(other.group_sketches[column])
+        return self
+
+    def medians(self):
+        return {column: sketch.median().get(ALL, float('nan'))
+                for column, sketch in self.global_sketches.items()}
+
+    def imputer(self):
+        tables = {column: sketch.median() for column, sketch in self.group_sketches.items()}
+        return GroupMedianImputer.from_tables(tables, self.rules)
+
+
+def read_chunks(path, chunksize=CHUNKSIZE, sep='\t'):
+    return pd.read_csv(path, sep=sep, chunksize=chunksize)
+
+
+def collect_statistics(path, chunksize=CHUNKSIZE, sep='\t', rules=LOCALITY_RULES):
+    """Первый проход: статистики для заполнения пропусков."""
+    statistics = StreamStatistics(rules)
+    for chunk in read_chunks(path, chunksize, sep):
+        statistics.update(chunk)
+    return statistics
+
+
+def clean_stream(path, output, chunksize=CHUNKSIZE, sep='\t', statistics=None, normalizer=None):
+    """Очищает архив ``path`` порциями и дописывает результат в ``output``.
+
+    Возвращает словарь с числом прочитанных и записанных строк.
+    """
+    if statistics is None:
+        statistics = collect_statistics(path, chunksize, sep)
+    medians = statistics.medians()
+    imputer = statistics.imputer()
+    normalizer = normalizer or LocalityNormalizer()
+    tmp = f'{output}.tmp-{os.getpid()}'
+    rows_in = rows_out = 0
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        for number, chunk in enumerate(read_chunks(path, chunksize, sep)):
+            rows_in += len(chunk)
+            cleaned = clean_chunk(chunk, medians, imputer, normalizer=normalizer)
+            rows_out += len(cleaned)
+            cleaned.to_csv(f, sep=sep, index=False, header=number == 0,
+                           date_format='%Y-%m-%dT%H:%M:%S')
+    os.replace(tmp, output)
+    return {'rows_in': rows_in, 'rows_out': rows_out}
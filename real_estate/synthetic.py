@@ -0,0 +1,323 @@
+"""Генератор синтетических объявлений со схемой real_estate_data.
+
+Профиль (``ListingProfile``) описывает датасет: доли населенных пунктов,
+медианную цену квадратного метра и расстояние до центра для каждого из
+них, долю объявлений с геоданными, квантили числовых столбцов и доли
+пропусков. Профиль снимается с настоящего файла (``from_listings``) и
+сохраняется в JSON; без файла используется встроенный профиль
+(``default``) с приближенными характеристиками real_estate_data.
+
+Объявления генерируются порциями: цена -- медиана населенного пункта,
+умноженная на остаток из квантилей профиля, комнаты и площади связаны с
+общей площадью, геоданные есть только там, где они есть в исходном
+населенном пункте. Каждая порция использует собственный генератор
+``default_rng([seed, номер порции])``, поэтому результат воспроизводим и
+файл любого размера (до десятков миллионов строк) пишется с постоянным
+расходом памяти.
+
+Запуск::
+
+    python -m real_estate.synthetic --rows 1000000 --output /tmp/listings.csv
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from real_estate.dataset import DATE_FORMAT, parse_listings
+
+
+PERCENTILES = (0, 0.1, 1, 5, 10, 25, 50, 75, 90, 95, 99, 99.9, 100)
+COLUMNS = (
+    'total_images', 'last_price', 'total_area', 'first_day_exposition', 'rooms',
+    'ceiling_height', 'floors_total', 'living_area', 'floor', 'is_apartment', 'studio',
+    'open_plan', 'kitchen_area', 'balcony', 'locality_name', 'airports_nearest',
+    'cityCenters_nearest', 'parks_around3000', 'parks_nearest', 'ponds_around3000',
+    'ponds_nearest', 'days_exposition',
+)
+# Столбцы, которые есть только у объявлений с геоданными.
+GEO_COLUMNS = ('airports_nearest', 'parks_around3000', 'parks_nearest',
+               'ponds_around3000', 'ponds_nearest')
+# Столбцы, значения которых берутся прямо из квантилей профиля.
+SAMPLED_COLUMNS = ('total_images', 'total_area', 'ceiling_height', 'floors_total', 'balcony',
+                   'days_exposition') + GEO_COLUMNS
+CHUNK_ROWS = 500_000
+
+# Встроенный профиль: приближенные квантили и доли пропусков real_estate_data.
+DEFAULT_QUANTILES = {
+    'total_images': (0, 0, 0, 1, 2, 6, 9, 14, 18, 20, 20, 32, 50),
+    'total_area': (12, 17, 25.2, 31, 33.5, 40, 52, 69.9, 93.5, 116, 197.2, 380, 900),
+    'ceiling_height': (1, 2.3, 2.5, 2.5, 2.5, 2.52, 2.65, 2.8, 3.06, 3.3, 3.82, 25, 100),
+    'floors_total': (1, 2, 2, 4, 5, 5, 9, 16, 22, 25, 26, 35, 60),
+    'balcony': (0, 0, 0, 0, 0, 0, 1, 2, 2, 2, 5, 5, 5),
+    'days_exposition': (1, 3, 4, 9, 17, 45, 95, 232, 460, 647, 1068, 1370, 1580),
+    'airports_nearest': (0, 6500, 9400, 11600, 13500, 18585, 26726, 37273, 47700, 51400,
+                         60000, 72000, 84869),
+    'parks_around3000': (0, 0, 0, 0, 0, 0, 0, 1, 2, 2, 3, 3, 3),
+    'parks_nearest': (1, 10, 28, 95, 150, 288, 455, 612, 800, 1000, 2100, 2900, 3190),
+    'ponds_around3000': (0, 0, 0, 0, 0, 0, 1, 1, 2, 3, 3, 3, 3),
+    'ponds_nearest': (13, 16, 40, 115, 170, 294, 502, 729, 940, 1050, 1250, 1330, 1344),
+    'price_residual': (-3.1, -1.4, -0.75, -0.4, -0.3, -0.14, 0, 0.14, 0.3, 0.42, 0.8, 1.5, 2.9),
+    'center_ratio': (0.02, 0.05, 0.15, 0.35, 0.5, 0.75, 1, 1.25, 1.45, 1.6, 2, 2.6, 5.4),
+    'area_per_room': (4, 8, 12, 15.5, 17, 20, 24, 29, 35, 40, 55, 90, 250),
+    'living_share': (0.02, 0.1, 0.3, 0.4, 0.45, 0.5, 0.57, 0.63, 0.7, 0.74, 0.82, 0.95, 1),
+    'kitchen_share': (0.03, 0.05, 0.07, 0.09, 0.1, 0.13, 0.17, 0.21, 0.26, 0.29, 0.37, 0.5, 0.79),
+    'exposition_day': (0, 2, 30, 200, 330, 850, 1150, 1400, 1520, 1570, 1605, 1615, 1618),
+}
+DEFAULT_MISSING = {
+    'locality_name': 0.002, 'ceiling_height': 0.388, 'floors_total': 0.004,
+    'living_area': 0.08, 'kitchen_area': 0.096, 'balcony': 0.486, 'is_apartment': 0.883,
+    'days_exposition': 0.134,
+    # Для геостолбцов -- доля пропусков среди объявлений с геоданными.
+    'airports_nearest': 0.001, 'parks_around3000': 0.0, 'parks_nearest': 0.56,
+    'ponds_around3000': 0.0, 'ponds_nearest': 0.5,
+}
+# Крупнейшие населенные пункты: доля объявлений, медианная цена метра,
+# доля объявлений с геоданными и медианное расстояние до центра.
+DEFAULT_LOCALITIES = (
+    ('Санкт-Петербург', 0.664, 104800, 0.997, 12244),
+    ('посёлок Мурино', 0.022, 85900, 0.02, 21888),
+    ('посёлок Шушары', 0.019, 76900, 1.0, 24212),
+    ('Всеволожск', 0.017, 65800, 0.0, np.nan),
+    ('Пушкин', 0.016, 100000, 1.0, 27931),
+    ('Колпино', 0.014, 74700, 1.0, 32018),
+    ('посёлок Парголово', 0.014, 91600, 1.0, 19311),
+    ('Гатчина', 0.013, 67700, 0.0, np.nan),
+    ('деревня Кудрово', 0.013, 92300, 0.0, np.nan),
+    ('Выборг', 0.01, 58100, 0.0, np.nan),
+    ('Петергоф', 0.009, 82400, 1.0, 33771),
+    ('Сестрорецк', 0.008, 99700, 1.0, 34821),
+    ('Красное Село', 0.008, 71500, 1.0, 29140),
+    ('Кудрово', 0.007, 100200, 0.0, np.nan),
+    ('поселок Мурино', 0.002, 86000, 0.0, np.nan),
+)
+DEFAULT_LOCALITY_COUNT = 364
+DEFAULT_START = '2014-11-27'
+
+
+def _sample(quantiles, uniform):
+    """Значения из кусочно-линейной обратной функции распределения."""
+    return np.interp(uniform * 100, PERCENTILES, quantiles)
+
+
+def _quantiles(values):
+    values = pd.Series(values, dtype='float64').dropna()
+    if not len(values):
+        return [0.0] * len(PERCENTILES)
+    return [float(value) for value in np.percentile(values, PERCENTILES)]
+
+
+class ListingProfile:
+    """Характеристики датасета объявлений, по которым генерируются данные."""
+
+    def __init__(self, localities, shares, price_level, geo_share, center, quantiles, missing,
+                 rates, start=DEFAULT_START):
+        self.localities = list(localities)
+        shares = np.asarray(shares, dtype='float64')
+        self.shares = shares / shares.sum()
+        self.price_level = np.asarray(price_level, dtype='float64')
+        self.geo_share = np.asarray(geo_share, dtype='float64')
+        self.center = np.asarray(center, dtype='float64')
+        self.quantiles = {name: list(values) for name, values in quantiles.items()}
+        self.missing = dict(missing)
+        # Доли studio, open_plan и is_apartment == True среди заполненных.
+        self.rates = dict(rates)
+        self.start = start
+
+    @classmethod
+    def default(cls, seed=0):
+        """Встроенный профиль, приближенно повторяющий real_estate_data."""
+        rng = np.random.default_rng(seed)
+        names, shares, price, geo, center = (list(column) for column in zip(*DEFAULT_LOCALITIES))
+        rest = DEFAULT_LOCALITY_COUNT - len(names)
+        # Остальные населенные пункты -- малые, с убывающими долями.
+        weights = 1 / np.arange(11, rest + 11) ** 1.5
+        names += [f'{("деревня", "посёлок", "поселок", "село")[i % 4]} Синтетическое-{i}'
+                  for i in range(rest)]
+        shares += list((1 - sum(shares)) * weights / weights.sum())
+        price += list(rng.lognormal(np.log(60000), 0.3, rest).round())
+        has_geo = rng.random(rest) < 0.15
+        geo += list(np.where(has_geo, 1.0, 0.0))
+        center += list(np.where(has_geo, rng.uniform(20000, 60000, rest).round(), np.nan))
+        return cls(names, shares, price, geo, center, DEFAULT_QUANTILES, DEFAULT_MISSING,
+                   {'studio': 0.0062, 'open_plan': 0.0028, 'is_apartment': 0.018})
+
+    @classmethod
+    def from_listings(cls, raw):
+        """Профиль настоящего датасета (сырые объявления ``parse_listings``)."""
+        names = raw['locality_name'].astype(str).where(raw['locality_name'].notna())
+        counts = names.value_counts()
+        localities = counts.index.tolist()
+        known = names.notna().to_numpy()
+        codes = pd.Index(localities).get_indexer(names[known])
+        price_per_sqm = (raw['last_price'] / raw['total_area']).to_numpy(dtype='float64')
+        centers = raw['cityCenters_nearest'].to_numpy(dtype='float64')
+        has_geo = ~np.isnan(centers)
+        by_locality = pd.DataFrame({'price': price_per_sqm[known], 'geo': has_geo[known],
+                                    'center': centers[known]}).groupby(codes)
+        level = by_locality['price'].median().reindex(range(len(localities))).to_numpy()
+        center = by_locality['center'].median().reindex(range(len(localities))).to_numpy()
+
+        quantiles = {column: _quantiles(raw[column]) for column in SAMPLED_COLUMNS}
+        quantiles['price_residual'] = _quantiles(np.log(price_per_sqm[known] / level[codes]))
+        quantiles['center_ratio'] = _quantiles(centers[known] / center[codes])
+        rooms = raw['rooms'].to_numpy(dtype='float64')
+        total = raw['total_area'].to_numpy(dtype='float64')
+        quantiles['area_per_room'] = _quantiles(total[rooms > 0] / rooms[rooms > 0])
+        quantiles['living_share'] = _quantiles((raw['living_area'] / raw['total_area']).clip(upper=1))
+        quantiles['kitchen_share'] = _quantiles((raw['kitchen_area'] / raw['total_area']).clip(upper=1))
+        dates = pd.to_datetime(raw['first_day_exposition'])
+        quantiles['exposition_day'] = _quantiles((dates - dates.min()).dt.days)
+
+        missing = {column: float(raw[column].isna().mean())
+                   for column in DEFAULT_MISSING if column not in GEO_COLUMNS}
+        for column in GEO_COLUMNS:
+            missing[column] = float(raw.loc[has_geo, column].isna().mean()) if has_geo.any() else 0.0
+        apartment = raw['is_apartment'].dropna().astype(bool)
+        rates = {'studio': float(raw['studio'].astype(bool).mean()),
+                 'open_plan': float(raw['open_plan'].astype(bool).mean()),
+                 'is_apartment': float(apartment.mean()) if len(apartment) else 0.0}
+        return cls(localities, counts.to_numpy(), level,
+                   by_locality['geo'].mean().reindex(range(len(localities))).to_numpy(), center,
+                   quantiles, missing, rates, dates.min().strftime('%Y-%m-%d'))
+
+    # Генерация -----------------------------------------------------------
+
+    def generate(self, rows, rng):
+        """Датафрейм из ``rows`` сырых объявлений (даты -- строки, как в файле)."""
+        def sample(name):
+            return _sample(self.quantiles[name], rng.random(rows))
+
+        def drop(values, column, where=None):
+            values = np.asarray(values, dtype='float64').copy()
+            lost = rng.random(rows) < self.missing.get(column, 0)
+            values[lost if where is None else lost | ~where] = np.nan
+            return values
+
+        locality = rng.choice(len(self.localities), rows, p=self.shares)
+        total_area = sample('total_area').round(1)
+        studio = rng.random(rows) < self.rates['studio']
+        rooms = np.clip(np.round(total_area / sample('area_per_room')), 1, 19)
+        rooms[studio] = 0
+        price = self.price_level[locality] * np.exp(sample('price_residual')) * total_area
+        floors_total = np.maximum(sample('floors_total').round(), 1)
+        floor = np.minimum(1 + np.floor(rng.random(rows) * floors_total), floors_total)
+        geo = rng.random(rows) < self.geo_share[locality]
+        geo &= ~np.isnan(self.center[locality])
+        apartment = np.where(rng.random(rows) < self.rates['is_apartment'], True, False).astype(object)
+        apartment[rng.random(rows) < self.missing['is_apartment']] = np.nan
+        names = np.asarray(self.localities, dtype=object)[locality]
+        names[rng.random(rows) < self.missing['locality_name']] = np.nan
+        day = np.floor(sample('exposition_day'))
+        dates = pd.Timestamp(self.start) + pd.to_timedelta(day, unit='D')
+
+        data = {
+            'total_images': sample('total_images').round(),
+            'last_price': np.maximum(price.round(-3), 12000),
+            'total_area': total_area,
+            'first_day_exposition': dates.strftime(DATE_FORMAT),
+            'rooms': rooms,
+            'ceiling_height': drop(sample('ceiling_height').round(2), 'ceiling_height'),
+            'floors_total': drop(floors_total, 'floors_total'),
+            'living_area': drop((total_area * sample('living_share')).round(1), 'living_area'),
+            'floor': floor,
+            'is_apartment': apartment,
+            'studio': studio,
+            'open_plan': rng.random(rows) < self.rates['open_plan'],
+            'kitchen_area': drop((total_area * sample('kitchen_share')).round(1), 'kitchen_area'),
+            'balcony': drop(sample('balcony').round(), 'balcony'),
+            'locality_name': names,
+            'cityCenters_nearest': np.where(geo, (self.center[locality] * sample('center_ratio')).round(),
+                                            np.nan),
+            'days_exposition': drop(sample('days_exposition').round(), 'days_exposition'),
+        }
+        for column in GEO_COLUMNS:
+            data[column] = drop(sample(column).round(), column, geo)
+        for column in ('total_images', 'rooms', 'floor'):
+            data[column] = data[column].astype('int64')
+        return pd.DataFrame(data)[list(COLUMNS)]
+
+    def chunks(self, rows, seed=0, chunk_rows=CHUNK_ROWS):
+        """Порции объявлений общим размером ``rows``."""
+        for number, start in enumerate(range(0, rows, chunk_rows)):
+            rng = np.random.default_rng([seed, number])
+            yield self.generate(min(chunk_rows, rows - start), rng)
+
+    # Сохранение ----------------------------------------------------------
+
+    def to_dict(self):
+        return {'localities': self.localities, 'shares': self.shares.tolist(),
+                'price_level': self.price_level.tolist(), 'geo_share': self.geo_share.tolist(),
+                'center': [None if np.isnan(value) else value for value in self.center.tolist()],
+                'quantiles': self.quantiles, 'missing': self.missing, 'rates': self.rates,
+                'start': self.start}
+
+    @classmethod
+    def from_dict(cls, state):
+        state = dict(state)
+        state['center'] = [np.nan if value is None else value for value in state['center']]
+        return cls(**state)
+
+    def save(self, path):
+        tmp = f'{path}.tmp-{os.getpid()}'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def synthetic_listings(rows, profile=None, seed=0):
+    """Синтетические объявления в памяти (для небольших размеров)."""
+    profile = profile or ListingProfile.default()
+    chunks = list(profile.chunks(rows, seed))
+    return pd.concat(chunks, ignore_index=True) if chunks else profile.generate(0, np.random.default_rng(seed))
+
+
+def write_listings(path, rows, profile=None, seed=0, chunk_rows=CHUNK_ROWS, sep='\t'):
+    """Пишет ``rows`` синтетических объявлений в TSV порциями."""
+    profile = profile or ListingProfile.default()
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        for number, chunk in enumerate(profile.chunks(rows, seed, chunk_rows)):
+            chunk.to_csv(f, sep=sep, index=False, header=number == 0)
+    os.replace(tmp, path)
+    return path
+
+
+def load_profile(path=None):
+    """Профиль из JSON, из файла с объявлениями или встроенный."""
+    if path is None:
+        return ListingProfile.default()
+    if path.endswith('.json'):
+        return ListingProfile.load(path)
+    return ListingProfile.from_listings(parse_listings(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Генерация синтетических объявлений')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', help='JSON профиля или файл с объявлениями; '
+                                          'по умолчанию -- встроенный профиль')
+    parser.add_argument('--save-profile', help='сохранить профиль в JSON')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    profile = load_profile(args.profile)
+    if args.save_profile:
+        profile.save(args.save_profile)
+    write_listings(args.output, args.rows, profile, args.seed, args.chunk_rows)
+    print(f'{args.rows} объявлений записано в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+# Населенный пункт -> (доля объявлений, цена квадратного метра, есть ли геоданные).
+LOCALITIES = {
+    'Санкт-Петербург': (0.62, 110000, True),
+    'посёлок Мурино': (0.08, 85000, False),
+    'Пушкин': (0.07, 100000, True),
+    'деревня Кудрово': (0.06, 92000, False),
+    'посёлок Шушары': (0.06, 78000, True),
+    'городской посёлок Янино-1': (0.04, 70000, False),
+    'Всеволожск': (0.04, 68000, False),
+    'коттеджный посёлок Лесное': (0.02, 60000, False),
+    'поселок городского типа Рощино': (0.01, 55000, False),
+}
+
+
+def make_listings(rows, seed=0):
+    """Сырые объявления со схемой real_estate_data: пропуски, выбросы и разные написания."""
+    rng = np.random.default_rng(seed)
+    names = np.array(list(LOCALITIES))
+    shares = np.array([share for share, _, _ in LOCALITIES.values()])
+    locality = rng.choice(names, rows, p=shares / shares.sum())
+    base_price = np.array([LOCALITIES[name][1] for name in locality], dtype='float64')
+    geodata = np.array([LOCALITIES[name][2] for name in locality]) & (rng.random(rows) < 0.9)
+
+    total_area = np.round(rng.lognormal(np.log(52), 0.4, rows), 1)
+    floors_total = rng.choice([5.0, 9.0, 12.0, 16.0, 25.0], rows)
+    floor = np.minimum(rng.integers(1, 26, rows), floors_total).astype('int64')
+    centers = np.where(geodata, rng.uniform(1000, 30000, rows).round(), np.nan)
+    price = (base_price * total_area * (1.3 - np.nan_to_num(centers, nan=20000) / 60000)
+             * rng.lognormal(0, 0.15, rows)).round(-3)
+    parks = np.where(geodata, rng.integers(0, 4, rows), np.nan)
+    ponds = np.where(geodata, rng.integers(0, 4, rows), np.nan)
+    days = rng.integers(0, 5 * 365, rows)
+    exposition = (pd.Timestamp('2015-01-01') + pd.to_timedelta(days, unit='D')
+                  + pd.to_timedelta(rng.integers(0, 86400, rows), unit='s'))
+
+    def holes(values, share):
+        values = np.asarray(values, dtype='float64').copy()
+        values[rng.random(rows) < share] = np.nan
+        return values
+
+    data = pd.DataFrame({
+        'total_images': rng.integers(0, 21, rows),
+        'last_price': price,
+        'total_area': total_area,
+        'first_day_exposition': exposition.strftime('%Y-%m-%dT%H:%M:%S'),
+        'rooms': np.clip(np.round(total_area / 20), 1, 7).astype('int64'),
+        'ceiling_height': holes(rng.choice([2.5, 2.6, 2.7, 2.75, 3.0, 3.2, 27.0], rows,
+                                           p=[0.3, 0.2, 0.2, 0.1, 0.1, 0.08, 0.02]), 0.35),
+        'floors_total': holes(floors_total, 0.01),
+        'living_area': holes((total_area * rng.uniform(0.45, 0.65, rows)).round(1), 0.08),
+        'floor': floor,
+        'is_apartment': pd.Series(rng.choice([None, False, True], rows, p=[0.88, 0.1, 0.02]),
+                                  dtype=object),
+        'studio': rng.random(rows) < 0.01,
+        'open_plan': rng.random(rows) < 0.005,
+        'kitchen_area': holes((total_area * rng.uniform(0.12, 0.22, rows)).round(1), 0.08),
+        'balcony': holes(rng.integers(0, 3, rows), 0.4),
+        'locality_name': pd.Series(locality, dtype=object),
+        'airports_nearest': np.where(geodata, rng.uniform(9000, 60000, rows).round(), np.nan),
+        'cityCenters_nearest': centers,
+        'parks_around3000': parks,
+        'parks_nearest': np.where(parks >= 1, holes(rng.uniform(50, 2500, rows).round(), 0.1),
+                                  np.nan),
+        'ponds_around3000': ponds,
+        'ponds_nearest': np.where(ponds >= 1, holes(rng.uniform(50, 1300, rows).round(), 0.1),
+                                  np.nan),
+        'days_exposition': holes(rng.integers(1, 1000, rows), 0.13),
+    })
+    data.loc[rng.choice(rows, 3, replace=False), 'locality_name'] = None
+    return data
+
+
+@pytest.fixture(scope='session')
+def listings():
+    """Сырые объявления; тесты берут копию, если меняют данные."""
+    return make_listings(3000, seed=7)
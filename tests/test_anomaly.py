@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from real_estate.anomaly import AnomalyDetector
+from real_estate.cleaning import clean
+
+
+@pytest.fixture(scope='module')
+def data(listings):
+    return clean(listings)
+
+
+def test_underpriced_listing_is_flagged(data):
+    data = data.copy()
+    row = data.index[data['locality_name'] == 'Санкт-Петербург'][0]
+    data.loc[row, 'price_per_sqm'] /= 10
+    detector = AnomalyDetector().fit(data)
+    flagged = detector.suspicious(data, top=5)
+    assert flagged.index[0] == row
+    assert flagged['z_similar'].iloc[0] < -3.5
+
+
+def test_no_known_distances(data):
+    data = data.copy()
+    data['city_centers_km'] = np.nan
+    detector = AnomalyDetector().fit(data)
+    assert len(detector.distance.index) == 0
+    # Без расстояний сравнение идет со статистиками населенного пункта.
+    scores = detector.score(data)
+    assert np.isfinite(scores['z_distance']).all()
+
+
+def test_groups_smaller_than_min_rows(data):
+    head = data.head(4)
+    detector = AnomalyDetector(min_rows=5).fit(head)
+    scores = detector.score(head)
+    assert (scores['baseline'] == 'общая').all()
+    np.testing.assert_allclose(scores['z_similar'], scores['z_distance'])
+
+
+def test_save_load_round_trip(data, tmp_path):
+    detector = AnomalyDetector(min_rows=3, shrinkage=2.5).fit(data)
+    loaded = AnomalyDetector.load(detector.save(str(tmp_path / 'anomaly.npz')))
+    assert loaded.shrinkage == 2.5
+    assert (loaded.min_rows, loaded.max_rooms, loaded.max_km) == (3, 10, 100)
+    assert loaded.score(data).equals(detector.score(data))
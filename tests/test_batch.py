@@ -0,0 +1,28 @@
+import numpy as np
+
+from real_estate.batch import OUTPUT_COLUMNS, PRICE_COLUMNS, BatchValuer, read_results, value_file
+
+
+def test_unpriced_listings_are_valued(listings):
+    valuer = BatchValuer.from_listings(listings)
+    chunk = listings.head(200)
+    priced = valuer.value(chunk)
+    unpriced = valuer.value(chunk.drop(columns='last_price'))
+    assert set(PRICE_COLUMNS + ('price_ratio',)) <= set(priced)
+    assert not set(PRICE_COLUMNS + ('price_ratio',)) & set(unpriced)
+    assert set(OUTPUT_COLUMNS) <= set(unpriced)
+    np.testing.assert_array_equal(unpriced['baseline_price'], priced['baseline_price'])
+
+
+def test_resume_skips_finished_chunks(listings, tmp_path):
+    path = str(tmp_path / 'feed.tsv')
+    output = str(tmp_path / 'valuations')
+    listings.head(1000).to_csv(path, sep='\t', index=False)
+    valuer = BatchValuer.from_listings(listings)
+    first = value_file(path, output, valuer, chunk_rows=300, workers=1, progress=None)
+    again = value_file(path, output, valuer, chunk_rows=300, workers=1, progress=None)
+    assert first['chunks'] == again['skipped_chunks'] == 4
+    assert again['chunks'] == 0
+    results = read_results(output)
+    assert results['row'].is_monotonic_increasing
+    assert len(results) == first['rows_out']
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from real_estate.columnar import read_columns, write_columns
+
+
+def test_integers_are_not_narrowed(tmp_path):
+    frame = pd.DataFrame({'rooms': np.array([1, 2, 3], dtype='int64'),
+                          'last_price': [5e6, 7.5e6, np.nan],
+                          'total_area': [50.3, 61.1, 44.0]})
+    loaded = read_columns(write_columns(frame, str(tmp_path / 'frame')))
+    assert loaded['rooms'].dtype == 'int64'
+    # Без этого int8 переполнился бы молча.
+    assert (loaded['rooms'] * 100).tolist() == [100, 200, 300]
+    # float32 -- только если значения сохраняются точно.
+    assert loaded['last_price'].dtype == 'float32'
+    assert loaded['total_area'].dtype == 'float64'
+    for name in frame:
+        np.testing.assert_array_equal(loaded[name].to_numpy(dtype='float64'),
+                                      frame[name].to_numpy(dtype='float64'))
+
+
+def test_categories_dates_and_booleans_round_trip(tmp_path):
+    frame = pd.DataFrame({'locality_name': ['Пушкин', None, 'Пушкин'],
+                          'first_day_exposition': pd.to_datetime(['2018-01-01', None, '2019-05-02']),
+                          'is_apartment': [True, None, 0]})
+    loaded = read_columns(write_columns(frame, str(tmp_path / 'frame')), mmap=False)
+    assert loaded['locality_name'].isna().tolist() == [False, True, False]
+    assert loaded['locality_name'].dropna().astype(str).tolist() == ['Пушкин', 'Пушкин']
+    assert loaded['first_day_exposition'].equals(frame['first_day_exposition'])
+    assert loaded['first_day_exposition'].dtype == frame['first_day_exposition'].dtype
+    assert loaded['is_apartment'].isna().tolist() == [False, True, False]
+    assert loaded['is_apartment'].dropna().tolist() == [True, False]
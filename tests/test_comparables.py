@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from real_estate.cleaning import clean
+from real_estate.comparables import ComparablesIndex
+
+
+@pytest.fixture(scope='module')
+def data(listings):
+    return clean(listings)
+
+
+def brute_force(index, queries, k):
+    """Расстояния до k ближайших объявлений того же населенного пункта перебором."""
+    points = index._points(index.values, index.floor, index.locality)
+    query_points, locality = index._prepare(queries)
+    result = np.full((len(queries), k), np.inf)
+    for i, (point, code) in enumerate(zip(query_points, locality)):
+        rows = np.flatnonzero(index.locality == code) if code >= 0 else np.arange(len(points))
+        distances = np.sort(np.sqrt(((points[rows] - point) ** 2).sum(axis=1)))[:k]
+        result[i, :len(distances)] = distances
+    return result
+
+
+def test_tree_matches_brute_force(data):
+    # Маленькие листья, чтобы поиск действительно обходил дерево.
+    index = ComparablesIndex(k=7, leaf_size=8).fit(data)
+    queries = data.sample(60, random_state=1).copy()
+    queries['locality_name'] = queries['locality_name'].astype(object)
+    queries.loc[queries.index[:5], 'locality_name'] = 'Неизвестный поселок'
+    queries.loc[queries.index[5:10], 'ceiling_height'] = np.nan
+    distances, rows = index.neighbours(queries)
+    assert np.allclose(distances, brute_force(index, queries, 7))
+    # Найденные строки действительно на этих расстояниях.
+    points = index._points(index.values, index.floor, index.locality)
+    query_points, _ = index._prepare(queries)
+    found = np.sqrt(((points[rows] - query_points[:, None, :]) ** 2).sum(axis=2))
+    assert np.allclose(found, distances)
+
+
+def test_string_index(data, tmp_path):
+    data = data.head(500).copy()
+    data.index = [f'id-{label}' for label in data.index]
+    index = ComparablesIndex(k=3).fit(data)
+    listing = data.iloc[0].to_dict()
+    table = index.comparables(listing)
+    assert data.index[0] in table.index
+    loaded = ComparablesIndex.load(index.save(str(tmp_path / 'comparables')))
+    assert loaded.comparables(listing).index.equals(table.index)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from real_estate.cleaning import clean
+from real_estate.correlation import (TARGETS, bootstrap_intervals, correlations,
+                                     numeric_features)
+
+
+@pytest.fixture(scope='module')
+def data(listings):
+    return clean(listings)
+
+
+def expected_table(data, method):
+    features = numeric_features(data)
+    frame = data[features + list(TARGETS)].astype('float64')
+    matrix = frame.corr(method=method)
+    return matrix.loc[features, list(TARGETS)]
+
+
+@pytest.mark.parametrize('method', ['pearson', 'spearman'])
+def test_matches_dataframe_corr(data, method):
+    result = correlations(data, methods=(method,), min_rows=0)
+    actual = result.pivot(index='feature', columns='target', values='r')
+    expected = expected_table(data, method)
+    actual = actual.loc[expected.index, list(expected.columns)]
+    assert np.allclose(actual, expected, equal_nan=True)
+
+
+def test_grouped_matches_dataframe_corr(data):
+    result = correlations(data, by='locality_name', min_rows=0)
+    pushkin = result[(result['locality_name'] == 'Пушкин') & (result['method'] == 'spearman')]
+    actual = pushkin.pivot(index='feature', columns='target', values='r')
+    expected = expected_table(data[data['locality_name'] == 'Пушкин'], 'spearman')
+    assert np.allclose(actual.loc[expected.index, list(expected.columns)], expected, equal_nan=True)
+
+
+def test_bootstrap_does_not_depend_on_workers(data):
+    features = ['total_area', 'rooms', 'cityCenters_nearest']
+    single = bootstrap_intervals(data, features, resamples=60, workers=1)
+    pooled = bootstrap_intervals(data, features, resamples=60, workers=2)
+    pd.testing.assert_frame_equal(single, pooled)
+    assert (single['low'] <= single['r']).all() and (single['r'] <= single['high']).all()
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from real_estate.dataset import load_listings
+
+
+def write(frame, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame.to_csv(path, sep='\t', index=False)
+    return path
+
+
+def caches(cache_dir):
+    return sorted(entry for entry in os.listdir(cache_dir) if entry.startswith('real_estate_data-'))
+
+
+def test_cache_is_rebuilt_when_source_changes(listings, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    path = write(listings.head(40), str(tmp_path / 'real_estate_data.csv'))
+    first = load_listings(path, None, cache_dir)
+    assert len(first) == 40
+    old, = caches(cache_dir)
+    assert len(load_listings(path, None, cache_dir)) == 40
+    assert caches(cache_dir) == [old]
+
+    write(listings.head(60), path)
+    assert len(load_listings(path, None, cache_dir)) == 60
+    new, = caches(cache_dir)
+    assert new != old
+
+
+def test_same_file_name_in_two_directories(listings, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = write(listings.head(40), str(tmp_path / 'a' / 'real_estate_data.csv'))
+    second = write(listings.head(50), str(tmp_path / 'b' / 'real_estate_data.csv'))
+    load_listings(first, None, cache_dir)
+    load_listings(second, None, cache_dir)
+    # Кэши разных файлов с одинаковым именем не вытесняют друг друга.
+    assert len(caches(cache_dir)) == 2
+    assert len(load_listings(first, None, cache_dir)) == 40
+    assert len(caches(cache_dir)) == 2
+
+
+def test_offline(listings, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    missing = str(tmp_path / 'real_estate_data.csv')
+    url = 'https://example.invalid/real_estate_data.csv'
+    with pytest.raises(FileNotFoundError):
+        load_listings(missing, url, cache_dir, offline=True)
+    # Ранее скачанная копия используется без сети.
+    write(listings.head(30), os.path.join(cache_dir, 'downloads', 'real_estate_data.csv'))
+    assert len(load_listings(missing, url, cache_dir, offline=True)) == 30
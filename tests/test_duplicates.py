@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from real_estate.duplicates import DuplicateDetector
+
+
+LISTING = {
+    'locality_name': 'Санкт-Петербург', 'floor': 3, 'floors_total': 9, 'total_area': 50.0,
+    'kitchen_area': 9.0, 'last_price': 5000000.0, 'first_day_exposition': '2018-01-01',
+    'airports_nearest': 20000.0, 'cityCenters_nearest': 10000.0,
+}
+
+
+def frame(*changes):
+    return pd.DataFrame([dict(LISTING, **change) for change in changes])
+
+
+def pairs(data):
+    found = DuplicateDetector().pairs(data)
+    return sorted(zip(found['left'], found['right']))
+
+
+def test_relisting_is_found():
+    data = frame({}, {'first_day_exposition': '2018-03-02', 'last_price': 4800000.0})
+    found = DuplicateDetector().pairs(data)
+    assert list(zip(found['left'], found['right'])) == [(0, 1)]
+    assert found['days_between'].iloc[0] == 60
+    np.testing.assert_allclose(found['price_change'], [-0.04])
+
+
+def test_different_listings_are_not_paired():
+    data = frame({}, {'floor': 4}, {'locality_name': 'Пушкин'}, {'last_price': 7000000.0},
+                 {'first_day_exposition': '2020-01-01'}, {'airports_nearest': 25000.0})
+    assert pairs(data) == []
+
+
+def test_spellings_of_locality_are_the_same_place():
+    data = frame({'locality_name': 'посёлок Мурино'}, {'locality_name': 'поселок Мурино'})
+    assert pairs(data) == [(0, 1)]
+
+
+def test_listings_without_date_never_match():
+    data = frame({'first_day_exposition': None}, {'first_day_exposition': None},
+                 {'first_day_exposition': '2018-01-05'})
+    assert pairs(data) == []
+    assert (DuplicateDetector().clusters(data) == -1).all()
+
+
+def test_missing_distance_is_compatible():
+    data = frame({}, {'airports_nearest': np.nan})
+    assert pairs(data) == [(0, 1)]
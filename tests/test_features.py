@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from real_estate.features import FLOOR_TYPES, add_features, floor_type, get_floor_type
+
+
+def test_floor_type_matches_row_wise_apply(listings):
+    data = listings.copy()
+    data.loc[data.index[:5], 'floors_total'] = np.nan
+    expected = data.apply(get_floor_type, axis=1)
+    actual = floor_type(data['floor'], data['floors_total'])
+    assert list(actual.categories) == list(FLOOR_TYPES)
+    assert actual.astype(str).tolist() == expected.tolist()
+
+
+def test_first_floor_of_one_storey_house_is_first():
+    assert floor_type([1, 3, 5, 2], [1, 3, 9, np.nan]).astype(str).tolist() == \
+        ['первый', 'последний', 'другой', 'другой']
+
+
+def test_add_features(listings):
+    data = add_features(listings.head(50))
+    np.testing.assert_allclose(data['price_per_sqm'], data['last_price'] / data['total_area'])
+    exposition = pd.to_datetime(listings.head(50)['first_day_exposition'])
+    assert data['year'].tolist() == exposition.dt.year.tolist()
+    assert data['city_centers_km'].equals((data['cityCenters_nearest'] / 1000).round())
+
+
+def test_add_features_single_listing_without_price():
+    listing = {'floor': 1, 'floors_total': 5, 'cityCenters_nearest': 12400.0}
+    data = add_features(listing)
+    assert 'price_per_sqm' not in data
+    assert data['floor_type'].iloc[0] == 'первый'
+    assert data['city_centers_km'].iloc[0] == 12
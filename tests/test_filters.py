@@ -0,0 +1,51 @@
+import numpy as np
+
+from real_estate.filters import OUTLIER_RULES, FilterRule, apply_filters, override_rules
+
+
+def filter_like_notebook(data):
+    data = data[data['total_area'] < 200]
+    data = data[data['living_area'] < 150]
+    data = data[data['kitchen_area'] < 50]
+    data = data[data['last_price'] < 40000000]
+    data = data[data['rooms'] < 6]
+    data = data[data['ceiling_height'] < 5]
+    data = data[data['floor'] < 25]
+    data = data[data['floors_total'] < 30]
+    data = data[data['airports_nearest'] < 70000]
+    return data[(data['parks_nearest'] < 1500) | (data['parks_nearest'].isna())]
+
+
+def test_mask_matches_sequential_filters(listings):
+    filtered, report = apply_filters(listings)
+    expected = filter_like_notebook(listings)
+    assert filtered.index.equals(expected.index)
+    assert report.rows_out == len(expected)
+    # Отчет по очереди правил повторяет сокращение данных шаг за шагом.
+    assert report.to_frame()['dropped'].sum() == report.dropped
+
+
+def test_report_counts(listings):
+    _, report = apply_filters(listings)
+    for number, rule in enumerate(OUTLIER_RULES):
+        assert report.failed[number] == (~rule.passes(listings)).sum()
+        assert report.overlap[number, number] == report.failed[number]
+    assert (report.only <= report.failed).all()
+    failed = np.column_stack([~rule.passes(listings) for rule in OUTLIER_RULES]).astype('int64')
+    assert (report.overlap == failed.T @ failed).all()
+
+
+def test_missing_values_fail_unless_kept(listings):
+    data = listings.head(4).copy()
+    data['parks_nearest'] = [100.0, 2000.0, np.nan, np.nan]
+    data['total_area'] = [50.0, 50.0, np.nan, 50.0]
+    assert FilterRule('parks_nearest', '<', 1500, keep_missing=True).passes(data).tolist() == \
+        [True, False, True, True]
+    assert FilterRule('total_area', '<', 200).passes(data).tolist() == [True, True, False, True]
+
+
+def test_override_rules():
+    rules = override_rules(OUTLIER_RULES, last_price=60000000)
+    limits = {rule.column: rule.value for rule in rules}
+    assert limits['last_price'] == 60000000
+    assert limits['total_area'] == 200
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from real_estate import importance
+from real_estate.cleaning import clean
+from real_estate.importance import permutation_importance
+from real_estate.model import PriceModel
+
+
+FEATURES = ['total_area', 'rooms', 'cityCenters_nearest', 'locality_name']
+
+
+@pytest.fixture(scope='module')
+def data(listings):
+    return clean(listings)
+
+
+def test_does_not_depend_on_workers(data):
+    single = permutation_importance(data, FEATURES, repeats=2, workers=1, cache=False)
+    pooled = permutation_importance(data, FEATURES, repeats=2, workers=2, cache=False)
+    pd.testing.assert_frame_equal(single, pooled)
+    assert single.loc[single['feature'] == 'total_area', 'importance'].iloc[0] > 0
+
+
+def test_grouped_rows(data):
+    result = permutation_importance(data, FEATURES, by='locality_name', repeats=2,
+                                    workers=1, cache=False, min_rows=1)
+    assert 'locality_name' not in set(result['feature'])
+    rows = result.groupby('locality_name')['rows'].first()
+    assert rows.sum() == len(data) - len(importance.split_train_test(data, 0.2, 12345)[0])
+
+
+def test_repeated_call_is_cached(data, tmp_path, monkeypatch):
+    monkeypatch.setattr(importance, 'IMPORTANCE_DIR', str(tmp_path / 'importance'))
+    first = permutation_importance(data, FEATURES, repeats=2, workers=1)
+
+    def fail(self, train):
+        raise AssertionError('модель обучается повторно')
+
+    monkeypatch.setattr(PriceModel, 'fit', fail)
+    pd.testing.assert_frame_equal(permutation_importance(data, FEATURES, repeats=2, workers=1),
+                                  first)
+    # Другие параметры -- другой ключ кэша.
+    with pytest.raises(AssertionError, match='повторно'):
+        permutation_importance(data, FEATURES, repeats=3, workers=1)
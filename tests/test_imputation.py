@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from real_estate.cleaning import fill_missing, global_medians
+from real_estate.imputation import LOCALITY_RULES, GroupMedianImputer
+
+
+def fill_like_notebook(data):
+    """Заполнение пропусков в том виде, в каком оно было в исходном анализе."""
+    data = data.copy()
+    for column in ('airports_nearest', 'cityCenters_nearest'):
+        data[column] = data[column].fillna(data.groupby('locality_name')[column].transform('median'))
+        data[column] = data[column].fillna(data.groupby('locality_name')[column].median().median())
+    for around, nearest in (('parks_around3000', 'parks_nearest'),
+                            ('ponds_around3000', 'ponds_nearest')):
+        data[around] = data[around].fillna(data.groupby('locality_name')[around].transform('median'))
+        data[around] = data[around].fillna(0)
+        for name in data['locality_name'].unique():
+            data.loc[(data['locality_name'] == name) & data[nearest].isna()
+                     & (data[around] >= 1), nearest] = \
+                data.loc[data['locality_name'] == name, nearest].median()
+    return data
+
+
+def test_group_medians_match_notebook(listings):
+    data = listings.dropna(subset=['locality_name']).reset_index(drop=True)
+    expected = fill_like_notebook(data)
+    actual = GroupMedianImputer(LOCALITY_RULES).fit_transform(data)
+    for rule in LOCALITY_RULES:
+        np.testing.assert_allclose(actual[rule.column].to_numpy(dtype='float64'),
+                                   expected[rule.column].to_numpy(dtype='float64'))
+
+
+def test_fit_on_reference_fills_new_listings(listings):
+    imputer = GroupMedianImputer(LOCALITY_RULES).fit(listings.dropna(subset=['locality_name']))
+    table = imputer.tables['airports_nearest']
+    locality = table.dropna().index[0]
+    new = listings.head(2).copy()
+    new['locality_name'] = [locality, 'Неизвестный поселок']
+    new['airports_nearest'] = np.nan
+    filled = imputer.transform(new)['airports_nearest'].to_numpy()
+    assert filled[0] == table[locality]
+    # Для пункта без статистики -- медиана медиан по пунктам.
+    assert filled[1] == table.median()
+
+
+def test_fill_missing_drops_rows_without_locality(listings):
+    data = listings.copy()
+    data.loc[data.index[:3], 'locality_name'] = None
+    imputer = GroupMedianImputer(LOCALITY_RULES).fit(data.dropna(subset=['locality_name']))
+    filled = fill_missing(data, global_medians(data), imputer)
+    assert len(filled) == data['locality_name'].notna().sum()
+    assert not filled['ceiling_height'].isna().any()
+    assert pd.api.types.is_datetime64_any_dtype(filled['first_day_exposition'])
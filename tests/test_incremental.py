@@ -0,0 +1,21 @@
+import pandas as pd
+
+from real_estate.incremental import IncrementalState
+
+
+def test_update_matches_full_rebuild(listings, tmp_path):
+    state = IncrementalState.build(listings.iloc[:2000])
+    # Состояние переживает сохранение между ежедневными обновлениями.
+    state = IncrementalState.load(state.save(str(tmp_path / 'state')))
+    state.update(listings.iloc[2000:])
+    assert state.rows_in == len(listings)
+    report = state.consistency_check(listings)
+    assert report.ok, report.to_frame()
+
+
+def test_save_load_round_trip(listings, tmp_path):
+    state = IncrementalState.build(listings)
+    loaded = IncrementalState.load(state.save(str(tmp_path / 'state')))
+    pd.testing.assert_frame_equal(loaded.top_price_per_sqm(), state.top_price_per_sqm())
+    pd.testing.assert_frame_equal(loaded.spb_data_pivot(), state.spb_data_pivot())
+    assert loaded.medians() == state.medians()
@@ -0,0 +1,44 @@
+import json
+
+import pandas as pd
+
+from real_estate.locality import (LOCALITY_PATTERNS, LOCALITY_REPLACEMENT, LocalityNormalizer,
+                                  normalize_locality_names)
+
+
+NOTEBOOK_PATTERNS = ['коттеджный посёлок', 'посёлок городского типа',
+                     'городской поселок', 'поселок городского типа',
+                     'городской посёлок', 'посёлок при железнодорожной станции',
+                     'посёлок при железнодорожной станции', 'посёлок']
+
+
+def test_transform_matches_regex_replace(listings):
+    names = pd.concat([listings['locality_name'],
+                       pd.Series(['городской посёлок Янино-1', 'коттеджный посёлок Лесное',
+                                  'посёлок при железнодорожной станции Вещево', None])],
+                      ignore_index=True)
+    expected = names.replace(NOTEBOOK_PATTERNS, 'поселок', regex=True)
+    actual = LocalityNormalizer().transform(names)
+    assert actual.isna().equals(expected.isna())
+    assert actual.dropna().astype(str).tolist() == expected.dropna().tolist()
+
+
+def test_normalize_locality_names_keeps_other_columns(listings):
+    data = listings.head(20)
+    normalized = normalize_locality_names(data)
+    assert normalized.drop(columns='locality_name').equals(data.drop(columns='locality_name'))
+    assert not normalized['locality_name'].astype(str).str.contains('посёлок').any()
+
+
+def test_saved_map_is_reused(tmp_path):
+    path = str(tmp_path / 'names.json')
+    normalizer = LocalityNormalizer().fit(['посёлок Мурино', 'Санкт-Петербург'])
+    normalizer.save(path)
+    loaded = LocalityNormalizer.load_or_create(path)
+    assert loaded.mapping == {'посёлок Мурино': 'поселок Мурино',
+                              'Санкт-Петербург': 'Санкт-Петербург'}
+    # Другой список написаний -- словарь устарел и создается заново.
+    assert LocalityNormalizer.load_or_create(path, patterns=('деревня',)).mapping == {}
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['patterns'] == list(LOCALITY_PATTERNS)
+    assert loaded.replacement == LOCALITY_REPLACEMENT
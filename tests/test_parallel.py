@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+from real_estate.cleaning import clean
+from real_estate.parallel import ShardedFrame, parallel_clean
+
+
+@pytest.fixture(scope='module')
+def expected(listings):
+    return clean(listings)
+
+
+@pytest.mark.parametrize('workers, shards', [(1, 4), (2, 3)])
+def test_parallel_clean_equals_clean(listings, expected, workers, shards):
+    data, tables = parallel_clean(listings, workers=workers, shards=shards)
+    # Колоночный формат хранит is_apartment логическим столбцом, clean -- столбцом
+    # объектов True/False; значения совпадают.
+    pd.testing.assert_frame_equal(data.drop(columns='is_apartment'),
+                                  expected.drop(columns='is_apartment'))
+    assert data['is_apartment'].tolist() == expected['is_apartment'].tolist()
+    top = expected.pivot_table(index='locality_name', values='price_per_sqm',
+                               aggfunc='mean', observed=True)['price_per_sqm']
+    assert (tables['top_price_per_sqm']['price_per_sqm']
+            == top.round().sort_values(ascending=False).head(10).to_numpy()).all()
+
+
+def test_shards_cover_all_rows(listings):
+    with ShardedFrame.create(listings, 5) as sharded:
+        rows = pd.concat([sharded.read(start, stop) for start, stop in sharded.bounds])
+    assert sorted(rows.index) == list(range(len(listings)))
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+import pytest
+
+from real_estate.cleaning import clean
+from real_estate.report import EDA_CHARTS, compute_bins, render_regions
+
+
+pytest.importorskip('matplotlib')
+
+
+def test_histogram_bins_match_numpy(listings):
+    data = clean(listings)
+    bins = compute_bins(data)
+    chart, = (chart for chart in EDA_CHARTS if chart.name == 'total_area')
+    counts, edges = np.histogram(data['total_area'], bins=chart.bins)
+    np.testing.assert_array_equal(bins['total_area']['counts'], counts)
+    np.testing.assert_allclose(bins['total_area']['edges'], edges)
+
+
+def test_region_without_rows(listings, tmp_path):
+    data = clean(listings)
+    results = render_regions(data, str(tmp_path), ['Пушкин', 'Пушкино'], workers=1)
+    for region in ('all', 'Пушкин', 'Пушкино'):
+        assert len(results[region]['rendered']) == len(EDA_CHARTS)
+        assert os.path.exists(tmp_path / region / 'floor_type_last_price.png')
+    # Повторный запуск по тем же данным ничего не перерисовывает.
+    again = render_regions(data, str(tmp_path), ['Пушкино'], workers=1)
+    assert again['Пушкино']['rendered'] == []
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from real_estate.cleaning import clean
+from real_estate.schema import SCHEMA, optimize_dtypes
+
+
+@pytest.fixture(scope='module')
+def data(listings):
+    return clean(listings)
+
+
+def test_values_survive(data):
+    optimized, report = optimize_dtypes(data)
+    assert report.bytes_after < report.bytes_before
+    for column in data.columns:
+        if pd.api.types.is_numeric_dtype(data[column]) and not pd.api.types.is_bool_dtype(data[column]):
+            np.testing.assert_allclose(optimized[column].to_numpy(dtype='float64', na_value=np.nan),
+                                       data[column].to_numpy(dtype='float64', na_value=np.nan),
+                                       rtol=1e-6)
+    assert optimized['rooms'].dtype == SCHEMA['rooms']
+    assert optimized['locality_name'].dtype == 'category'
+
+
+def test_integer_arithmetic_does_not_wrap(data):
+    optimized, _ = optimize_dtypes(data)
+    difference = optimized['floor'] - optimized['floors_total']
+    expected = data['floor'].astype('float64') - data['floors_total'].astype('float64')
+    assert (expected < 0).any()
+    np.testing.assert_array_equal(difference.to_numpy(dtype='float64', na_value=np.nan),
+                                  expected.to_numpy())
+
+
+def test_missing_values_use_nullable_integers():
+    frame = pd.DataFrame({'floors_total': [5.0, np.nan, 9.0]})
+    optimized, _ = optimize_dtypes(frame)
+    assert optimized['floors_total'].dtype == 'Int16'
+    assert optimized['floors_total'].isna().tolist() == [False, True, False]
+
+
+def test_overflow_raises():
+    frame = pd.DataFrame({'last_price': [5e6, 3e9], 'rooms': [2.5, 1.0]})
+    with pytest.raises(ValueError, match='last_price, rooms'):
+        optimize_dtypes(frame)
+    optimized, report = optimize_dtypes(frame, strict=False)
+    # Не поместившиеся столбцы остаются в исходном типе.
+    assert optimized['last_price'].dtype == 'float64'
+    assert report.columns.loc['rooms', 'dtype_after'] == 'float64'
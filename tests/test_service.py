@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+
+from real_estate.locality import LocalityNormalizer
+from real_estate import service
+from real_estate.service import LatencyStats, ValuationEngine, ValuationError, ValuationServer
+
+
+LISTING = {'locality_name': 'Санкт-Петербург', 'total_area': 50.0, 'rooms': 2,
+           'cityCenters_nearest': 12000.0, 'last_price': 5000000.0}
+
+
+@pytest.fixture(scope='module')
+def engine(listings):
+    return ValuationEngine.from_listings(listings)
+
+
+def serve(server, scenario):
+    """Выполняет ``scenario(post)`` при работающем цикле пакетов сервера."""
+    async def post(*bodies):
+        # Запросы отправляются одновременно и попадают в один пакет.
+        return await asyncio.gather(*(server.route('POST', '/valuate', body) for body in bodies))
+
+    async def run():
+        batcher = asyncio.create_task(server.batcher.run())
+        try:
+            return await scenario(post)
+        finally:
+            batcher.cancel()
+    return asyncio.run(run())
+
+
+def test_value(engine):
+    result, = engine.value([LISTING])
+    assert result['locality_name'] == 'Санкт-Петербург'
+    assert result['price'] > 0
+    assert result['price_ratio'] == pytest.approx(LISTING['last_price'] / result['price'], 1e-3)
+    assert 'price_ratio' not in engine.value([dict(LISTING, last_price=None)])[0]
+
+
+@pytest.mark.parametrize('listing', [
+    {'locality_name': 'Санкт-Петербург', 'rooms': 2},
+    dict(LISTING, total_area='много'),
+    dict(LISTING, rooms=[1, 2]),
+    dict(LISTING, cityCenters_nearest={'km': 12}),
+])
+def test_malformed_listing(engine, listing):
+    with pytest.raises(ValuationError):
+        engine.value([listing])
+
+
+def test_batched_requests(engine):
+    one = json.dumps(LISTING).encode('utf-8')
+    many = json.dumps([LISTING, dict(LISTING, rooms=3)]).encode('utf-8')
+    responses = serve(ValuationServer(engine), lambda post: post(one, many, b'{'))
+    assert [status for status, _ in responses] == [200, 200, 400]
+    # Запросы одного пакета оценены так же, как по отдельности.
+    assert responses[0][1] == engine.value([LISTING])[0]
+    assert responses[1][1] == engine.value([LISTING, dict(LISTING, rooms=3)])
+
+
+def test_bad_request_does_not_stop_batcher(engine):
+    good = json.dumps(LISTING).encode('utf-8')
+    bad = json.dumps([LISTING, dict(LISTING, rooms=[1, 2])]).encode('utf-8')
+    responses = serve(ValuationServer(engine), lambda post: post(good, bad, b'{', b'[1, 2]', good))
+    assert [status for status, _ in responses] == [200, 400, 400, 400, 200]
+    # Хороший запрос из того же пакета оценен так же, как отдельно.
+    assert responses[0][1] == responses[4][1] == engine.value([LISTING])[0]
+
+
+def test_handler_failure_is_internal_error(engine):
+    server = ValuationServer(engine)
+    good = json.dumps(LISTING).encode('utf-8')
+
+    def broken(listings):
+        raise RuntimeError('сбой')
+
+    async def scenario(post):
+        server.batcher.handler = broken
+        failed = await post(good, good)
+        server.batcher.handler = engine.value
+        return failed, await post(good)
+
+    failed, recovered = serve(server, scenario)
+    assert [status for status, _ in failed] == [500, 500]
+    assert [status for status, _ in recovered] == [200]
+
+
+def test_engine_uses_saved_locality_map(listings, monkeypatch):
+    saved = LocalityNormalizer(mapping={'Питер': 'Санкт-Петербург'})
+    monkeypatch.setattr(LocalityNormalizer, 'load_or_create', classmethod(lambda cls: saved))
+    engine = ValuationEngine.from_listings(listings)
+    result, = engine.value([dict(LISTING, locality_name='Питер')])
+    assert result['locality_name'] == 'Санкт-Петербург'
+
+
+def test_throughput_ignores_idle_time(monkeypatch):
+    clock = iter([100.0, 100.5, 101.0])
+    monkeypatch.setattr(service.time, 'perf_counter', lambda: next(clock))
+    stats = LatencyStats()
+    # Первый запрос начался в 99.9 и завершился в 100.0, последний -- в 101.0.
+    for _ in range(3):
+        stats.record(0.1)
+    # Простой после нагрузки не снижает пропускную способность.
+    assert stats.snapshot()['throughput_rps'] == round(3 / 1.1, 1)
+    assert LatencyStats().snapshot()['throughput_rps'] == 0.0
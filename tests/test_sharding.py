@@ -0,0 +1,37 @@
+import numpy as np
+
+from real_estate.cleaning import clean
+from real_estate.sharding import ShardedPriceModel
+
+
+def test_shards_round_trip(listings, tmp_path):
+    data = clean(listings)
+    data = data[data['locality_name'].isin(['Санкт-Петербург', 'Пушкин', 'Всеволожск'])]
+    # Всеволожск меньше порога и оценивается общей моделью.
+    model = ShardedPriceModel(min_shard_rows=150, workers=1).fit(data)
+    assert sorted(model.shards) == ['Пушкин', 'Санкт-Петербург']
+    loaded = ShardedPriceModel.load(model.save(str(tmp_path / 'shards')))
+    assert loaded.loaded == []
+    pushkin = data[data['locality_name'] == 'Пушкин']
+    np.testing.assert_allclose(loaded.predict(pushkin), model.predict(pushkin))
+    # Оценка объявлений одного пункта открывает только его шард.
+    assert loaded.loaded == ['Пушкин']
+    np.testing.assert_allclose(loaded.predict(data), model.predict(data))
+
+
+def test_small_localities_use_pooled_model(listings):
+    data = clean(listings)
+    model = ShardedPriceModel(min_shard_rows=len(data) + 1, workers=1).fit(data)
+    assert model.shards == {}
+    np.testing.assert_allclose(model.predict(data), model.pooled().predict(data))
+
+
+def test_locality_without_distances_gets_finite_shard(listings):
+    data = clean(listings)
+    data = data[data['locality_name'].isin(['Санкт-Петербург', 'поселок Мурино'])]
+    # В поселке нет ни одного расстояния: средние этих признаков в шарде -- NaN.
+    assert data.loc[data['locality_name'] == 'поселок Мурино', 'parks_nearest'].isna().all()
+    model = ShardedPriceModel(min_shard_rows=20, workers=1).fit(data)
+    assert sorted(model.shards) == ['Санкт-Петербург', 'поселок Мурино']
+    assert all(np.isfinite(model._vector(name)).all() for name in model.shards)
+    assert np.isfinite(model.predict(data)).all()
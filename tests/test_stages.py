@@ -0,0 +1,110 @@
+import functools
+import os
+import sys
+import types
+
+import pytest
+
+from real_estate import stages
+from real_estate.cleaning import fix_anomalies
+from real_estate.schema import optimize_dtypes
+from real_estate.stages import Pipeline, Stage, StageCache, _code_digest, _dependencies
+
+
+def read_text(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def repeat(text, times):
+    return text * times
+
+
+def upper(text):
+    return text.upper()
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    # Хэши источников запоминаются во временном каталоге, а не в общем кэше.
+    monkeypatch.setattr(stages, 'source_hash',
+                        functools.partial(stages.source_hash, cache_dir=str(tmp_path)))
+    path = tmp_path / 'source.txt'
+    path.write_text('ab', encoding='utf-8')
+    return Pipeline([
+        Stage('raw', read_text, params={'path': str(path)}, sources=('path',)),
+        Stage('repeated', repeat, ('raw',), params={'times': 2}),
+        Stage('result', upper, ('repeated',)),
+    ], StageCache(str(tmp_path / 'stages')))
+
+
+def computed(pipeline):
+    return [entry['stage'] for entry in pipeline.log if not entry['cached']]
+
+
+def test_rerun_is_cached(pipeline):
+    assert pipeline.run('result') == 'ABAB'
+    assert computed(pipeline) == ['raw', 'repeated', 'result']
+    assert pipeline.run('result') == 'ABAB'
+    assert computed(pipeline) == []
+    # Верхние стадии при попадании в кэш даже не загружаются.
+    assert [entry['stage'] for entry in pipeline.log] == ['result']
+
+
+def test_changed_parameter(pipeline):
+    pipeline.run('result')
+    changed = pipeline.with_params('repeated', times=3)
+    assert changed.run('result') == 'ABABAB'
+    assert computed(changed) == ['repeated', 'result']
+    assert pipeline.run('result') == 'ABAB'
+    assert computed(pipeline) == []
+
+
+def test_changed_source(pipeline):
+    pipeline.run('result')
+    path = pipeline.stages['raw'].params['path']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('xyz')
+    assert pipeline.run('result') == 'XYZXYZ'
+    assert computed(pipeline) == ['raw', 'repeated', 'result']
+
+
+def test_dependencies():
+    assert _dependencies(optimize_dtypes) == ['real_estate.instrument', 'real_estate.schema']
+    assert 'real_estate.imputation' in _dependencies(fix_anomalies)
+    assert 'real_estate.stages' not in _dependencies(stages.load_stage)
+
+
+def test_code_digest_follows_dependency_source(tmp_path, monkeypatch):
+    source = tmp_path / 'helper.py'
+    source.write_text('SCALE = 1\n', encoding='utf-8')
+    module = types.ModuleType('real_estate._helper')
+    module.__file__ = str(source)
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    namespace = {'helper': module}
+    exec('def scaled(value):\n    return value * helper.SCALE\n', namespace)
+    scaled = namespace['scaled']
+    assert _dependencies(scaled) == ['real_estate._helper']
+    before = _code_digest(scaled)
+    assert _code_digest(scaled) == before
+    source.write_text('SCALE = 2\n', encoding='utf-8')
+    assert _code_digest(scaled) != before
+
+
+def test_cache_eviction_respects_max_bytes(tmp_path):
+    cache = StageCache(str(tmp_path / 'stages'), max_bytes=10 ** 9)
+    for number, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, b'x' * 1000)
+        os.utime(cache._path(key), ns=(number * 10 ** 9, number * 10 ** 9))
+    entry_size = cache.size() // 3
+    # Чтение обновляет время обращения: самой давней записью становится 'b'.
+    cache.get('a')
+    cache.max_bytes = 2 * entry_size
+    cache.put('d', b'x' * 1000)
+    assert 'b' not in cache and 'c' not in cache
+    assert 'a' in cache and 'd' in cache
+    assert cache.size() <= cache.max_bytes
+    # Новая запись остается, даже если одна не помещается в кэш.
+    cache.max_bytes = 1
+    cache.put('e', b'x' * 1000)
+    assert [key for _, _, key in cache.entries()] == ['e']
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from real_estate.cleaning import clean
+from real_estate.schema import optimize_dtypes
+from real_estate.store import ListingStore
+
+
+@pytest.fixture(scope='module')
+def data(listings):
+    data, _ = optimize_dtypes(clean(listings))
+    return data
+
+
+@pytest.fixture(scope='module')
+def store(data, tmp_path_factory):
+    # Санкт-Петербург и Мурино -- свои партиции, остальные -- общие партиции года.
+    return ListingStore.write(data, str(tmp_path_factory.mktemp('store') / 'listings'),
+                              min_partition_rows=200)
+
+
+def test_round_trip(data, store):
+    localities = {partition['locality'] for partition in store.manifest['partitions']}
+    assert localities == {'Санкт-Петербург', 'поселок Мурино', None}
+    loaded = store.read().sort_index()[list(data.columns)]
+    pd.testing.assert_frame_equal(loaded, data.sort_index())
+
+
+def test_read_small_locality_from_shared_partition(data, store):
+    pushkin = store.read(['last_price', 'year'], locality='Пушкин').sort_index()
+    expected = data.loc[data['locality_name'] == 'Пушкин', ['last_price', 'year']].sort_index()
+    pd.testing.assert_frame_equal(pushkin, expected)
+
+
+def test_where_and_pruning(data, store):
+    where = [('last_price', '<', 5_000_000)]
+    result = store.read(['last_price'], year=(">=", 2018), where=where).sort_index()
+    expected = data.loc[(data['year'] >= 2018) & (data['last_price'] < 5_000_000),
+                        ['last_price']].sort_index()
+    pd.testing.assert_frame_equal(result, expected)
+
+    plan = store.explain(locality='Пушкин', year=2017)
+    # Одна общая партиция 2017 года и в ней -- только строки Пушкина.
+    assert plan['partitions'] == 1 < plan['partitions_total']
+    assert plan['rows'] == ((data['locality_name'] == 'Пушкин') & (data['year'] == 2017)).sum()
+    # Цена выше максимума всех партиций -- читать нечего.
+    assert store.explain(where=[('last_price', '>', 1e12)])['partitions'] == 0